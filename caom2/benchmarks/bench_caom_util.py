@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Benchmarks of the typed collections of caom_util """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from caom2 import caom_util
+from caom2 import chunk
+from caom2 import plane
+from caom2 import wcs
+
+N = 1000
+
+
+class TypedCollections(object):
+
+    def setup(self):
+        self.chunks = [chunk.Chunk() for _ in range(N)]
+        self.planes = [plane.Plane('productID{}'.format(i)) for i in range(N)]
+        self.uris = [plane.PlaneURI('caom:foo/bar/plane{}'.format(i))
+                     for i in range(N)]
+        self.chunk_list = caom_util.TypedList(chunk.Chunk, *self.chunks)
+        self.plane_dict = caom_util.TypedOrderedDict(
+            plane.Plane, *[(p.product_id, p) for p in self.planes])
+
+    def time_typed_list_append(self):
+        chunks = caom_util.TypedList(chunk.Chunk, )
+        for c in self.chunks:
+            chunks.append(c)
+
+    def time_typed_list_extend(self):
+        caom_util.TypedList(chunk.Chunk, ).extend(self.chunks)
+
+    def time_typed_list_iterate(self):
+        for _ in self.chunk_list:
+            pass
+
+    def time_typed_list_getitem(self):
+        chunks = self.chunk_list
+        for i in range(N):
+            chunks[i]
+
+    def time_typed_ordered_dict_add(self):
+        planes = caom_util.TypedOrderedDict(plane.Plane, )
+        for p in self.planes:
+            planes.add(p)
+
+    def time_typed_ordered_dict_iterate(self):
+        for _ in self.plane_dict.values():
+            pass
+
+    def time_typed_ordered_dict_lookup(self):
+        planes = self.plane_dict
+        for p in self.planes:
+            planes[p.product_id]
+
+    def time_typed_set_add(self):
+        uris = caom_util.TypedSet(plane.PlaneURI, )
+        for uri in self.uris:
+            uris.add(uri)
+
+    def time_coord_bounds1d_samples(self):
+        bounds = wcs.CoordBounds1D()
+        for i in range(N):
+            bounds.samples.append(wcs.CoordRange1D(wcs.RefCoord(0.5, i * 1.0),
+                                                   wcs.RefCoord(1.5, i + 1.0)))
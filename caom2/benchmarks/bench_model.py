@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Benchmarks of the model classes: construction, setters and equality """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from datetime import datetime
+
+from caom2 import chunk
+from caom2 import plane
+from caom2 import wcs
+
+from . import SIZES, get_observation
+
+N = 1000
+
+
+class Setters(object):
+
+    def setup(self):
+        self.chunk = chunk.Chunk()
+        self.plane = plane.Plane('productID')
+        self.date = datetime(2012, 7, 11, 13, 26, 37)
+
+    def time_chunk_setters(self):
+        c = self.chunk
+        for _ in range(N):
+            c.naxis = 5
+            c.observable_axis = 1
+            c.position_axis_1 = 1
+            c.position_axis_2 = 2
+            c.energy_axis = 3
+            c.time_axis = 4
+            c.polarization_axis = 5
+            c.product_type = chunk.ProductType.SCIENCE
+
+    def time_plane_setters(self):
+        p = self.plane
+        for _ in range(N):
+            p.meta_release = self.date
+            p.data_release = self.date
+            p.data_product_type = plane.DataProductType.IMAGE
+            p.calibration_level = plane.CalibrationLevel.PRODUCT
+
+    def time_ref_coord(self):
+        for i in range(N):
+            wcs.RefCoord(0.5, 1.0 * i)
+
+    def time_generate(self):
+        get_observation('small')
+
+
+class Equality(object):
+
+    params = sorted(SIZES)
+    param_names = ('size',)
+
+    def setup(self, size):
+        self.obs = get_observation(size)
+        # generated again from the same seed
+        self.same = get_observation(size)
+        self.other = get_observation(size)
+        self.other.observation_id = 'other'
+
+    def time_eq_same(self, size):
+        assert self.obs == self.same
+
+    def time_eq_different(self, size):
+        assert not self.obs == self.other
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+"""
+Minimal runner of the asv benchmarks for environments without asv, and
+comparison of two result files that fails on regressions:
+
+    python -m benchmarks.run run --output before.json
+    ... change the code ...
+    python -m benchmarks.run run --output after.json
+    python -m benchmarks.run compare before.json after.json --factor 1.1
+
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import importlib
+import inspect
+import itertools
+import json
+import os
+import pkgutil
+import re
+import sys
+import timeit
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+MIN_RUN_TIME = 0.2
+REPEAT = 5
+
+
+def discover():
+    """
+    :return: generator of (name, class, method name) of the time_ and track_
+    benchmarks, named <module>.<class>.<method>
+    """
+    for _, module_name, _ in pkgutil.iter_modules([THIS_DIR]):
+        if not module_name.startswith('bench_'):
+            continue
+        module = importlib.import_module(
+            '{}.{}'.format(__package__, module_name))
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for method in sorted(vars(cls)):
+                if not method.startswith(('time_', 'track_')):
+                    continue
+                yield '{}.{}.{}'.format(module_name, class_name, method), cls, method
+
+
+def _params(cls):
+    params = getattr(cls, 'params', None)
+    if params is None:
+        return [()]
+    if not isinstance(params, tuple):
+        # a single parameter
+        params = (params,)
+    return list(itertools.product(*params))
+
+
+def measure(cls, method, params):
+    """
+    :return: the best time of a call in seconds, or the value of a track_
+    benchmark
+    """
+    instance = cls()
+    if hasattr(instance, 'setup'):
+        instance.setup(*params)
+    try:
+        function = getattr(instance, method)
+        if method.startswith('track_'):
+            return function(*params)
+        timer = timeit.Timer(lambda: function(*params))
+        number = 1
+        while timer.timeit(number) < MIN_RUN_TIME and number < 10 ** 6:
+            number *= 10
+        return min(timer.repeat(REPEAT, number)) / number
+    finally:
+        if hasattr(instance, 'teardown'):
+            instance.teardown(*params)
+
+
+def run(pattern=None):
+    """
+    :param pattern: regular expression the benchmark names with parameters,
+    e.g. bench_obs_reader_writer.ReaderWriter.time_read(small), must match
+    :return: dictionary of benchmark name with parameters to result
+    """
+    results = {}
+    for name, cls, method in discover():
+        for params in _params(cls):
+            key = name
+            if params:
+                key += '({})'.format(', '.join(str(p) for p in params))
+            if pattern is not None and not re.search(pattern, key):
+                continue
+            results[key] = measure(cls, method, params)
+            print('{:<70} {:.6g}'.format(key, results[key]))
+    return results
+
+
+def compare(baseline, results, factor):
+    """
+    :param factor: ratio of the times above which a benchmark regressed
+    :return: (lines of the report, names of the regressed benchmarks)
+    """
+    lines = []
+    regressed = []
+    for key in sorted(set(baseline) & set(results)):
+        if '.time_' not in key or not baseline[key]:
+            continue
+        ratio = results[key] / baseline[key]
+        flag = ''
+        if ratio > factor:
+            flag = ' REGRESSION'
+            regressed.append(key)
+        elif ratio < 1 / factor:
+            flag = ' improved'
+        lines.append('{:<70} {:.6g} -> {:.6g} ({:.2f}x){}'.format(
+            key, baseline[key], results[key], ratio, flag))
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Runs and compares the caom2 benchmarks')
+    subparsers = parser.add_subparsers(dest='cmd')
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--bench', help='regular expression of the '
+                                            'benchmarks to run')
+    run_parser.add_argument('--output', help='results file')
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare two results files and fail on regressions')
+    compare_parser.add_argument('baseline', help='results before the change')
+    compare_parser.add_argument('results', help='results after the change')
+    compare_parser.add_argument('--factor', type=float, default=1.1,
+                                help='slowdown ratio considered a regression')
+    args = parser.parse_args()
+
+    if args.cmd == 'run':
+        results = run(args.bench)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.results) as f:
+            results = json.load(f)
+        lines, regressed = compare(baseline, results, args.factor)
+        print('\n'.join(lines))
+        if regressed:
+            print('{} benchmarks regressed by more than {}x'.format(
+                len(regressed), args.factor))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
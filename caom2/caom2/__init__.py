@@ -91,4 +91,12 @@ if not _ASTROPY_SETUP_:
     from artifact import *
     from plane import *
     from observation import *
-    from obs_reader_writer import *
+
+    # the XML and JSON codecs and the store are imported the first time they
+    # are used
+    caom_util.lazy_package(__name__, {
+        'obs_reader_writer': ['ObservationReader', 'ObservationWriter',
+                              'ObservationParsingException'],
+        'obs_json': ['ObservationJsonReader', 'ObservationJsonWriter',
+                     'ObservationJsonParsingException'],
+        'obs_store': ['ObservationStore']})
@@ -80,8 +80,10 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import collections
+import importlib
 import struct
 import sys
+import types
 import uuid
 from datetime import datetime
 
@@ -389,3 +391,76 @@ class ClassProperty(property):
     """ """
     def __get__(self, cls, owner):
         return self.fget.__get__(None, owner)()
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a package that imports its submodules the first time one
+    of the names they export is accessed, so that importing the package
+    does not import the dependencies of all its submodules.
+    """
+
+    def __init__(self, package, submodules):
+        """
+        Arguments:
+        package : the package module to stand in for
+        submodules : dictionary of submodule name to the names it exports
+        """
+        super(LazyModule, self).__init__(package.__name__, package.__doc__)
+        self.__dict__.update(package.__dict__)
+        # keeps the globals of the functions of the package alive
+        self.__dict__['_package'] = package
+        self.__dict__['_exports'] = dict(
+            (name, submodule) for submodule, names in submodules.items()
+            for name in names)
+        self.__dict__['_submodules'] = set(submodules)
+        if '__all__' not in self.__dict__:
+            self.__dict__['__all__'] = sorted(
+                str(name) for name in
+                set(package.__dict__) | set(self._exports)
+                if not name.startswith('_'))
+
+    def __getattr__(self, name):
+        if name in self._submodules:
+            return importlib.import_module(
+                str('{}.{}'.format(self.__name__, name)))
+        if name not in self._exports:
+            raise AttributeError("module '{}' has no attribute '{}'".format(
+                self.__name__, name))
+        value = getattr(getattr(self, self._exports[name]), name)
+        setattr(self, name, value)
+        return value
+
+
+def lazy_package(name, submodules):
+    """
+    Replaces a package being imported with a LazyModule. Called at the end
+    of the __init__ module of the package:
+
+        lazy_package(__name__, {'obs_reader_writer': ['ObservationReader']})
+
+    Arguments:
+    name : name of the package
+    submodules : dictionary of submodule name to the names it exports
+    """
+    sys.modules[name] = LazyModule(sys.modules[name], submodules)
+
+
+class LazyImport(types.ModuleType):
+    """
+    Stand-in for a module that is only imported the first time one of its
+    attributes is accessed:
+
+        obs_reader_writer = LazyImport('caom2.obs_reader_writer')
+    """
+
+    def __init__(self, name):
+        super(LazyImport, self).__init__(str(name))
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            # e.g. __file__ looked up by inspect or doctest
+            raise AttributeError(name)
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
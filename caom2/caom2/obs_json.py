@@ -0,0 +1,1093 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Defines ObservationJsonReader and ObservationJsonWriter, a compact JSON
+codec of the CAOM-2.2 model.
+
+Schema (version 1.0)
+--------------------
+An observation is a JSON object. Object keys follow the element names of the
+CAOM-2.2 XML schema and the JSON of a model object only holds its non-null
+attributes, so a missing key stands for None or an empty collection.
+
+- entities (observation, plane, artifact, part, chunk) carry their UUID in
+  ``@id`` and their last modification date in ``@lastModified``
+- the observation carries ``@schemaVersion`` (``"1.0"``) and ``@type``
+  (``"SimpleObservation"`` or ``"CompositeObservation"``)
+- dates are IVOA strings (``yyyy-MM-ddTHH:mm:ss.SSS``), enumerations their
+  value and keywords arrays of strings
+- planes, artifacts, parts, chunks, members and provenance inputs are arrays,
+  in model order. Members and inputs are arrays of URIs
+- Point, RefCoord, ValueCoord2D, Dimension2D and CoordError are
+  ``[cval1, cval2]``, ``[pix, val]``, ``[coord1, coord2]``,
+  ``[naxis1, naxis2]`` and ``[syser, rnder]``. Coord2D, CoordRange1D and
+  CoordRange2D are the pairs of their two members
+- CoordBounds2D is ``{"circle": {"center": ..., "radius": ...}}`` or
+  ``{"polygon": {"vertices": [...]}}``
+
+For example::
+
+    {"@id":"00000000-0000-0000-2c5e-9b4f1e9e4f13",
+     "@lastModified":"2016-11-30T12:00:00.000","@schemaVersion":"1.0",
+     "@type":"SimpleObservation","algorithm":{"name":"exposure"},
+     "collection":"TEST","observationID":"obs1",
+     "planes":[{"@id":"...","productID":"p1","artifacts":[...]}]}
+
+The order of the keys is not significant. Writers put ``planes`` and
+``artifacts`` last so readers can handle the other keys first.
+New optional keys may be added to 1.x versions of the schema, any other
+change bumps its major version.
+
+The writer encodes an observation one plane and one artifact at a time. The
+reader loads the whole document but builds each plane as soon as it is
+decoded, so the decoded JSON of only one plane is in memory at a time.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import re
+import uuid
+
+from . import artifact
+from . import caom_util
+from . import chunk
+from . import observation
+from . import part
+from . import plane
+from . import shape
+from . import wcs
+
+SCHEMA_VERSION = '1.0'
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+__all__ = ['ObservationJsonReader', 'ObservationJsonWriter',
+           'ObservationJsonParsingException']
+
+
+def _put(fields, key, value):
+    """Adds value to fields unless it is None or an empty list"""
+    if value is not None and value != []:
+        fields[key] = value
+
+
+def _enum_value(value):
+    if value is None:
+        return None
+    return value.value
+
+
+def _int(value):
+    if value is None:
+        return None
+    return int(value)
+
+
+def _long(value):
+    if value is None:
+        return None
+    return long(value)
+
+
+def _float(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+class ObservationJsonWriter(object):
+    """Writes observations as compact JSON documents"""
+
+    def __init__(self):
+        # sort_keys would disable the C encoder
+        self._encoder = json.JSONEncoder(separators=(str(','), str(':')))
+
+    def write(self, obs, out):
+        """Write the JSON document of an observation.
+
+        Arguments:
+        obs : the Observation to write
+        out : file-like object the document is written to
+        """
+        for text in self.iterencode(obs):
+            out.write(text)
+
+    def iterencode(self, obs):
+        """Encode an observation a plane and an artifact at a time.
+
+        Arguments:
+        obs : the Observation to encode
+        return : an iterator of the strings making up the JSON document
+        """
+        assert isinstance(obs, observation.Observation), (
+            "observation is not an Observation")
+
+        return self._iterencode(
+            self._get_observation(obs), 'planes',
+            [self._iterencode_plane(_plane)
+             for _plane in obs.planes.itervalues()])
+
+    def _iterencode(self, fields, name, children):
+        head = self._encoder.encode(fields)
+        if not children:
+            yield head
+            return
+
+        yield head[:-1]
+        if fields:
+            yield b','
+        yield self._encoder.encode(name) + b':['
+        for index, child in enumerate(children):
+            if index:
+                yield b','
+            for text in child:
+                yield text
+        yield b']}'
+
+    def _iterencode_plane(self, _plane):
+        return self._iterencode(
+            self._get_plane(_plane), 'artifacts',
+            [self._iterencode_artifact(_artifact)
+             for _artifact in _plane.artifacts.itervalues()])
+
+    def _iterencode_artifact(self, _artifact):
+        yield self._encoder.encode(self._get_artifact(_artifact))
+
+    def _get_entity(self, entity):
+        fields = {'@id': str(entity._id)}
+        _put(fields, '@lastModified',
+             caom_util.date2ivoa(entity._last_modified))
+        return fields
+
+    def _get_observation(self, obs):
+        fields = self._get_entity(obs)
+        fields['@schemaVersion'] = SCHEMA_VERSION
+        if isinstance(obs, observation.CompositeObservation):
+            fields['@type'] = 'CompositeObservation'
+            _put(fields, 'members', [member.uri for member in obs.members])
+        else:
+            fields['@type'] = 'SimpleObservation'
+        fields['collection'] = obs.collection
+        fields['observationID'] = obs.observation_id
+        _put(fields, 'metaRelease', caom_util.date2ivoa(obs.meta_release))
+        _put(fields, 'sequenceNumber', obs.sequence_number)
+        _put(fields, 'algorithm', self._get_algorithm(obs.algorithm))
+        _put(fields, 'type', obs.obs_type)
+        _put(fields, 'intent', _enum_value(obs.intent))
+        _put(fields, 'proposal', self._get_proposal(obs.proposal))
+        _put(fields, 'target', self._get_target(obs.target))
+        _put(fields, 'targetPosition',
+             self._get_target_position(obs.target_position))
+        _put(fields, 'requirements',
+             self._get_requirements(obs.requirements))
+        _put(fields, 'telescope', self._get_telescope(obs.telescope))
+        _put(fields, 'instrument', self._get_instrument(obs.instrument))
+        _put(fields, 'environment', self._get_environment(obs.environment))
+        return fields
+
+    def _get_algorithm(self, algorithm):
+        if algorithm is None:
+            return None
+        return {'name': algorithm.name}
+
+    def _get_proposal(self, proposal):
+        if proposal is None:
+            return None
+        fields = {'id': proposal.proposal_id}
+        _put(fields, 'pi', proposal.pi_name)
+        _put(fields, 'project', proposal.project)
+        _put(fields, 'title', proposal.title)
+        _put(fields, 'keywords', list(proposal.keywords))
+        return fields
+
+    def _get_target(self, target):
+        if target is None:
+            return None
+        fields = {'name': target.name}
+        _put(fields, 'type', _enum_value(target.target_type))
+        _put(fields, 'standard', target.standard)
+        _put(fields, 'redshift', target.redshift)
+        _put(fields, 'moving', target.moving)
+        _put(fields, 'keywords', list(target.keywords))
+        return fields
+
+    def _get_target_position(self, target_position):
+        if target_position is None:
+            return None
+        fields = {'coordsys': target_position.coordsys,
+                  'coordinates': self._get_point(target_position.coordinates)}
+        _put(fields, 'equinox', target_position.equinox)
+        return fields
+
+    def _get_requirements(self, requirements):
+        if requirements is None:
+            return None
+        return {'flag': requirements.flag.value}
+
+    def _get_telescope(self, telescope):
+        if telescope is None:
+            return None
+        fields = {'name': telescope.name}
+        _put(fields, 'geoLocationX', telescope.geo_location_x)
+        _put(fields, 'geoLocationY', telescope.geo_location_y)
+        _put(fields, 'geoLocationZ', telescope.geo_location_z)
+        _put(fields, 'keywords', list(telescope.keywords))
+        return fields
+
+    def _get_instrument(self, instrument):
+        if instrument is None:
+            return None
+        fields = {'name': instrument.name}
+        _put(fields, 'keywords', list(instrument.keywords))
+        return fields
+
+    def _get_environment(self, environment):
+        if environment is None:
+            return None
+        fields = {}
+        _put(fields, 'seeing', environment.seeing)
+        _put(fields, 'humidity', environment.humidity)
+        _put(fields, 'elevation', environment.elevation)
+        _put(fields, 'tau', environment.tau)
+        _put(fields, 'wavelengthTau', environment.wavelength_tau)
+        _put(fields, 'ambientTemp', environment.ambient_temp)
+        _put(fields, 'photometric', environment.photometric)
+        return fields
+
+    def _get_plane(self, _plane):
+        fields = self._get_entity(_plane)
+        fields['productID'] = _plane.product_id
+        _put(fields, 'metaRelease', caom_util.date2ivoa(_plane.meta_release))
+        _put(fields, 'dataRelease', caom_util.date2ivoa(_plane.data_release))
+        _put(fields, 'dataProductType',
+             _enum_value(_plane.data_product_type))
+        _put(fields, 'calibrationLevel',
+             _enum_value(_plane.calibration_level))
+        _put(fields, 'provenance', self._get_provenance(_plane.provenance))
+        _put(fields, 'metrics', self._get_metrics(_plane.metrics))
+        _put(fields, 'quality', self._get_quality(_plane.quality))
+        return fields
+
+    def _get_provenance(self, provenance):
+        if provenance is None:
+            return None
+        fields = {'name': provenance.name}
+        _put(fields, 'version', provenance.version)
+        _put(fields, 'project', provenance.project)
+        _put(fields, 'producer', provenance.producer)
+        _put(fields, 'runID', provenance.run_id)
+        _put(fields, 'reference', provenance.reference)
+        _put(fields, 'lastExecuted',
+             caom_util.date2ivoa(provenance.last_executed))
+        _put(fields, 'keywords', list(provenance.keywords))
+        _put(fields, 'inputs',
+             [plane_uri.uri for plane_uri in provenance.inputs])
+        return fields
+
+    def _get_metrics(self, metrics):
+        if metrics is None:
+            return None
+        fields = {}
+        _put(fields, 'sourceNumberDensity', metrics.source_number_density)
+        _put(fields, 'background', metrics.background)
+        _put(fields, 'backgroundStddev', metrics.background_std_dev)
+        _put(fields, 'fluxDensityLimit', metrics.flux_density_limit)
+        _put(fields, 'magLimit', metrics.mag_limit)
+        return fields
+
+    def _get_quality(self, quality):
+        if quality is None:
+            return None
+        return {'flag': quality.flag.value}
+
+    def _get_artifact(self, _artifact):
+        fields = self._get_entity(_artifact)
+        fields['uri'] = _artifact.uri
+        fields['productType'] = _artifact.product_type.value
+        fields['releaseType'] = _artifact.release_type.value
+        _put(fields, 'contentType', _artifact.content_type)
+        _put(fields, 'contentLength', _artifact.content_length)
+        _put(fields, 'parts', [self._get_part(_part)
+                               for _part in _artifact.parts.itervalues()])
+        return fields
+
+    def _get_part(self, _part):
+        fields = self._get_entity(_part)
+        fields['name'] = _part.name
+        _put(fields, 'productType', _enum_value(_part.product_type))
+        _put(fields, 'chunks', [self._get_chunk(_chunk)
+                                for _chunk in _part.chunks])
+        return fields
+
+    def _get_chunk(self, _chunk):
+        fields = self._get_entity(_chunk)
+        _put(fields, 'productType', _enum_value(_chunk.product_type))
+        _put(fields, 'naxis', _chunk.naxis)
+        _put(fields, 'observableAxis', _chunk.observable_axis)
+        _put(fields, 'positionAxis1', _chunk.position_axis_1)
+        _put(fields, 'positionAxis2', _chunk.position_axis_2)
+        _put(fields, 'energyAxis', _chunk.energy_axis)
+        _put(fields, 'timeAxis', _chunk.time_axis)
+        _put(fields, 'polarizationAxis', _chunk.polarization_axis)
+        _put(fields, 'observable', self._get_observable_axis(_chunk.observable))
+        _put(fields, 'position', self._get_spatial_wcs(_chunk.position))
+        _put(fields, 'energy', self._get_spectral_wcs(_chunk.energy))
+        _put(fields, 'time', self._get_temporal_wcs(_chunk.time))
+        _put(fields, 'polarization',
+             self._get_polarization_wcs(_chunk.polarization))
+        return fields
+
+    def _get_observable_axis(self, observable):
+        if observable is None:
+            return None
+        fields = {'dependent': self._get_slice(observable.dependent)}
+        _put(fields, 'independent', self._get_slice(observable.independent))
+        return fields
+
+    def _get_spatial_wcs(self, position):
+        if position is None:
+            return None
+        fields = {}
+        _put(fields, 'axis', self._get_coord_axis2d(position.axis))
+        _put(fields, 'coordsys', position.coordsys)
+        _put(fields, 'equinox', position.equinox)
+        _put(fields, 'resolution', position.resolution)
+        return fields
+
+    def _get_spectral_wcs(self, energy):
+        if energy is None:
+            return None
+        fields = {'axis': self._get_coord_axis1d(energy.axis),
+                  'specsys': energy.specsys}
+        _put(fields, 'ssysobs', energy.ssysobs)
+        _put(fields, 'ssyssrc', energy.ssyssrc)
+        _put(fields, 'restfrq', energy.restfrq)
+        _put(fields, 'restwav', energy.restwav)
+        _put(fields, 'velosys', energy.velosys)
+        _put(fields, 'zsource', energy.zsource)
+        _put(fields, 'velang', energy.velang)
+        _put(fields, 'bandpassName', energy.bandpass_name)
+        _put(fields, 'resolvingPower', energy.resolving_power)
+        if energy.transition is not None:
+            fields['transition'] = {
+                'species': energy.transition.species,
+                'transition': energy.transition.transition}
+        return fields
+
+    def _get_temporal_wcs(self, time):
+        if time is None:
+            return None
+        fields = {'axis': self._get_coord_axis1d(time.axis)}
+        _put(fields, 'timesys', time.timesys)
+        _put(fields, 'trefpos', time.trefpos)
+        _put(fields, 'mjdref', time.mjdref)
+        _put(fields, 'exposure', time.exposure)
+        _put(fields, 'resolution', time.resolution)
+        return fields
+
+    def _get_polarization_wcs(self, polarization):
+        if polarization is None:
+            return None
+        fields = {}
+        _put(fields, 'axis', self._get_coord_axis1d(polarization.axis))
+        return fields
+
+    # /*+ CAOM2 Types #-*/
+
+    def _get_point(self, point):
+        return [point.cval1, point.cval2]
+
+    # /*+ WCS Types #-*/
+
+    def _get_axis(self, axis):
+        if axis is None:
+            return None
+        fields = {'ctype': axis.ctype}
+        if axis.cunit:
+            fields['cunit'] = axis.cunit
+        return fields
+
+    def _get_slice(self, _slice):
+        if _slice is None:
+            return None
+        return {'axis': self._get_axis(_slice.axis), 'bin': _slice.bin}
+
+    def _get_coord_axis1d(self, axis):
+        if axis is None:
+            return None
+        fields = {'axis': self._get_axis(axis.axis)}
+        _put(fields, 'error', self._get_coord_error(axis.error))
+        _put(fields, 'range', self._get_coord_range1d(axis.range))
+        if axis.bounds is not None:
+            fields['bounds'] = {}
+            _put(fields['bounds'], 'samples',
+                 [self._get_coord_range1d(sample)
+                  for sample in axis.bounds.samples])
+        _put(fields, 'function', self._get_coord_function1d(axis.function))
+        return fields
+
+    def _get_coord_axis2d(self, axis):
+        if axis is None:
+            return None
+        fields = {'axis1': self._get_axis(axis.axis1),
+                  'axis2': self._get_axis(axis.axis2)}
+        _put(fields, 'error1', self._get_coord_error(axis.error1))
+        _put(fields, 'error2', self._get_coord_error(axis.error2))
+        _put(fields, 'range', self._get_coord_range2d(axis.range))
+        _put(fields, 'bounds', self._get_coord_bounds2d(axis.bounds))
+        _put(fields, 'function', self._get_coord_function2d(axis.function))
+        return fields
+
+    def _get_coord_bounds2d(self, bounds):
+        if bounds is None:
+            return None
+        if isinstance(bounds, wcs.CoordCircle2D):
+            return {'circle': {
+                'center': self._get_value_coord2d(bounds.center),
+                'radius': bounds.radius}}
+        elif isinstance(bounds, wcs.CoordPolygon2D):
+            polygon = {}
+            _put(polygon, 'vertices', [self._get_value_coord2d(vertex)
+                                       for vertex in bounds.vertices])
+            return {'polygon': polygon}
+        else:
+            raise TypeError("BUG: unsupported CoordBounds2D type "
+                            + bounds.__class__.__name__)
+
+    def _get_coord_error(self, error):
+        if error is None:
+            return None
+        return [error.syser, error.rnder]
+
+    def _get_coord_function1d(self, function):
+        if function is None:
+            return None
+        return {'naxis': function.naxis,
+                'delta': function.delta,
+                'refCoord': self._get_ref_coord(function.ref_coord)}
+
+    def _get_coord_function2d(self, function):
+        if function is None:
+            return None
+        return {'dimension': [function.dimension.naxis1,
+                              function.dimension.naxis2],
+                'refCoord': self._get_coord2d(function.ref_coord),
+                'cd11': function.cd11,
+                'cd12': function.cd12,
+                'cd21': function.cd21,
+                'cd22': function.cd22}
+
+    def _get_coord_range1d(self, _range):
+        if _range is None:
+            return None
+        return [self._get_ref_coord(_range.start),
+                self._get_ref_coord(_range.end)]
+
+    def _get_coord_range2d(self, _range):
+        if _range is None:
+            return None
+        return [self._get_coord2d(_range.start),
+                self._get_coord2d(_range.end)]
+
+    def _get_coord2d(self, coord):
+        return [self._get_ref_coord(coord.coord1),
+                self._get_ref_coord(coord.coord2)]
+
+    def _get_value_coord2d(self, coord):
+        return [coord.coord1, coord.coord2]
+
+    def _get_ref_coord(self, ref_coord):
+        return [ref_coord.pix, ref_coord.val]
+
+
+class ObservationJsonReader(object):
+    """Reads observations from JSON documents"""
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+
+    def read(self, source):
+        """Build an Observation object from a JSON document located in
+        source.
+
+        Arguments:
+        source : file name/path, file object or file-like object of the
+                 JSON document
+        return : an Observation object
+        raise : ObservationJsonParsingException
+        """
+        if hasattr(source, 'read'):
+            text = source.read()
+        else:
+            with open(source, 'rb') as f:
+                text = f.read()
+
+        try:
+            text = text.decode('utf-8') if isinstance(text, bytes) else text
+            fields, planes = self._decode(text)
+            schema_version = self._get_required('@schemaVersion', fields,
+                                                'observation')
+            if schema_version.split('.')[0] != SCHEMA_VERSION.split('.')[0]:
+                raise ObservationJsonParsingException(
+                    "unsupported schema version {}".format(schema_version))
+            return self._get_observation(fields, planes)
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            # invalid UTF-8, UUIDs, dates and enumeration values, and values of the wrong
+            # JSON type
+            raise ObservationJsonParsingException(
+                "invalid observation: {}: {}".format(type(e).__name__, e))
+
+    def _decode(self, text):
+        """Decode the observation object of a document, building its planes
+        one at a time.
+
+        Arguments:
+        text : the JSON document
+        return : the fields of the observation but the planes, and the
+                 planes
+        raise : ObservationJsonParsingException
+        """
+        fields = {}
+        planes = []
+        index = self._expect(text, 0, '{')
+        if text[index:index + 1] == '}':
+            index += 1
+        else:
+            while True:
+                key, index = self._decode_value(text, index)
+                index = self._expect(text, index, ':')
+                if key == 'planes':
+                    if text[index:index + 1] != '[':
+                        raise ObservationJsonParsingException(
+                            "planes is not an array at {}".format(index))
+                    index = _WHITESPACE.match(text, index + 1).end()
+                    if text[index:index + 1] == ']':
+                        index += 1
+                    else:
+                        while True:
+                            value, index = self._decode_value(text, index)
+                            planes.append(self._get_plane(value))
+                            index, separator = self._separator(text, index, ']')
+                            if separator == ']':
+                                break
+                else:
+                    fields[key], index = self._decode_value(text, index)
+                index, separator = self._separator(text, index, '}')
+                if separator == '}':
+                    break
+        if _WHITESPACE.match(text, index).end() != len(text):
+            raise ObservationJsonParsingException(
+                "extra data after the observation at {}".format(index))
+        return fields, planes
+
+    def _decode_value(self, text, index):
+        index = _WHITESPACE.match(text, index).end()
+        try:
+            return self._decoder.raw_decode(text, index)
+        except ValueError as e:
+            raise ObservationJsonParsingException(
+                "invalid JSON value at {}: {}".format(index, e))
+
+    def _expect(self, text, index, expected):
+        index = _WHITESPACE.match(text, index).end()
+        if text[index:index + 1] != expected:
+            raise ObservationJsonParsingException(
+                "expected '{}' at {}".format(expected, index))
+        return _WHITESPACE.match(text, index + 1).end()
+
+    def _separator(self, text, index, end):
+        index = _WHITESPACE.match(text, index).end()
+        separator = text[index:index + 1]
+        if separator not in (',', end):
+            raise ObservationJsonParsingException(
+                "expected ',' or '{}' at {}".format(end, index))
+        return index + 1, separator
+
+    def _get_required(self, key, fields, name):
+        value = fields.get(key)
+        if value is None:
+            raise ObservationJsonParsingException(
+                "{} not found in {}".format(key, name))
+        return value
+
+    def _set_entity_attributes(self, fields, entity):
+        entity._id = uuid.UUID(
+            self._get_required('@id', fields, entity.__class__.__name__))
+        last_modified = fields.get('@lastModified')
+        if last_modified is not None:
+            entity._last_modified = caom_util.str2ivoa(last_modified)
+
+    def _get_observation(self, fields, planes):
+        collection = self._get_required('collection', fields, 'observation')
+        observation_id = self._get_required('observationID', fields,
+                                            'observation')
+        obs_type = self._get_required('@type', fields, 'observation')
+        if obs_type == 'SimpleObservation':
+            obs = observation.SimpleObservation(collection, observation_id)
+            if 'algorithm' in fields:
+                obs.algorithm = self._get_algorithm(fields['algorithm'])
+        elif obs_type == 'CompositeObservation':
+            obs = observation.CompositeObservation(
+                collection, observation_id, self._get_algorithm(
+                    self._get_required('algorithm', fields, 'observation')))
+            for uri in fields.get('members', []):
+                obs.members.add(observation.ObservationURI(uri))
+        else:
+            raise ObservationJsonParsingException(
+                "unsupported observation type {}".format(obs_type))
+        obs.sequence_number = _int(fields.get('sequenceNumber'))
+        obs.obs_type = fields.get('type')
+        intent = fields.get('intent')
+        if intent is not None:
+            obs.intent = observation.ObservationIntentType(intent)
+        obs.meta_release = caom_util.str2ivoa(fields.get('metaRelease'))
+        obs.proposal = self._get_proposal(fields.get('proposal'))
+        obs.target = self._get_target(fields.get('target'))
+        obs.target_position = \
+            self._get_target_position(fields.get('targetPosition'))
+        obs.telescope = self._get_telescope(fields.get('telescope'))
+        obs.instrument = self._get_instrument(fields.get('instrument'))
+        obs.environment = self._get_environment(fields.get('environment'))
+        obs.requirements = self._get_requirements(fields.get('requirements'))
+        for _plane in planes:
+            obs.planes[_plane.product_id] = _plane
+
+        self._set_entity_attributes(fields, obs)
+        return obs
+
+    def _get_algorithm(self, fields):
+        if fields is None:
+            return None
+        return observation.Algorithm(
+            self._get_required('name', fields, 'algorithm'))
+
+    def _get_proposal(self, fields):
+        if fields is None:
+            return None
+        proposal = observation.Proposal(
+            self._get_required('id', fields, 'proposal'))
+        proposal.pi_name = fields.get('pi')
+        proposal.project = fields.get('project')
+        proposal.title = fields.get('title')
+        proposal.keywords.update(fields.get('keywords', []))
+        return proposal
+
+    def _get_target(self, fields):
+        if fields is None:
+            return None
+        target = observation.Target(self._get_required('name', fields, 'target'))
+        target_type = fields.get('type')
+        if target_type is not None:
+            target.target_type = observation.TargetType(target_type)
+        target.standard = fields.get('standard')
+        target.redshift = _float(fields.get('redshift'))
+        target.moving = fields.get('moving')
+        target.keywords.update(fields.get('keywords', []))
+        return target
+
+    def _get_target_position(self, fields):
+        if fields is None:
+            return None
+        target_position = observation.TargetPosition(
+            self._get_point(
+                self._get_required('coordinates', fields, 'targetPosition')),
+            self._get_required('coordsys', fields, 'targetPosition'))
+        target_position.equinox = _float(fields.get('equinox'))
+        return target_position
+
+    def _get_requirements(self, fields):
+        if fields is None:
+            return None
+        return observation.Requirements(observation.Status(
+            self._get_required('flag', fields, 'requirements')))
+
+    def _get_telescope(self, fields):
+        if fields is None:
+            return None
+        telescope = observation.Telescope(
+            self._get_required('name', fields, 'telescope'))
+        telescope.geo_location_x = _float(fields.get('geoLocationX'))
+        telescope.geo_location_y = _float(fields.get('geoLocationY'))
+        telescope.geo_location_z = _float(fields.get('geoLocationZ'))
+        telescope.keywords.update(fields.get('keywords', []))
+        return telescope
+
+    def _get_instrument(self, fields):
+        if fields is None:
+            return None
+        instrument = observation.Instrument(
+            self._get_required('name', fields, 'instrument'))
+        instrument.keywords.update(fields.get('keywords', []))
+        return instrument
+
+    def _get_environment(self, fields):
+        if fields is None:
+            return None
+        environment = observation.Environment()
+        environment.seeing = _float(fields.get('seeing'))
+        environment.humidity = _float(fields.get('humidity'))
+        environment.elevation = _float(fields.get('elevation'))
+        environment.tau = _float(fields.get('tau'))
+        environment.wavelength_tau = _float(fields.get('wavelengthTau'))
+        environment.ambient_temp = _float(fields.get('ambientTemp'))
+        environment.photometric = fields.get('photometric')
+        return environment
+
+    def _get_plane(self, fields):
+        _plane = plane.Plane(self._get_required('productID', fields, 'plane'))
+        _plane.meta_release = caom_util.str2ivoa(fields.get('metaRelease'))
+        _plane.data_release = caom_util.str2ivoa(fields.get('dataRelease'))
+        data_product_type = fields.get('dataProductType')
+        if data_product_type is not None:
+            _plane.data_product_type = plane.DataProductType(data_product_type)
+        calibration_level = fields.get('calibrationLevel')
+        if calibration_level is not None:
+            _plane.calibration_level = \
+                plane.CalibrationLevel(int(calibration_level))
+        _plane.provenance = self._get_provenance(fields.get('provenance'))
+        _plane.metrics = self._get_metrics(fields.get('metrics'))
+        _plane.quality = self._get_quality(fields.get('quality'))
+        for artifact_fields in fields.get('artifacts', []):
+            _artifact = self._get_artifact(artifact_fields)
+            _plane.artifacts[_artifact.uri] = _artifact
+        self._set_entity_attributes(fields, _plane)
+        return _plane
+
+    def _get_provenance(self, fields):
+        if fields is None:
+            return None
+        prov = plane.Provenance(self._get_required('name', fields, 'provenance'))
+        prov.version = fields.get('version')
+        prov.project = fields.get('project')
+        prov.producer = fields.get('producer')
+        prov.run_id = fields.get('runID')
+        prov.reference = fields.get('reference')
+        prov.last_executed = caom_util.str2ivoa(fields.get('lastExecuted'))
+        prov.keywords.update(fields.get('keywords', []))
+        for uri in fields.get('inputs', []):
+            prov.inputs.add(plane.PlaneURI(uri))
+        return prov
+
+    def _get_metrics(self, fields):
+        if fields is None:
+            return None
+        metrics = plane.Metrics()
+        metrics.source_number_density = \
+            _float(fields.get('sourceNumberDensity'))
+        metrics.background = _float(fields.get('background'))
+        metrics.background_std_dev = _float(fields.get('backgroundStddev'))
+        metrics.flux_density_limit = _float(fields.get('fluxDensityLimit'))
+        metrics.mag_limit = _float(fields.get('magLimit'))
+        return metrics
+
+    def _get_quality(self, fields):
+        if fields is None:
+            return None
+        return plane.DataQuality(plane.Quality(
+            self._get_required('flag', fields, 'quality')))
+
+    def _get_artifact(self, fields):
+        _artifact = artifact.Artifact(
+            self._get_required('uri', fields, 'artifact'),
+            chunk.ProductType(
+                self._get_required('productType', fields, 'artifact')),
+            artifact.ReleaseType(
+                self._get_required('releaseType', fields, 'artifact')))
+        _artifact.content_type = fields.get('contentType')
+        _artifact.content_length = _long(fields.get('contentLength'))
+        for part_fields in fields.get('parts', []):
+            _part = self._get_part(part_fields)
+            _artifact.parts[_part.name] = _part
+        self._set_entity_attributes(fields, _artifact)
+        return _artifact
+
+    def _get_part(self, fields):
+        _part = part.Part(self._get_required('name', fields, 'part'))
+        product_type = fields.get('productType')
+        if product_type is not None:
+            _part.product_type = chunk.ProductType(product_type)
+        for chunk_fields in fields.get('chunks', []):
+            _part.chunks.append(self._get_chunk(chunk_fields))
+        self._set_entity_attributes(fields, _part)
+        return _part
+
+    def _get_chunk(self, fields):
+        _chunk = chunk.Chunk()
+        product_type = fields.get('productType')
+        if product_type is not None:
+            _chunk.product_type = chunk.ProductType(product_type)
+        _chunk.naxis = _int(fields.get('naxis'))
+        _chunk.observable_axis = _int(fields.get('observableAxis'))
+        _chunk.position_axis_1 = _int(fields.get('positionAxis1'))
+        _chunk.position_axis_2 = _int(fields.get('positionAxis2'))
+        _chunk.energy_axis = _int(fields.get('energyAxis'))
+        _chunk.time_axis = _int(fields.get('timeAxis'))
+        _chunk.polarization_axis = _int(fields.get('polarizationAxis'))
+        _chunk.observable = self._get_observable_axis(fields.get('observable'))
+        _chunk.position = self._get_spatial_wcs(fields.get('position'))
+        _chunk.energy = self._get_spectral_wcs(fields.get('energy'))
+        _chunk.time = self._get_temporal_wcs(fields.get('time'))
+        _chunk.polarization = \
+            self._get_polarization_wcs(fields.get('polarization'))
+        self._set_entity_attributes(fields, _chunk)
+        return _chunk
+
+    def _get_observable_axis(self, fields):
+        if fields is None:
+            return None
+        observable = chunk.ObservableAxis(self._get_slice(
+            self._get_required('dependent', fields, 'observable')))
+        observable.independent = self._get_slice(fields.get('independent'))
+        return observable
+
+    def _get_spatial_wcs(self, fields):
+        if fields is None:
+            return None
+        position = chunk.SpatialWCS(self._get_coord_axis2d(fields.get('axis')))
+        position.coordsys = fields.get('coordsys')
+        position.equinox = _float(fields.get('equinox'))
+        position.resolution = _float(fields.get('resolution'))
+        return position
+
+    def _get_spectral_wcs(self, fields):
+        if fields is None:
+            return None
+        energy = chunk.SpectralWCS(
+            self._get_coord_axis1d(
+                self._get_required('axis', fields, 'energy')),
+            self._get_required('specsys', fields, 'energy'))
+        energy.ssysobs = fields.get('ssysobs')
+        energy.ssyssrc = fields.get('ssyssrc')
+        energy.restfrq = _float(fields.get('restfrq'))
+        energy.restwav = _float(fields.get('restwav'))
+        energy.velosys = _float(fields.get('velosys'))
+        energy.zsource = _float(fields.get('zsource'))
+        energy.velang = _float(fields.get('velang'))
+        energy.bandpass_name = fields.get('bandpassName')
+        energy.resolving_power = _float(fields.get('resolvingPower'))
+        transition = fields.get('transition')
+        if transition is not None:
+            energy.transition = wcs.EnergyTransition(
+                self._get_required('species', transition, 'transition'),
+                self._get_required('transition', transition, 'transition'))
+        return energy
+
+    def _get_temporal_wcs(self, fields):
+        if fields is None:
+            return None
+        time = chunk.TemporalWCS(self._get_coord_axis1d(
+            self._get_required('axis', fields, 'time')))
+        time.timesys = fields.get('timesys')
+        time.trefpos = fields.get('trefpos')
+        time.mjdref = _float(fields.get('mjdref'))
+        time.exposure = _float(fields.get('exposure'))
+        time.resolution = _float(fields.get('resolution'))
+        return time
+
+    def _get_polarization_wcs(self, fields):
+        if fields is None:
+            return None
+        return chunk.PolarizationWCS(
+            self._get_coord_axis1d(fields.get('axis')))
+
+    # /*+ CAOM2 Types #-*/
+
+    def _get_point(self, value):
+        cval1, cval2 = self._get_pair(value, 'Point')
+        return shape.Point(float(cval1), float(cval2))
+
+    # /*+ WCS Types #-*/
+
+    def _get_pair(self, value, name):
+        if not isinstance(value, list) or len(value) != 2:
+            raise ObservationJsonParsingException(
+                "{} must be an array of 2 values, found {}".format(name, value))
+        return value
+
+    def _get_axis(self, fields):
+        if fields is None:
+            return None
+        return wcs.Axis(self._get_required('ctype', fields, 'axis'),
+                        fields.get('cunit'))
+
+    def _get_slice(self, fields):
+        if fields is None:
+            return None
+        return wcs.Slice(
+            self._get_axis(self._get_required('axis', fields, 'slice')),
+            long(self._get_required('bin', fields, 'slice')))
+
+    def _get_coord_axis1d(self, fields):
+        if fields is None:
+            return None
+        axis = wcs.CoordAxis1D(
+            self._get_axis(self._get_required('axis', fields, 'CoordAxis1D')))
+        axis.error = self._get_coord_error(fields.get('error'))
+        axis.range = self._get_coord_range1d(fields.get('range'))
+        bounds = fields.get('bounds')
+        if bounds is not None:
+            axis.bounds = wcs.CoordBounds1D()
+            for sample in bounds.get('samples', []):
+                axis.bounds.samples.append(self._get_coord_range1d(sample))
+        axis.function = self._get_coord_function1d(fields.get('function'))
+        return axis
+
+    def _get_coord_axis2d(self, fields):
+        if fields is None:
+            return None
+        axis = wcs.CoordAxis2D(
+            self._get_axis(self._get_required('axis1', fields, 'CoordAxis2D')),
+            self._get_axis(self._get_required('axis2', fields, 'CoordAxis2D')))
+        axis.error1 = self._get_coord_error(fields.get('error1'))
+        axis.error2 = self._get_coord_error(fields.get('error2'))
+        axis.range = self._get_coord_range2d(fields.get('range'))
+        axis.bounds = self._get_coord_bounds2d(fields.get('bounds'))
+        axis.function = self._get_coord_function2d(fields.get('function'))
+        return axis
+
+    def _get_coord_bounds2d(self, fields):
+        if fields is None:
+            return None
+        circle = fields.get('circle')
+        if circle is not None:
+            return wcs.CoordCircle2D(
+                self._get_value_coord2d(
+                    self._get_required('center', circle, 'circle')),
+                float(self._get_required('radius', circle, 'circle')))
+        polygon = fields.get('polygon')
+        if polygon is not None:
+            bounds = wcs.CoordPolygon2D()
+            for vertex in polygon.get('vertices', []):
+                bounds.vertices.append(self._get_value_coord2d(vertex))
+            return bounds
+        raise ObservationJsonParsingException(
+            "unsupported CoordBounds2D {}".format(fields))
+
+    def _get_coord_error(self, value):
+        if value is None:
+            return None
+        syser, rnder = self._get_pair(value, 'CoordError')
+        return wcs.CoordError(float(syser), float(rnder))
+
+    def _get_coord_function1d(self, fields):
+        if fields is None:
+            return None
+        return wcs.CoordFunction1D(
+            long(self._get_required('naxis', fields, 'CoordFunction1D')),
+            float(self._get_required('delta', fields, 'CoordFunction1D')),
+            self._get_ref_coord(
+                self._get_required('refCoord', fields, 'CoordFunction1D')))
+
+    def _get_coord_function2d(self, fields):
+        if fields is None:
+            return None
+        naxis1, naxis2 = self._get_pair(
+            self._get_required('dimension', fields, 'CoordFunction2D'),
+            'Dimension2D')
+        return wcs.CoordFunction2D(
+            wcs.Dimension2D(long(naxis1), long(naxis2)),
+            self._get_coord2d(
+                self._get_required('refCoord', fields, 'CoordFunction2D')),
+            float(self._get_required('cd11', fields, 'CoordFunction2D')),
+            float(self._get_required('cd12', fields, 'CoordFunction2D')),
+            float(self._get_required('cd21', fields, 'CoordFunction2D')),
+            float(self._get_required('cd22', fields, 'CoordFunction2D')))
+
+    def _get_coord_range1d(self, value):
+        if value is None:
+            return None
+        start, end = self._get_pair(value, 'CoordRange1D')
+        return wcs.CoordRange1D(self._get_ref_coord(start),
+                                self._get_ref_coord(end))
+
+    def _get_coord_range2d(self, value):
+        if value is None:
+            return None
+        start, end = self._get_pair(value, 'CoordRange2D')
+        return wcs.CoordRange2D(self._get_coord2d(start),
+                                self._get_coord2d(end))
+
+    def _get_coord2d(self, value):
+        coord1, coord2 = self._get_pair(value, 'Coord2D')
+        return wcs.Coord2D(self._get_ref_coord(coord1),
+                           self._get_ref_coord(coord2))
+
+    def _get_value_coord2d(self, value):
+        coord1, coord2 = self._get_pair(value, 'ValueCoord2D')
+        return wcs.ValueCoord2D(float(coord1), float(coord2))
+
+    def _get_ref_coord(self, value):
+        pix, val = self._get_pair(value, 'RefCoord')
+        return wcs.RefCoord(float(pix), float(val))
+
+
+class ObservationJsonParsingException(Exception):
+    pass
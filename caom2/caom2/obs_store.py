@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Defines ObservationStore class """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import sqlite3
+from datetime import datetime
+
+from .obs_reader_writer import ObservationReader, ObservationWriter
+from .observation import Observation
+
+__all__ = ['ObservationStore']
+
+# sortable format of the dates in the database
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# wavelength in metres of the units of the WAVE spectral axes
+WAVELENGTH_UNITS = {None: 1.0, 'm': 1.0, 'cm': 1e-2, 'mm': 1e-3, 'um': 1e-6, 'nm': 1e-9,
+                    'Angstrom': 1e-10, 'A': 1e-10}
+# frequency in Hz of the units of the FREQ spectral axes
+FREQUENCY_UNITS = {None: 1.0, 'Hz': 1.0, 'kHz': 1e3, 'MHz': 1e6, 'GHz': 1e9}
+# days in the units of the temporal axes
+TIME_UNITS = {None: 1.0, 'd': 1.0, 'h': 1 / 24, 'min': 1 / 1440, 's': 1 / 86400}
+SPEED_OF_LIGHT = 299792458.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observation (
+    id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    observation_id TEXT NOT NULL,
+    last_modified TEXT,
+    document BLOB NOT NULL,
+    UNIQUE (collection, observation_id)
+);
+CREATE INDEX IF NOT EXISTS observation_last_modified ON observation (last_modified);
+CREATE TABLE IF NOT EXISTS plane (
+    observation INTEGER NOT NULL REFERENCES observation (id),
+    product_id TEXT NOT NULL,
+    calibration_level INTEGER,
+    time_lower REAL,
+    time_upper REAL,
+    energy_lower REAL,
+    energy_upper REAL
+);
+CREATE INDEX IF NOT EXISTS plane_observation ON plane (observation);
+CREATE INDEX IF NOT EXISTS plane_product_id ON plane (product_id);
+CREATE INDEX IF NOT EXISTS plane_calibration_level ON plane (calibration_level);
+CREATE INDEX IF NOT EXISTS plane_time ON plane (time_lower, time_upper);
+CREATE INDEX IF NOT EXISTS plane_energy ON plane (energy_lower, energy_upper);
+CREATE TABLE IF NOT EXISTS artifact (
+    observation INTEGER NOT NULL REFERENCES observation (id),
+    product_id TEXT NOT NULL,
+    uri TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifact_observation ON artifact (observation);
+CREATE INDEX IF NOT EXISTS artifact_uri ON artifact (uri);
+"""
+
+
+class ObservationStore(object):
+    """
+    Stores observations in a SQLite database.
+
+    Each observation is saved as an XML document together with indexed columns extracted
+    from it: collection, observation ID and lastModified date of the observation, product
+    ID, calibration level and time and energy bounds of its planes and URIs of its
+    artifacts. The observations can then be found by key, lastModified range, artifact URI
+    or plane properties without parsing the documents.
+
+    The time bounds are in MJD and the energy bounds are wavelengths in metres. Both are
+    computed from the WCS of the chunks of the planes, with the axes that can be converted
+    to these units (TIME, WAVE and FREQ). They are None for the other planes.
+    """
+
+    def __init__(self, path=':memory:', namespace=None):
+        """Constructor. Opens the database and creates its tables if necessary.
+
+        Arguments:
+        path : path of the database file, created if it does not exist
+        namespace : CAOM-2.x namespace of the stored documents (default: the latest)
+        """
+        self.path = path
+        self._reader = ObservationReader()
+        self._writer = ObservationWriter(namespace=namespace)
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT count(*) FROM observation').fetchone()[0]
+
+    def put(self, observation):
+        """
+        Adds or replaces an observation
+
+        Arguments:
+        observation : the caom2.observation.Observation object
+        """
+        self.put_all([observation])
+
+    def put_all(self, observations):
+        """
+        Adds or replaces observations in a single transaction: either all of them or none
+        are stored.
+
+        Arguments:
+        observations : iterable of caom2.observation.Observation objects
+        return : number of stored observations
+        """
+        count = 0
+        with self._conn:
+            for observation in observations:
+                self._insert(observation)
+                count += 1
+        return count
+
+    def get(self, collection, observation_id):
+        """
+        Reads a stored observation
+
+        Arguments:
+        collection : name of the collection
+        observation_id : ID of the observation
+        return : the caom2.observation.Observation object or None if it is not stored
+        """
+        document = self.get_xml(collection, observation_id)
+        if document is None:
+            return None
+        return self._reader.read(io.BytesIO(document))
+
+    def get_xml(self, collection, observation_id):
+        """
+        Returns the stored document of an observation without parsing it
+
+        Arguments:
+        collection : name of the collection
+        observation_id : ID of the observation
+        return : the XML document of the observation or None if it is not stored
+        """
+        row = self._conn.execute(
+            'SELECT document FROM observation WHERE collection = ? AND observation_id = ?',
+            (collection, observation_id)).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def delete(self, collection, observation_id):
+        """
+        Removes an observation
+
+        Arguments:
+        collection : name of the collection
+        observation_id : ID of the observation
+        return : True if the observation was stored
+        """
+        with self._conn:
+            return self._delete(collection, observation_id)
+
+    def list(self, collection=None, start=None, end=None, limit=None):
+        """
+        Lists observations in lastModified order
+
+        Arguments:
+        collection : only list the observations of this collection
+        start : earliest lastModified date (inclusive)
+        end : latest lastModified date (inclusive)
+        limit : maximum number of observations
+        return : list of (collection, observation ID, lastModified date) tuples
+        """
+        conditions = []
+        params = []
+        if collection is not None:
+            conditions.append('collection = ?')
+            params.append(collection)
+        if start is not None:
+            conditions.append('last_modified >= ?')
+            params.append(_format_date(start))
+        if end is not None:
+            conditions.append('last_modified <= ?')
+            params.append(_format_date(end))
+        query = 'SELECT collection, observation_id, last_modified FROM observation'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY last_modified, collection, observation_id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return [(collection, observation_id, _parse_date(last_modified))
+                for (collection, observation_id, last_modified)
+                in self._conn.execute(query, params)]
+
+    def find_artifact(self, uri):
+        """
+        Finds the planes of an artifact
+
+        Arguments:
+        uri : URI of an artifact
+        return : list of (collection, observation ID, product ID) tuples of the planes with
+                 the artifact
+        """
+        return [tuple(row) for row in self._conn.execute(
+            'SELECT o.collection, o.observation_id, a.product_id FROM artifact a '
+            'JOIN observation o ON o.id = a.observation WHERE a.uri = ? '
+            'ORDER BY o.collection, o.observation_id, a.product_id', (uri,))]
+
+    def find_planes(self, collection=None, product_id=None, calibration_level=None,
+                    time=None, energy=None):
+        """
+        Finds the planes matching all the given criteria
+
+        Arguments:
+        collection : name of the collection
+        product_id : product ID of the planes
+        calibration_level : caom2.plane.CalibrationLevel of the planes
+        time : (lower, upper) MJD interval overlapping the time bounds of the planes
+        energy : (lower, upper) wavelength interval in metres overlapping the energy
+                 bounds of the planes
+        return : list of (collection, observation ID, product ID) tuples
+        """
+        conditions = []
+        params = []
+        if collection is not None:
+            conditions.append('o.collection = ?')
+            params.append(collection)
+        if product_id is not None:
+            conditions.append('p.product_id = ?')
+            params.append(product_id)
+        if calibration_level is not None:
+            conditions.append('p.calibration_level = ?')
+            params.append(calibration_level.value)
+        for (name, interval) in [('time', time), ('energy', energy)]:
+            if interval is not None:
+                conditions.append('p.{0}_lower <= ? AND p.{0}_upper >= ?'.format(name))
+                params.extend([interval[1], interval[0]])
+        query = ('SELECT o.collection, o.observation_id, p.product_id FROM plane p '
+                 'JOIN observation o ON o.id = p.observation')
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY o.collection, o.observation_id, p.product_id'
+        return [tuple(row) for row in self._conn.execute(query, params)]
+
+    def _insert(self, observation):
+        assert isinstance(observation, Observation), (
+            "observation is not an Observation")
+        self._delete(observation.collection, observation.observation_id)
+        document = io.BytesIO()
+        self._writer.write(observation, document)
+        cursor = self._conn.execute(
+            'INSERT INTO observation (collection, observation_id, last_modified, document) '
+            'VALUES (?, ?, ?, ?)',
+            (observation.collection, observation.observation_id,
+             _format_date(observation._last_modified), sqlite3.Binary(document.getvalue())))
+        obs_id = cursor.lastrowid
+        planes = []
+        artifacts = []
+        for plane in observation.planes.values():
+            time_bounds = _bounds(plane, 'time', _time_value)
+            energy_bounds = _bounds(plane, 'energy', _wavelength)
+            planes.append((obs_id, plane.product_id,
+                           None if plane.calibration_level is None else
+                           plane.calibration_level.value) + time_bounds + energy_bounds)
+            for artifact in plane.artifacts.values():
+                artifacts.append((obs_id, plane.product_id, artifact.uri))
+        self._conn.executemany('INSERT INTO plane VALUES (?, ?, ?, ?, ?, ?, ?)', planes)
+        self._conn.executemany('INSERT INTO artifact VALUES (?, ?, ?)', artifacts)
+
+    def _delete(self, collection, observation_id):
+        row = self._conn.execute(
+            'SELECT id FROM observation WHERE collection = ? AND observation_id = ?',
+            (collection, observation_id)).fetchone()
+        if row is None:
+            return False
+        self._conn.execute('DELETE FROM artifact WHERE observation = ?', row)
+        self._conn.execute('DELETE FROM plane WHERE observation = ?', row)
+        self._conn.execute('DELETE FROM observation WHERE id = ?', row)
+        return True
+
+
+def _format_date(date):
+    return None if date is None else date.strftime(DATE_FORMAT)
+
+
+def _parse_date(value):
+    return None if value is None else datetime.strptime(value, DATE_FORMAT)
+
+
+def _bounds(plane, name, convert):
+    """
+    Computes the bounds of a plane from the time or energy WCS of its chunks
+
+    Arguments:
+    plane : the caom2.plane.Plane
+    name : 'time' or 'energy', the chunk attribute with the WCS
+    convert : function converting a value of the axis of a WCS to the units of the
+              bounds, returning None when the axis cannot be converted
+    return : tuple of (lower, upper) or (None, None) when no chunk has a convertible axis
+    """
+    values = []
+    for artifact in plane.artifacts.values():
+        for part in artifact.parts.values():
+            for chunk in part.chunks:
+                wcs = getattr(chunk, name)
+                if wcs is None or wcs.axis is None:
+                    continue
+                for value in _axis_values(wcs.axis):
+                    value = convert(wcs, value)
+                    if value is not None:
+                        values.append(value)
+    if not values:
+        return None, None
+    return min(values), max(values)
+
+
+def _axis_values(coord_axis):
+    """
+    Extracts the coordinate values that bound an axis
+
+    Arguments:
+    coord_axis : caom2.wcs.CoordAxis1D
+    return : the coordinate values at the ends of the range, bounds or function of the axis
+    """
+    if coord_axis.range is not None:
+        return [coord_axis.range.start.val, coord_axis.range.end.val]
+    if coord_axis.bounds is not None and coord_axis.bounds.samples:
+        return [value for sample in coord_axis.bounds.samples
+                for value in (sample.start.val, sample.end.val)]
+    function = coord_axis.function
+    if function is not None and function.naxis and function.delta is not None:
+        # the pixels of the function run from 0.5 to naxis + 0.5
+        ref = function.ref_coord
+        return [ref.val + (0.5 - ref.pix) * function.delta,
+                ref.val + (function.naxis + 0.5 - ref.pix) * function.delta]
+    return []
+
+
+def _time_value(temporal_wcs, value):
+    unit = TIME_UNITS.get(temporal_wcs.axis.axis.cunit)
+    if unit is None:
+        return None
+    return (temporal_wcs.mjdref or 0.0) + value * unit
+
+
+def _wavelength(spectral_wcs, value):
+    axis = spectral_wcs.axis.axis
+    if axis.ctype == 'WAVE' and axis.cunit in WAVELENGTH_UNITS:
+        return value * WAVELENGTH_UNITS[axis.cunit]
+    if axis.ctype == 'FREQ' and axis.cunit in FREQUENCY_UNITS and value:
+        return SPEED_OF_LIGHT / (value * FREQUENCY_UNITS[axis.cunit])
+    return None
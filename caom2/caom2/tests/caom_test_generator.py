@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Defines Caom2TestGenerator class """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from StringIO import StringIO
+
+from caom2 import artifact
+from caom2 import caom_util
+from caom2 import chunk
+from caom2 import obs_reader_writer
+from caom2 import observation
+from caom2 import part
+from caom2 import plane
+from caom2 import shape
+from caom2 import wcs
+from caom2.tests.caom_test_instances import Caom2TestInstances
+
+__all__ = ['Caom2TestGenerator', 'write_observations']
+
+NAMESPACES = {20: obs_reader_writer.CAOM20_NAMESPACE,
+              21: obs_reader_writer.CAOM21_NAMESPACE,
+              22: obs_reader_writer.CAOM22_NAMESPACE}
+
+_base_date = datetime(2010, 1, 1)
+
+
+class Caom2TestGenerator(Caom2TestInstances):
+    """
+    Generates large synthetic observations with the structure of the
+    Caom2TestInstances ones but with a configurable number of planes,
+    artifacts, parts and chunks and randomized but valid WCS. The content of
+    an observation only depends on the seed and its index, so the same
+    collection can be regenerated in any order and by several processes.
+    """
+
+    def __init__(self, seed=0, planes=1, artifacts=1, parts=1, chunks=1,
+                 collection='collection'):
+        """
+        :param seed: seed of the pseudo-random values
+        :param planes: number of planes per observation
+        :param artifacts: number of artifacts per plane
+        :param parts: number of parts per artifact
+        :param chunks: number of chunks per part
+        :param collection: collection of the observations
+        """
+        super(Caom2TestGenerator, self).__init__()
+        self.seed = seed
+        self.planes = planes
+        self.artifacts = artifacts
+        self.parts = parts
+        self.chunks = chunks
+        self.collection = collection
+        self._random = random.Random(seed)
+        self._observation_id = None
+
+    def get_observation(self, index, composite=False):
+        """
+        :param index: index of the observation in the collection
+        :param composite: whether to generate a CompositeObservation
+        :return: the observation, with ID 'obs<index>'
+        """
+        self._random.seed('{}-{}'.format(self.seed, index))
+        self._observation_id = 'obs{:09d}'.format(index)
+        if composite:
+            obs = self.get_composite_observation()
+        else:
+            obs = self.get_simple_observation()
+        obs.collection = self.collection
+        obs.observation_id = self._observation_id
+        self._set_entity_attributes(obs)
+        return obs
+
+    def _set_entity_attributes(self, obs):
+        # ids fit in 63 bits so that the observations can be written as
+        # CAOM-2.0 too
+        entities = [obs]
+        for _plane in obs.planes.values():
+            entities.append(_plane)
+            for _artifact in _plane.artifacts.values():
+                entities.append(_artifact)
+                for _part in _artifact.parts.values():
+                    entities.append(_part)
+                    entities.extend(_part.chunks)
+        last_modified = _base_date + timedelta(
+            milliseconds=self._random.randint(0, 10 * 365 * 86400 * 1000))
+        for entity in entities:
+            entity._id = caom_util.long2uuid(self._random.getrandbits(63))
+            entity._last_modified = last_modified
+
+    def get_target_position(self):
+        point = shape.Point(self._random.uniform(0.0, 360.0),
+                            self._random.uniform(-90.0, 90.0))
+        target_position = observation.TargetPosition(point, 'ICRS')
+        target_position.equinox = 2000.0
+        return target_position
+
+    def get_planes(self):
+        planes = collections.OrderedDict()
+        for i in range(self.planes):
+            product_id = 'productID{}'.format(i)
+            _plane = plane.Plane(product_id)
+            if self.complete:
+                _plane.meta_release = Caom2TestInstances._ivoa_date
+                _plane.data_release = Caom2TestInstances._ivoa_date
+                _plane.data_product_type = plane.DataProductType.IMAGE
+                _plane.calibration_level = plane.CalibrationLevel.PRODUCT
+                _plane.provenance = self.get_provenance()
+                _plane.metrics = self.get_metrics()
+                if self.caom_version >= 21:
+                    _plane.quality = self.get_quality()
+            if self.depth > 2:
+                for k, v in self.get_artifacts(product_id).iteritems():
+                    _plane.artifacts[k] = v
+            planes[product_id] = _plane
+        return planes
+
+    def get_artifacts(self, product_id='productID'):
+        artifacts = collections.OrderedDict()
+        for i in range(self.artifacts):
+            uri = 'ad:{}/{}_{}_{}.fits'.format(
+                self.collection, self._observation_id, product_id, i)
+            _artifact = artifact.Artifact(uri, chunk.ProductType.SCIENCE,
+                                          artifact.ReleaseType.DATA)
+            if self.complete:
+                _artifact.content_type = 'application/fits'
+                _artifact.content_length = long(
+                    self._random.randint(2880, 2 ** 31))
+            if self.depth > 3:
+                for k, v in self.get_parts().iteritems():
+                    _artifact.parts[k] = v
+            artifacts[uri] = _artifact
+        return artifacts
+
+    def get_parts(self):
+        parts = collections.OrderedDict()
+        for i in range(self.parts):
+            name = '{}'.format(i)
+            _part = part.Part(name)
+            if self.complete:
+                _part.product_type = chunk.ProductType.SCIENCE
+            if self.depth > 4:
+                for _chunk in self.get_chunks():
+                    _part.chunks.append(_chunk)
+            parts[name] = _part
+        return parts
+
+    def get_chunks(self):
+        chunks = caom_util.TypedList(chunk.Chunk, )
+        for i in range(self.chunks):
+            chunks.extend(super(Caom2TestGenerator, self).get_chunks())
+        return chunks
+
+    def get_spatial_wcs(self):
+        position = super(Caom2TestGenerator, self).get_spatial_wcs()
+        if self.complete:
+            position.coordsys = 'ICRS'
+            position.resolution = self._random.uniform(0.1, 2.0)
+        return position
+
+    def get_coord_axis2d(self):
+        coord_axis2d = wcs.CoordAxis2D(wcs.Axis('RA---TAN', 'deg'),
+                                       wcs.Axis('DEC--TAN', 'deg'))
+        if self.complete:
+            naxis1 = self._random.randint(512, 4096)
+            naxis2 = self._random.randint(512, 4096)
+            ra = self._random.uniform(0.0, 360.0)
+            dec = self._random.uniform(-80.0, 80.0)
+            scale = self._random.uniform(5e-5, 5e-4)
+            coord_axis2d.error1 = wcs.CoordError(
+                self._random.uniform(0.0, 1e-4), self._random.uniform(0.0, 1e-4))
+            coord_axis2d.error2 = wcs.CoordError(
+                self._random.uniform(0.0, 1e-4), self._random.uniform(0.0, 1e-4))
+            half1 = naxis1 * scale / 2
+            half2 = naxis2 * scale / 2
+            coord_axis2d.range = wcs.CoordRange2D(
+                wcs.Coord2D(wcs.RefCoord(0.5, ra - half1),
+                            wcs.RefCoord(0.5, dec - half2)),
+                wcs.Coord2D(wcs.RefCoord(naxis1 + 0.5, ra + half1),
+                            wcs.RefCoord(naxis2 + 0.5, dec + half2)))
+            coord_axis2d.function = wcs.CoordFunction2D(
+                wcs.Dimension2D(long(naxis1), long(naxis2)),
+                wcs.Coord2D(wcs.RefCoord(naxis1 / 2, ra),
+                            wcs.RefCoord(naxis2 / 2, dec)),
+                -scale, 0.0, 0.0, scale)
+            if self.bounds_is_circle:
+                coord_axis2d.bounds = wcs.CoordCircle2D(
+                    wcs.ValueCoord2D(ra, dec), max(half1, half2))
+            else:
+                polygon = wcs.CoordPolygon2D()
+                polygon.vertices.append(wcs.ValueCoord2D(ra - half1, dec - half2))
+                polygon.vertices.append(wcs.ValueCoord2D(ra + half1, dec - half2))
+                polygon.vertices.append(wcs.ValueCoord2D(ra + half1, dec + half2))
+                polygon.vertices.append(wcs.ValueCoord2D(ra - half1, dec + half2))
+                coord_axis2d.bounds = polygon
+        return coord_axis2d
+
+    def get_spectral_wcs(self):
+        energy = chunk.SpectralWCS(self._get_axis1d('WAVE', 'm', 3e-7, 2.5e-6),
+                                   'TOPOCENT')
+        if self.complete:
+            energy.restwav = self._random.uniform(3e-7, 2.5e-6)
+            energy.bandpass_name = 'band{}'.format(self._random.randint(0, 9))
+            energy.resolving_power = self._random.uniform(100.0, 10000.0)
+        return energy
+
+    def get_temporal_wcs(self):
+        time = chunk.TemporalWCS(self._get_axis1d('TIME', 'd', 50000.0, 58000.0))
+        if self.complete:
+            time.exposure = self._random.uniform(1.0, 3600.0)
+            time.resolution = time.exposure
+            time.timesys = 'UTC'
+            time.trefpos = 'TOPOCENTER'
+            time.mjdref = 0.0
+        return time
+
+    def _get_axis1d(self, ctype, cunit, low, high):
+        """
+        :return: CoordAxis1D with a linear function over a random sub-interval
+        of [low, high]
+        """
+        coord_axis1d = wcs.CoordAxis1D(wcs.Axis(ctype, cunit))
+        if self.complete:
+            naxis = self._random.randint(1, 4096)
+            start = self._random.uniform(low, high)
+            end = self._random.uniform(start, high)
+            delta = (end - start) / naxis
+            coord_axis1d.error = wcs.CoordError(0.0, delta / 2)
+            coord_axis1d.range = wcs.CoordRange1D(wcs.RefCoord(0.5, start),
+                                                   wcs.RefCoord(naxis + 0.5, end))
+            coord_axis1d.function = wcs.CoordFunction1D(
+                long(naxis), delta, wcs.RefCoord(0.5, start))
+            bounds = wcs.CoordBounds1D()
+            bounds.samples.append(coord_axis1d.range)
+            coord_axis1d.bounds = bounds
+        return coord_axis1d
+
+
+def _write_range(args):
+    """
+    Writes the observations with indices in [first, last) to directory.
+    :return: number of bytes written
+    """
+    (generator, first, last, directory, version, composite_every) = args
+    writer = obs_reader_writer.ObservationWriter(
+        False, False, 'caom2', NAMESPACES[version])
+    size = 0
+    for index in range(first, last):
+        composite = composite_every > 0 and index % composite_every == 0
+        obs = generator.get_observation(index, composite)
+        buffer = StringIO()
+        writer.write(obs, buffer)
+        document = buffer.getvalue()
+        with open(os.path.join(directory, obs.observation_id + '.xml'),
+                  'wb') as f:
+            f.write(document)
+        size += len(document)
+    return size
+
+
+def write_observations(generator, directory, count, version=22,
+                       composite_every=0, processes=1, chunk_size=1000):
+    """
+    Writes count generated observations as <observation ID>.xml files.
+    :param generator: Caom2TestGenerator that generates the observations
+    :param directory: destination directory, created if necessary
+    :param count: number of observations
+    :param version: CAOM version of the documents: 20, 21 or 22
+    :param composite_every: every composite_every-th observation is a
+    CompositeObservation (0 for none)
+    :param processes: number of processes writing the observations
+    :param chunk_size: number of observations written at once by a process
+    :return: total size of the documents in bytes
+    """
+    if version not in NAMESPACES:
+        raise ValueError('Unsupported CAOM version {}'.format(version))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    generator.caom_version = version
+    tasks = [(generator, first, min(first + chunk_size, count), directory,
+              version, composite_every)
+             for first in range(0, count, chunk_size)]
+    if processes > 1:
+        pool = Pool(processes)
+        try:
+            return sum(pool.imap_unordered(_write_range, tasks))
+        finally:
+            pool.close()
+            pool.join()
+    return sum(_write_range(task) for task in tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Writes synthetic CAOM observations to a directory')
+    parser.add_argument('directory', help='destination directory')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='number of observations')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the pseudo-random values')
+    parser.add_argument('--collection', default='collection',
+                        help='collection of the observations')
+    parser.add_argument('--planes', type=int, default=1,
+                        help='planes per observation')
+    parser.add_argument('--artifacts', type=int, default=1,
+                        help='artifacts per plane')
+    parser.add_argument('--parts', type=int, default=1,
+                        help='parts per artifact')
+    parser.add_argument('--chunks', type=int, default=1,
+                        help='chunks per part')
+    parser.add_argument('--depth', type=int, default=5,
+                        choices=range(1, 6),
+                        help='1 observation only, 2 planes, 3 artifacts, '
+                             '4 parts, 5 chunks')
+    parser.add_argument('--minimal', action='store_true',
+                        help='leave the optional attributes unset')
+    parser.add_argument('--polygon', action='store_true',
+                        help='polygon rather than circle spatial bounds')
+    parser.add_argument('--composite-every', type=int, default=0,
+                        help='make every n-th observation a composite one')
+    parser.add_argument('--caom-version', type=int, default=22,
+                        choices=sorted(NAMESPACES),
+                        help='CAOM version of the documents')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of writing processes')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    generator = Caom2TestGenerator(args.seed, args.planes, args.artifacts,
+                                   args.parts, args.chunks, args.collection)
+    generator.depth = args.depth
+    generator.complete = not args.minimal
+    generator.bounds_is_circle = not args.polygon
+    size = write_observations(generator, args.directory, args.count,
+                              args.caom_version, args.composite_every,
+                              args.processes)
+    logging.info('Wrote {} observations ({} bytes) to {}'.format(
+        args.count, size, args.directory))
+
+
+if __name__ == '__main__':
+    main()
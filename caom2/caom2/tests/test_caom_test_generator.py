@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Defines TestCaom2TestGenerator class """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from . import caom_test_generator
+from .. import obs_reader_writer
+from .. import observation
+
+
+def _to_xml(obs, version):
+    writer = obs_reader_writer.ObservationWriter(
+        True, False, 'caom2', caom_test_generator.NAMESPACES[version])
+    output = StringIO()
+    writer.write(obs, output)
+    return output.getvalue()
+
+
+class TestCaom2TestGenerator(unittest.TestCase):
+
+    def test_get_observation(self):
+        generator = caom_test_generator.Caom2TestGenerator(
+            seed=1, planes=2, artifacts=3, parts=2, chunks=2)
+        obs = generator.get_observation(7)
+        self.assertEqual('obs000000007', obs.observation_id)
+        self.assertEqual(2, len(obs.planes))
+        for plane in obs.planes.values():
+            self.assertEqual(3, len(plane.artifacts))
+            for artifact in plane.artifacts.values():
+                self.assertEqual(2, len(artifact.parts))
+                for part in artifact.parts.values():
+                    self.assertEqual(2, len(part.chunks))
+        self.assertTrue(isinstance(generator.get_observation(7, True),
+                                   observation.CompositeObservation))
+
+        # deterministic from the seed and the index, in any order
+        for version in (20, 21, 22):
+            generator.caom_version = version
+            expected = _to_xml(generator.get_observation(7), version)
+            generator.get_observation(3)
+            self.assertEqual(expected,
+                             _to_xml(generator.get_observation(7), version))
+            other = caom_test_generator.Caom2TestGenerator(
+                seed=2, planes=2, artifacts=3, parts=2, chunks=2)
+            other.caom_version = version
+            self.assertNotEqual(expected,
+                                _to_xml(other.get_observation(7), version))
+
+    def test_valid(self):
+        # the writer validates the documents against the schemas
+        generator = caom_test_generator.Caom2TestGenerator(seed=3, chunks=2)
+        for version in (20, 21, 22):
+            generator.caom_version = version
+            for complete in (True, False):
+                generator.complete = complete
+                for bounds_is_circle in (True, False):
+                    generator.bounds_is_circle = bounds_is_circle
+                    for depth in range(1, 6):
+                        generator.depth = depth
+                        for composite in (True, False):
+                            obs = generator.get_observation(depth, composite)
+                            xml = _to_xml(obs, version)
+                            reader = obs_reader_writer.ObservationReader(True)
+                            returned = reader.read(StringIO(xml))
+                            self.assertEqual(obs.observation_id,
+                                             returned.observation_id)
+                            self.assertEqual(obs._id, returned._id)
+
+    def test_write_observations(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            generator = caom_test_generator.Caom2TestGenerator(planes=2)
+            size = caom_test_generator.write_observations(
+                generator, os.path.join(tmp_dir, 'obs'), 25, version=20,
+                composite_every=5, chunk_size=10)
+            files = sorted(os.listdir(os.path.join(tmp_dir, 'obs')))
+            self.assertEqual(25, len(files))
+            self.assertEqual('obs000000024.xml', files[-1])
+            self.assertEqual(size, sum(
+                os.path.getsize(os.path.join(tmp_dir, 'obs', f))
+                for f in files))
+            reader = obs_reader_writer.ObservationReader(True)
+            obs = reader.read(os.path.join(tmp_dir, 'obs', files[5]))
+            self.assertTrue(isinstance(obs, observation.CompositeObservation))
+            with self.assertRaises(ValueError):
+                caom_test_generator.write_observations(generator, tmp_dir, 1,
+                                                       version=19)
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -70,6 +70,9 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import os
+import subprocess
+import sys
 import unittest
 import uuid
 
@@ -79,6 +82,8 @@ from .. import chunk
 from .. import part
 from .. import plane
 
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+
 
 class TestCaomUtil(unittest.TestCase):
 
@@ -323,3 +328,23 @@ class TestCaomUtil(unittest.TestCase):
         l = 3296038095975885829
         uid = caom_util.long2uuid(l)
         self.assertEqual('00000000-0000-0000-2dbd-e12f64cc2c05', str(uid))
+
+    def test_lazy_package(self):
+        # a new interpreter only imports the XML stack when it is used
+        statement = ("import sys\n"
+                     "import caom2\n"
+                     "assert caom2.SimpleObservation\n"
+                     "assert 'lxml' not in sys.modules\n"
+                     "assert 'ObservationReader' in caom2.__all__\n"
+                     "assert caom2.ObservationReader\n"
+                     "assert 'lxml' in sys.modules\n"
+                     "assert caom2.obs_store.ObservationStore is caom2.ObservationStore\n"
+                     "assert not hasattr(caom2, 'Unknown')\n")
+        env = dict(os.environ)
+        env[str('PYTHONPATH')] = os.path.dirname(os.path.dirname(THIS_DIR))
+        subprocess.check_call([sys.executable, '-c', statement], env=env)
+
+    def test_lazy_import(self):
+        module = caom_util.LazyImport('caom2.tests.caom_test_instances')
+        self.assertEqual('caom2.tests.caom_test_instances', module.__name__)
+        self.assertEqual('collection', module.Caom2TestInstances._collection)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Defines TestObservationJsonReaderWriter class """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import json
+import unittest
+from StringIO import StringIO
+
+from . import caom_test_generator
+from . import caom_test_instances
+from .. import obs_json
+from .. import obs_reader_writer
+
+
+def _instances(complete, depth, bounds_is_circle):
+    instances = caom_test_instances.Caom2TestInstances()
+    instances.complete = complete
+    instances.depth = depth
+    instances.bounds_is_circle = bounds_is_circle
+    instances.caom_version = 22
+    return instances
+
+
+class TestObservationJsonReaderWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = obs_json.ObservationJsonReader()
+        self.writer = obs_json.ObservationJsonWriter()
+        self.xml_reader = obs_reader_writer.ObservationReader(False)
+        self.xml_writer = obs_reader_writer.ObservationWriter(False, False)
+
+    def to_json(self, obs):
+        output = StringIO()
+        self.writer.write(obs, output)
+        return output.getvalue()
+
+    def to_xml(self, obs):
+        output = StringIO()
+        self.xml_writer.write(obs, output)
+        return output.getvalue()
+
+    def get_observations(self):
+        for complete in (True, False):
+            for depth in range(1, 6):
+                for bounds_is_circle in (True, False):
+                    instances = _instances(complete, depth, bounds_is_circle)
+                    yield instances.get_simple_observation()
+                    yield instances.get_composite_observation()
+        generator = caom_test_generator.Caom2TestGenerator(0, 3, 3, 2, 2)
+        yield generator.get_observation(0)
+        yield generator.get_observation(1, True)
+
+    def test_round_trip(self):
+        for obs in self.get_observations():
+            document = self.to_json(obs)
+            returned = self.reader.read(StringIO(document))
+            self.assertEqual(obs.__class__, returned.__class__)
+            self.assertEqual(obs._id, returned._id)
+            self.assertEqual(obs._last_modified, returned._last_modified)
+            self.assertEqual(obs.planes.keys(), returned.planes.keys())
+            self.assertEqual(document, self.to_json(returned))
+
+    def test_xml_round_trip(self):
+        # going through JSON loses nothing a CAOM-2.2 document holds
+        for obs in self.get_observations():
+            from_xml = self.xml_reader.read(StringIO(self.to_xml(obs)))
+            from_json = self.reader.read(StringIO(self.to_json(from_xml)))
+            self.assertEqual(self.to_xml(from_xml), self.to_xml(from_json))
+
+    def test_compact(self):
+        instances = _instances(False, 2, True)
+        obs = instances.get_simple_observation()
+        document = self.to_json(obs)
+        self.assertNotIn(' ', document)
+        self.assertNotIn('null', document)
+        self.assertNotIn('[]', document)
+        fields = json.loads(document)
+        self.assertEqual(obs_json.SCHEMA_VERSION, fields['@schemaVersion'])
+        self.assertEqual('SimpleObservation', fields['@type'])
+        self.assertEqual(str(obs._id), fields['@id'])
+        self.assertEqual(['productID'],
+                         [_plane['productID'] for _plane in fields['planes']])
+
+        instances = _instances(True, 5, False)
+        fields = json.loads(self.to_json(instances.get_simple_observation()))
+        _chunk = fields['planes'][0]['artifacts'][0]['parts'][0]['chunks'][0]
+        self.assertEqual([[2.0, 2.5], [3.0, 3.5]],
+                         _chunk['energy']['axis']['range'])
+        self.assertEqual([[15.0, 16.0], [17.0, 18.0], [19.0, 20.0]],
+                         _chunk['position']['axis']['bounds']['polygon'][
+                             'vertices'])
+
+    def test_streaming(self):
+        generator = caom_test_generator.Caom2TestGenerator(0, 3, 3, 2, 2)
+        obs = generator.get_observation(0)
+        texts = list(self.writer.iterencode(obs))
+        # a string per artifact at least
+        self.assertGreater(len(texts), 9)
+        self.assertEqual(self.to_json(obs), ''.join(texts))
+
+        # whitespace and key order do not matter to the reader
+        document = json.dumps(json.loads(''.join(texts)), indent=2)
+        self.assertEqual(self.to_json(obs),
+                         self.to_json(self.reader.read(StringIO(document))))
+
+    def test_invalid(self):
+        obs = _instances(False, 2, True).get_simple_observation()
+        fields = json.loads(self.to_json(obs))
+
+        for key in ('@schemaVersion', '@type', 'collection', '@id'):
+            invalid = dict(fields)
+            del invalid[key]
+            with self.assertRaises(obs_json.ObservationJsonParsingException):
+                self.reader.read(StringIO(json.dumps(invalid)))
+
+        invalid = dict(fields)
+        invalid['@schemaVersion'] = '2.0'
+        with self.assertRaises(obs_json.ObservationJsonParsingException):
+            self.reader.read(StringIO(json.dumps(invalid)))
+
+        del fields['planes'][0]['productID']
+        with self.assertRaises(obs_json.ObservationJsonParsingException):
+            self.reader.read(StringIO(json.dumps(fields)))
+
+        for document in ('[]', '{"collection":"a"', '{}{}', '{"collection":}',
+                         '{"collection":"a",}', '{"planes":[{]}'):
+            with self.assertRaises(obs_json.ObservationJsonParsingException):
+                self.reader.read(StringIO(document))
+        # not UTF-8
+        with self.assertRaises(obs_json.ObservationJsonParsingException):
+            self.reader.read(io.BytesIO(b'{"collection":"\xff"}'))
+
+        # invalid values
+        for (key, value) in (('@id', 'not a uuid'), ('intent', 'blah'),
+                             ('@lastModified', 'yesterday'), ('@schemaVersion', 1),
+                             ('planes', [5]), ('planes', 5), ('collection', 5),
+                             ('proposal', 'p'), ('target', {'name': 't', 'keywords': 1}),
+                             ('metaRelease', 5)):
+            invalid = json.loads(self.to_json(obs))
+            invalid[key] = value
+            with self.assertRaises(obs_json.ObservationJsonParsingException):
+                self.reader.read(StringIO(json.dumps(invalid)))
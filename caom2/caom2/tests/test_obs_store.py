@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#
+#  (c) 2016.                            (c) 2016.
+#  Government of Canada                 Gouvernement du Canada
+#  National Research Council            Conseil national de recherches
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+#  All rights reserved                  Tous droits réservés
+#
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie
+#  expressed, implied, or               énoncée, implicite ou légale,
+#  statutory, of any kind with          de quelque nature que ce
+#  respect to the software,             soit, concernant le logiciel,
+#  including without limitation         y compris sans restriction
+#  any warranty of merchantability      toute garantie de valeur
+#  or fitness for a particular          marchande ou de pertinence
+#  purpose. NRC shall not be            pour un usage particulier.
+#  liable in any event for any          Le CNRC ne pourra en aucun cas
+#  damages, whether direct or           être tenu responsable de tout
+#  indirect, special or general,        dommage, direct ou indirect,
+#  consequential or incidental,         particulier ou général,
+#  arising from the use of the          accessoire ou fortuit, résultant
+#  software.  Neither the name          de l'utilisation du logiciel. Ni
+#  of the National Research             le nom du Conseil National de
+#  Council of Canada nor the            Recherches du Canada ni les noms
+#  names of its contributors may        de ses  participants ne peuvent
+#  be used to endorse or promote        être utilisés pour approuver ou
+#  products derived from this           promouvoir les produits dérivés
+#  software without specific prior      de ce logiciel sans autorisation
+#  written permission.                  préalable et particulière
+#                                       par écrit.
+#
+#  This file is part of the             Ce fichier fait partie du projet
+#  OpenCADC project.                    OpenCADC.
+#
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le
+#  modify it under the terms of         modifier suivant les termes de
+#  the GNU Affero General Public        la “GNU Affero General Public
+#  License as published by the          License” telle que publiée
+#  Free Software Foundation,            par la Free Software Foundation
+#  either version 3 of the              : soit la version 3 de cette
+#  License, or (at your option)         licence, soit (à votre gré)
+#  any later version.                   toute version ultérieure.
+#
+#  OpenCADC is distributed in the       OpenCADC est distribué
+#  hope that it will be useful,         dans l’espoir qu’il vous
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE
+#  without even the implied             GARANTIE : sans même la garantie
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Defines TestObservationStore class """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from . import caom_test_generator
+from .. import artifact
+from .. import chunk
+from .. import obs_store
+from .. import observation
+from .. import part
+from .. import plane
+from .. import wcs
+
+
+def _get_observation(observation_id, product_id, uri, last_modified):
+    """:return: observation with a plane covering 500-600nm during MJD 57000.5-57001"""
+    obs = observation.SimpleObservation('collection', observation_id)
+    obs._last_modified = last_modified
+    pl = plane.Plane(product_id)
+    pl.calibration_level = plane.CalibrationLevel.CALIBRATED
+    art = artifact.Artifact(uri, chunk.ProductType.SCIENCE, artifact.ReleaseType.DATA)
+    pa = part.Part('0')
+    ch = chunk.Chunk()
+    energy_axis = wcs.CoordAxis1D(wcs.Axis('WAVE', 'nm'))
+    energy_axis.range = wcs.CoordRange1D(wcs.RefCoord(0.5, 500.0), wcs.RefCoord(100.5, 600.0))
+    ch.energy = chunk.SpectralWCS(energy_axis, 'TOPOCENT')
+    time_axis = wcs.CoordAxis1D(wcs.Axis('TIME', 's'))
+    time_axis.function = wcs.CoordFunction1D(1L, 43200.0, wcs.RefCoord(0.5, 43200.0))
+    ch.time = chunk.TemporalWCS(time_axis, mjdref=57000.0)
+    pa.chunks.append(ch)
+    art.parts['0'] = pa
+    pl.artifacts[uri] = art
+    obs.planes[product_id] = pl
+    return obs
+
+
+class TestObservationStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.date = datetime(2017, 1, 1, 10, 0, 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_put_get(self):
+        path = os.path.join(self.tmp_dir, 'observations.db')
+        generator = caom_test_generator.Caom2TestGenerator(
+            seed=1, planes=2, artifacts=2, parts=1, chunks=1)
+        observations = [generator.get_observation(i) for i in range(5)]
+        with obs_store.ObservationStore(path) as store:
+            self.assertEqual(5, store.put_all(observations))
+            self.assertEqual(5, len(store))
+            obs = store.get('collection', 'obs000000003')
+            self.assertEqual('obs000000003', obs.observation_id)
+            self.assertEqual(2, len(obs.planes))
+            self.assertIsNone(store.get('collection', 'unknown'))
+            self.assertIsNone(store.get_xml('collection', 'unknown'))
+
+        # persisted, and replaced by key
+        with obs_store.ObservationStore(path) as store:
+            self.assertEqual(5, len(store))
+            obs = store.get('collection', 'obs000000000')
+            obs.planes.pop(list(obs.planes.keys())[0])
+            store.put(obs)
+            self.assertEqual(5, len(store))
+            self.assertEqual(1, len(store.get('collection', 'obs000000000').planes))
+            self.assertEqual(9, len(store.find_planes(collection='collection')))
+
+            self.assertTrue(store.delete('collection', 'obs000000000'))
+            self.assertFalse(store.delete('collection', 'obs000000000'))
+            self.assertEqual(4, len(store))
+            self.assertEqual(8, len(store.find_planes()))
+
+    def test_put_all_transaction(self):
+        store = obs_store.ObservationStore()
+        good = _get_observation('a', 'p1', 'ad:TEST/a.fits', self.date)
+        with self.assertRaises(AssertionError):
+            store.put_all([good, 'not an observation'])
+        self.assertEqual(0, len(store))
+
+    def test_queries(self):
+        store = obs_store.ObservationStore()
+        store.put_all([
+            _get_observation('a', 'p1', 'ad:TEST/a.fits', self.date),
+            _get_observation('b', 'p2', 'ad:TEST/b.fits', self.date + timedelta(hours=1)),
+            _get_observation('c', 'p1', 'ad:TEST/c.fits', self.date + timedelta(hours=2))])
+
+        self.assertEqual([('collection', 'a', self.date),
+                          ('collection', 'b', self.date + timedelta(hours=1))],
+                         store.list(end=self.date + timedelta(hours=1)))
+        self.assertEqual(['b', 'c'], [row[1] for row in store.list(
+            collection='collection', start=self.date + timedelta(minutes=1))])
+        self.assertEqual(['a'], [row[1] for row in store.list(limit=1)])
+        self.assertEqual([], store.list(collection='other'))
+
+        self.assertEqual([('collection', 'b', 'p2')], store.find_artifact('ad:TEST/b.fits'))
+        self.assertEqual([], store.find_artifact('ad:TEST/d.fits'))
+
+        self.assertEqual(['a', 'c'], [row[1] for row in store.find_planes(product_id='p1')])
+        self.assertEqual(3, len(store.find_planes(
+            calibration_level=plane.CalibrationLevel.CALIBRATED)))
+        self.assertEqual([], store.find_planes(calibration_level=plane.CalibrationLevel.PRODUCT))
+        self.assertEqual(3, len(store.find_planes(time=(57000.9, 57002.0),
+                                                  energy=(5.5e-7, 5.6e-7))))
+        self.assertEqual([], store.find_planes(time=(57001.1, 57002.0)))
+        self.assertEqual([], store.find_planes(energy=(6.1e-7, 7e-7)))
+
+    def test_bounds(self):
+        obs = _get_observation('a', 'p1', 'ad:TEST/a.fits', self.date)
+        pl = obs.planes['p1']
+        lower, upper = obs_store._bounds(pl, 'energy', obs_store._wavelength)
+        self.assertAlmostEqual(5e-7, lower)
+        self.assertAlmostEqual(6e-7, upper)
+        self.assertEqual((57000.5, 57001.0), obs_store._bounds(pl, 'time', obs_store._time_value))
+
+        ch = pl.artifacts['ad:TEST/a.fits'].parts['0'].chunks[0]
+        ch.energy.axis.axis.ctype = 'FREQ'
+        ch.energy.axis.axis.cunit = 'GHz'
+        lower, upper = obs_store._bounds(pl, 'energy', obs_store._wavelength)
+        self.assertAlmostEqual(obs_store.SPEED_OF_LIGHT / 600e9, lower)
+        self.assertAlmostEqual(obs_store.SPEED_OF_LIGHT / 500e9, upper)
+        # not convertible
+        ch.energy.axis.axis.ctype = 'VRAD'
+        self.assertEqual((None, None), obs_store._bounds(pl, 'energy', obs_store._wavelength))
+        ch.time = None
+        self.assertEqual((None, None), obs_store._bounds(pl, 'time', obs_store._time_value))
@@ -0,0 +1,112 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+"""
+Plugin for the visit benchmarks that spends CPU time on each observation: it serializes the
+observation and parses it back a few times and walks its planes, artifacts, parts and chunks.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+from StringIO import StringIO
+
+from caom2.obs_reader_writer import ObservationReader, ObservationWriter
+from caom2.observation import Observation
+
+ROUNDS = 3
+
+
+class ObservationUpdater:
+
+    """ObservationUpdater that round-trips the observation through XML."""
+
+    def __init__(self):
+        self.reader = ObservationReader(False)
+        self.writer = ObservationWriter(False)
+
+    def update(self, observation):
+        """
+        Processes an observation and updates it
+        """
+        assert isinstance(observation, Observation), (
+            "observation {} is not an Observation".format(observation))
+        for _ in range(ROUNDS):
+            buffer = StringIO()
+            self.writer.write(observation, buffer)
+            buffer.seek(0)
+            observation = self.reader.read(buffer)
+        checksum = hashlib.md5()
+        for plane in observation.planes.values():
+            for artifact in plane.artifacts.values():
+                checksum.update(artifact.uri.encode('utf-8'))
+                for part in artifact.parts.values():
+                    for chunk in part.chunks:
+                        checksum.update(repr(chunk.naxis).encode('utf-8'))
+        return checksum.hexdigest()
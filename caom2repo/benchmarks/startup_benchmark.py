@@ -0,0 +1,164 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+"""
+Benchmark of the startup of caom2-repo-client. Each command runs in a new interpreter until
+the help of its sub-command is printed, which covers the imports and the set up of the
+argument parser but no request to the repo. The modules of the XML stack and of the HTTP
+client that each command imported are reported next to its best time:
+
+    python benchmarks/startup_benchmark.py --output before.json
+    ... change the code ...
+    python benchmarks/startup_benchmark.py --output after.json --compare before.json
+
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+COMMANDS = [[], ['list'], ['read'], ['delete'], ['visit']]
+# modules whose import is reported
+MODULES = ['lxml', 'requests', 'caom2.obs_reader_writer']
+STARTUP = """
+import json
+import sys
+sys.argv = {argv!r}
+from caom2repo.core import main
+try:
+    main()
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(m for m in {modules!r} if m in sys.modules)))
+"""
+
+
+def startup(command, repeat):
+    """
+    :param command: arguments of caom2-repo-client before --help
+    :param repeat: number of runs
+    :return: (best time in seconds, list of the MODULES imported by the command)
+    """
+    env = dict(os.environ)
+    env[str('PYTHONPATH')] = os.pathsep.join(
+        [os.path.join(THIS_DIR, os.pardir)] +
+        [p for p in [env.get(str('PYTHONPATH'))] if p])
+    statement = STARTUP.format(argv=[str('caom2-repo-client')] + [str(c) for c in command] +
+                               [str('--help')], modules=[str(m) for m in MODULES])
+    best = None
+    modules = None
+    for _ in range(repeat):
+        start = time.time()
+        process = subprocess.Popen([sys.executable, '-c', statement], env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+        elapsed = time.time() - start
+        if process.returncode != 0:
+            raise RuntimeError('{} failed: {}'.format(' '.join(command), err))
+        best = elapsed if best is None else min(best, elapsed)
+        modules = json.loads(err.strip().splitlines()[-1])
+    return best, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the startup of '
+                                                 'caom2-repo-client')
+    parser.add_argument('--repeat', type=int, default=10, help='number of runs of each command')
+    parser.add_argument('--output', help='results file (default: standard output)')
+    parser.add_argument('--compare', help='results file of a previous run to compare with')
+    args = parser.parse_args()
+
+    results = {}
+    for command in COMMANDS:
+        seconds, modules = startup(command, args.repeat)
+        results[' '.join(command) or '-'] = {'seconds': seconds, 'modules': modules}
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name in sorted(results):
+            if name in baseline:
+                print('{}: {:.3f} -> {:.3f} s ({:+.1%})'.format(
+                    name, baseline[name]['seconds'], results[name]['seconds'],
+                    results[name]['seconds'] / baseline[name]['seconds'] - 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+"""
+End-to-end benchmark of CAOM2RepoClient.visit. A synthetic collection built by
+Caom2TestGenerator is served by the RepoServer stand-in running in a separate process and
+visited with the plugins selected on the command line. Each visit runs in a fresh process so that its peak RSS is measured on its
+own. The results are written as JSON so that they can be compared across commits:
+
+    python benchmarks/visit_benchmark.py --observations 2000 --output before.json
+    ... change the code ...
+    python benchmarks/visit_benchmark.py --observations 2000 --output after.json \
+        --compare before.json
+
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from StringIO import StringIO
+
+from caom2.obs_reader_writer import ObservationWriter
+from caom2.tests.caom_test_generator import Caom2TestGenerator
+
+from caom2repo.core import CAOM2RepoClient, EQUAL_PARTITION, ADAPTIVE_PARTITION
+from caom2repo.metrics import Metrics
+from caom2repo.tests.repo_server import RepoServer
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+PLUGINS = {'pass': os.path.join(THIS_DIR, os.pardir, 'caom2repo', 'tests', 'passplugin.py'),
+           'cpu': os.path.join(THIS_DIR, 'cpuplugin.py')}
+COLLECTION = 'bench'
+RESULTS_VERSION = 1
+
+logger = logging.getLogger('visit_benchmark')
+
+
+def generate_documents(config):
+    """
+    Generates the XML documents of a synthetic collection.
+    :param config: dictionary with the number of observations, the seed and depth of the
+    Caom2TestGenerator, whether the optional attributes are set (complete) and the number of
+    planes, artifacts, parts and chunks
+    :return: generator of (observation ID, document) tuples
+    """
+    generator = Caom2TestGenerator(config['seed'], config['planes'], config['artifacts'],
+                                   config['parts'], config['chunks'], COLLECTION)
+    generator.depth = config['depth']
+    generator.complete = config['complete']
+    writer = ObservationWriter()
+    for i in range(config['observations']):
+        observation = generator.get_observation(i)
+        buffer = StringIO()
+        writer.write(observation, buffer)
+        yield observation.observation_id, buffer.getvalue()
+
+
+def _serve(conn, config):
+    """
+    Runs the RepoServer with the synthetic collection until a message is received on conn.
+    """
+    server = RepoServer(latency=config['latency'])
+    # dated in the past so that the visits, which end at the time they start, see them all
+    date = datetime.utcnow() - timedelta(days=1)
+    size = 0
+    for i, (observation_id, document) in enumerate(
+            generate_documents(config)):
+        server.store.add(COLLECTION, observation_id, document,
+                         last_modified=date + timedelta(milliseconds=i))
+        size += len(document)
+    server.start()
+    conn.send({'host': server.host, 'bytes': size})
+    conn.recv()
+    server.stop()
+
+
+def _visit(queue, host, plugin, processes, partition, batch_size):
+    """
+    Visits the collection and puts the result on the queue. Runs in its own process.
+    """
+    try:
+        metrics = Metrics()
+        client = CAOM2RepoClient(host=host, metrics=metrics)
+        begin = time.time()
+        count = client.visit(plugin, COLLECTION, processes=processes, partition=partition,
+                             batch_size=batch_size)
+        elapsed = time.time() - begin
+        queue.put({'observations': count, 'seconds': elapsed,
+                   'stages': _summarize(metrics.snapshot()),
+                   'peak_rss_kb': _peak_rss_kb()})
+    except Exception as e:
+        queue.put({'error': str(e)})
+
+
+def _summarize(snapshot):
+    """
+    :return: per-stage count, total and mean latency, bytes and errors
+    """
+    stages = {}
+    for stage, stats in snapshot.items():
+        stages[stage] = {'count': stats['count'],
+                         'seconds': round(stats['sum'], 6),
+                         'mean_ms': round(1000 * stats['sum'] / stats['count'], 3)
+                         if stats['count'] else None,
+                         'bytes': stats['bytes'],
+                         'errors': stats['errors']}
+    return stages
+
+
+def _peak_rss_kb():
+    """
+    :return: peak resident set size of this process and its terminated children in KiB
+    """
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == 'darwin':
+        # reported in bytes rather than KiB
+        rss //= 1024
+    return rss
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=THIS_DIR,
+                                       stderr=subprocess.STDOUT).strip().decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(config):
+    """
+    Runs the benchmarks.
+    :param config: dictionary of the command line arguments
+    :return: dictionary of the results
+    """
+    results = {'version': RESULTS_VERSION,
+               'commit': _commit(),
+               'date': datetime.utcnow().isoformat(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'config': config,
+               'runs': []}
+    for plugin_name in config['plugins']:
+        for processes in config['processes']:
+            for repeat in range(config['repeat']):
+                # each visit gets a fresh collection since it posts the observations back
+                conn, child_conn = multiprocessing.Pipe()
+                server = multiprocessing.Process(target=_serve, args=(child_conn, config))
+                server.start()
+                try:
+                    info = conn.recv()
+                    queue = multiprocessing.Queue()
+                    visit = multiprocessing.Process(
+                        target=_visit, args=(queue, info['host'], PLUGINS[plugin_name],
+                                             processes, config['partition'],
+                                             config['batch_size']))
+                    visit.start()
+                    result = queue.get()
+                    visit.join()
+                finally:
+                    conn.send('stop')
+                    server.join()
+                if 'error' in result:
+                    raise Exception('Visit with plugin {} failed: {}'.format(plugin_name,
+                                                                              result['error']))
+                result.update({'plugin': plugin_name, 'processes': processes, 'repeat': repeat,
+                               'collection_bytes': info['bytes'],
+                               'observations_per_second':
+                                   round(result['observations'] / result['seconds'], 3)})
+                logger.info('{plugin} processes={processes}: {observations} observations in '
+                             '{seconds:.2f}s, {observations_per_second} obs/s, peak RSS '
+                             '{peak_rss_kb} KiB'.format(**result))
+                results['runs'].append(result)
+    return results
+
+
+def compare(results, baseline):
+    """
+    :return: lines comparing the throughput of the runs of results and baseline with the same
+    plugin and number of processes
+    """
+    def best(runs):
+        rates = {}
+        for r in runs:
+            key = (r['plugin'], r['processes'])
+            rates[key] = max(rates.get(key, 0), r['observations_per_second'])
+        return rates
+
+    current = best(results['runs'])
+    previous = best(baseline['runs'])
+    lines = []
+    for key in sorted(current):
+        if key in previous:
+            lines.append('{} processes={}: {:.1f} -> {:.1f} obs/s ({:+.1%})'.format(
+                key[0], key[1], previous[key], current[key],
+                current[key] / previous[key] - 1))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of caom2repo visit')
+    parser.add_argument('--observations', type=int, default=1000,
+                        help='number of observations in the collection')
+    parser.add_argument('--depth', type=int, default=5, choices=range(1, 6),
+                        help='depth of the observations: 1 observation only, 2 planes, '
+                             '3 artifacts, 4 parts, 5 chunks')
+    parser.add_argument('--planes', type=int, default=1, help='planes per observation')
+    parser.add_argument('--artifacts', type=int, default=1, help='artifacts per plane')
+    parser.add_argument('--parts', type=int, default=1, help='parts per artifact')
+    parser.add_argument('--chunks', type=int, default=1, help='chunks per part')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic collection')
+    parser.add_argument('--minimal', action='store_true',
+                        help='leave the optional attributes of the observations unset')
+    parser.add_argument('--plugin', dest='plugins', action='append', choices=sorted(PLUGINS),
+                        help='plugin to visit with, can be repeated (default: pass and cpu)')
+    parser.add_argument('--processes', type=int, action='append',
+                        help='number of visit processes, can be repeated (default: 1)')
+    parser.add_argument('--partition', choices=[EQUAL_PARTITION, ADAPTIVE_PARTITION],
+                        default=ADAPTIVE_PARTITION,
+                        help='partition of the collection between the visit processes. The '
+                             'synthetic observations are modified within a short time so the '
+                             'equal time windows are very unbalanced')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='observations per update_batch call of the plugin')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added by the server to each request')
+    parser.add_argument('--repeat', type=int, default=1, help='number of runs of each visit')
+    parser.add_argument('--output', help='results file (default: standard output)')
+    parser.add_argument('--compare', help='results file of a previous run to compare with')
+    args = parser.parse_args()
+    # the client logs every observation at the INFO level
+    logging.basicConfig(level=logging.WARN, format='%(message)s')
+    logger.setLevel(logging.INFO)
+
+    config = {'observations': args.observations, 'depth': args.depth, 'seed': args.seed,
+              'planes': args.planes, 'artifacts': args.artifacts, 'parts': args.parts,
+              'chunks': args.chunks,
+              'complete': not args.minimal, 'plugins': args.plugins or ['pass', 'cpu'],
+              'processes': args.processes or [1], 'partition': args.partition,
+              'batch_size': args.batch_size,
+              'latency': args.latency, 'repeat': args.repeat}
+    results = run(config)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(results, json.load(f)):
+                logger.info(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,4 +13,21 @@ from ._astropy_init import *
 
 # For egg_info test builds to pass, put package imports here.
 if not _ASTROPY_SETUP_:
-   from core import *
\ No newline at end of file
+   # the submodules, and the repo client and XML stack they depend on, are imported the
+   # first time they are used
+   from caom2.caom_util import lazy_package as _lazy_package
+   _lazy_package(__name__, {
+       'core': ['CAOM2RepoClient'],
+       'shard': ['ShardedVisit', 'HashShardFilter', 'LeaseLostError'],
+       'metrics': ['Metrics', 'NullMetrics', 'NULL_METRICS'],
+       'progress': ['ProgressReporter'],
+       'offline': ['visit_local'],
+       'common': ['iter_source'],
+       'plugin': ['load_plugin', 'is_analysis_plugin'],
+       'journal': ['FailureJournal', 'read_journal'],
+       'convert': ['convert_observations', 'write_conversion_report'],
+       'sync': ['CollectionMirror'],
+       'bulk': ['read_ids', 'read_observations', 'load_observations', 'delete_observations',
+                'write_report'],
+       'listing': ['write_listing', 'read_listing'],
+       'filters': ['ListingFilter', 'AllFilters']})
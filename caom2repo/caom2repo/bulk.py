@@ -0,0 +1,376 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Bulk operations on many observations of a CAOM2 repo """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import logging
+import os
+import sys
+import tarfile
+import threading
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+import requests
+from caom2.caom_util import LazyImport
+
+from .common import DATE_FORMAT, iter_source, batches, get_tar_mode, write_atomic
+
+obs_reader_writer = LazyImport('caom2.obs_reader_writer')
+
+__all__ = ['read_ids', 'read_observations', 'load_observations', 'delete_observations',
+           'write_report']
+
+# number of concurrent requests
+DEFAULT_THREADS = 8
+# number of documents parsed at once by the worker processes of a bulk load. The documents
+# of at most two windows are in memory: the one uploaded and the next one being parsed
+DEFAULT_WINDOW = 1000
+# number of times an upload is retried after connection errors, in addition to the retries
+# of the transient HTTP errors by the client
+DEFAULT_RETRIES = 3
+RETRY_DELAY = 1
+XML_EXT = '.xml'
+# status of the observations in the reports
+OK_STATUS = 'OK'
+FAILED_STATUS = 'FAILED'
+
+
+def read_ids(source):
+    """
+    Reads a list of observation IDs, one per line. Blank lines and lines starting with #
+    are ignored, as well as anything after the first comma, so the CSV listings of a
+    collection can be used.
+    :param source: path of the file, or - for the standard input
+    :return: list of the observation IDs
+    """
+    if source == '-':
+        lines = sys.stdin
+    else:
+        lines = io.open(source, encoding='utf-8')
+    try:
+        ids = []
+        for line in lines:
+            observation_id = line.split(',', 1)[0].strip()
+            if observation_id and not observation_id.startswith('#'):
+                ids.append(observation_id)
+        return ids
+    finally:
+        if source != '-':
+            lines.close()
+
+
+def read_observations(client, collection, observation_ids, output_dir=None, archive=None,
+                      threads=DEFAULT_THREADS, namespace=None, validate=False):
+    """
+    Downloads observations concurrently, as returned by the repo, to
+    <output_dir>/<collection>/<observation ID>.xml or to the same path in a tar archive.
+    :param client: CAOM2RepoClient
+    :param collection: name of the collection
+    :param observation_ids: iterable of the IDs of the observations
+    :param output_dir: directory the observations are written to
+    :param archive: path of the tar archive the observations are written to instead of a
+                    directory, compressed if the name ends with .gz or .bz2
+    :param threads: number of concurrent downloads
+    :param namespace: CAOM-2.x namespace the observations are converted to. By default they
+                    are written as returned by the repo
+    :param validate: True to check the observations against the CAOM2 schemas
+    :return: list of (observation ID, error message or None) tuples in the order of the IDs
+    """
+    assert (output_dir is None) != (archive is None), 'output_dir or archive required'
+    assert threads >= 1
+    observation_ids = list(observation_ids)
+    client.set_max_connections(threads)
+    # readers and writers of the download threads
+    local = threading.local()
+
+    def convert(content):
+        if not hasattr(local, 'reader'):
+            local.reader = obs_reader_writer.ObservationReader(validate)
+            if namespace is not None:
+                local.writer = obs_reader_writer.ObservationWriter(validate, False, 'caom2',
+                                                                   namespace)
+        observation = local.reader.read(io.BytesIO(content))
+        if namespace is None:
+            return content
+        out = io.BytesIO()
+        local.writer.write(observation, out)
+        return out.getvalue()
+
+    def download(observation_id):
+        try:
+            content = client.get_observation_xml(collection, observation_id)
+            if namespace is not None or validate:
+                content = convert(content)
+            return observation_id, content, None
+        except Exception as e:
+            logging.debug('Failed to read {}: {}'.format(observation_id, e))
+            return observation_id, None, '{}: {}'.format(type(e).__name__, e)
+
+    if archive is not None:
+        tar = tarfile.open(archive, get_tar_mode(archive))
+    else:
+        tar = None
+        directory = os.path.join(output_dir, collection)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    errors = {}
+    pool = ThreadPool(threads)
+    try:
+        # the documents are saved by this thread as they are downloaded
+        for (observation_id, content, error) in pool.imap_unordered(download, observation_ids):
+            if error is None:
+                name = '{}/{}{}'.format(collection, observation_id, XML_EXT)
+                try:
+                    if tar is None:
+                        write_atomic(os.path.join(output_dir, name), content)
+                    else:
+                        info = tarfile.TarInfo(name)
+                        info.size = len(content)
+                        info.mtime = time.time()
+                        tar.addfile(info, io.BytesIO(content))
+                except (IOError, OSError) as e:
+                    error = '{}: {}'.format(type(e).__name__, e)
+            errors[observation_id] = error
+    finally:
+        pool.close()
+        pool.join()
+        if tar is not None:
+            tar.close()
+    failures = len([error for error in errors.values() if error is not None])
+    logging.info('Read {} observations, {} failed'.format(len(errors) - failures, failures))
+    return [(observation_id, errors[observation_id]) for observation_id in observation_ids]
+
+
+def load_observations(client, source, update=False, threads=DEFAULT_THREADS, processes=1,
+                      window=DEFAULT_WINDOW, retries=DEFAULT_RETRIES):
+    """
+    Creates or updates the observations of a directory, tar archive or glob pattern of XML
+    documents. The documents are parsed by a pool of worker processes to check them and to
+    get the key of the observations, then sent unchanged to the repo by concurrent threads.
+    :param client: CAOM2RepoClient
+    :param source: directory (searched recursively for .xml files), tar archive or glob
+                    pattern of files
+    :param update: True to update (POST) existing observations, False to create (PUT) them
+    :param threads: number of concurrent uploads
+    :param processes: number of worker processes parsing the documents
+    :param window: number of documents parsed while the previous ones are uploaded
+    :param retries: number of retries of the uploads that fail with connection errors
+    :return: list of (document name, error message or None) tuples in the order of the source
+    """
+    assert threads >= 1
+    assert processes >= 1
+    assert window >= 1
+    send = client.post_observation_xml if update else client.put_observation_xml
+    client.set_max_connections(threads)
+
+    def upload(document):
+        (name, collection, observation_id, data, error) = document
+        if error is not None:
+            return name, error
+        for retry in range(retries + 1):
+            try:
+                send(collection, observation_id, data)
+                return name, None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if retry == retries:
+                    return name, '{}: {}'.format(type(e).__name__, e)
+                logging.warn('Retrying {} after {}'.format(name, e))
+                time.sleep(RETRY_DELAY * 2 ** retry)
+            except Exception as e:
+                return name, '{}: {}'.format(type(e).__name__, e)
+
+    results = []
+    parsers = Pool(processes)
+    uploaders = ThreadPool(threads)
+    try:
+        windows = batches(iter_source(source), window)
+        batch = next(windows, None)
+        parsing = parsers.map_async(_parse, batch) if batch is not None else None
+        while parsing is not None:
+            documents = parsing.get()
+            # the next window is parsed while this one is uploaded
+            batch = next(windows, None)
+            parsing = parsers.map_async(_parse, batch) if batch is not None else None
+            results.extend(uploaders.map(upload, documents))
+            logging.info('Loaded {} observations'.format(len(results)))
+    finally:
+        parsers.close()
+        uploaders.close()
+        parsers.join()
+        uploaders.join()
+    return results
+
+
+def delete_observations(client, collection, observation_ids, threads=DEFAULT_THREADS,
+                        rate=None, journal=None):
+    """
+    Deletes observations concurrently.
+    :param client: CAOM2RepoClient
+    :param collection: name of the collection
+    :param observation_ids: iterable of the IDs of the observations
+    :param threads: number of concurrent deletes
+    :param rate: maximum number of deletes per second (default: no limit)
+    :param journal: path of the file the deleted observations are appended to, one
+                    <observation ID>,<date> line each, as soon as they are deleted
+    :return: list of (observation ID, error message or None) tuples in the order of the IDs
+    """
+    assert threads >= 1
+    assert rate is None or rate > 0
+    client.set_max_connections(threads)
+    limiter = _RateLimiter(rate) if rate else None
+    lock = threading.Lock()
+    journal_file = io.open(journal, 'a', encoding='utf-8') if journal else None
+
+    def delete(observation_id):
+        if limiter is not None:
+            limiter.wait()
+        try:
+            client.delete_observation(collection, observation_id)
+        except Exception as e:
+            logging.debug('Failed to delete {}: {}'.format(observation_id, e))
+            return observation_id, '{}: {}'.format(type(e).__name__, e)
+        if journal_file is not None:
+            with lock:
+                journal_file.write('{},{}\n'.format(
+                    observation_id, datetime.utcnow().strftime(DATE_FORMAT)))
+                journal_file.flush()
+        return observation_id, None
+
+    pool = ThreadPool(threads)
+    try:
+        results = pool.map(delete, observation_ids)
+    finally:
+        pool.close()
+        pool.join()
+        if journal_file is not None:
+            journal_file.close()
+    failures = len([error for (_, error) in results if error is not None])
+    logging.info('Deleted {} observations, {} failed'.format(len(results) - failures, failures))
+    return results
+
+
+class _RateLimiter(object):
+    """
+    Spaces the calls of wait by the threads sharing it so that they return at most rate
+    times per second.
+    """
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate
+        self._next = time.time()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _parse(item):
+    """
+    Parses a document. Runs in the worker processes of load_observations.
+    :param item: (name, path, data) tuple of iter_source
+    :return: tuple of (name, collection, observation ID, data, error message or None)
+    """
+    (name, path, data) = item
+    try:
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        observation = obs_reader_writer.ObservationReader().read(io.BytesIO(data))
+        return name, observation.collection, observation.observation_id, data, None
+    except Exception as e:
+        return name, None, None, None, '{}: {}'.format(type(e).__name__, e)
+
+
+def write_report(results, out):
+    """
+    Writes the status of each observation of a bulk operation
+    :param results: list of (observation ID, error message or None) tuples
+    :param out: file-like object the report is written to
+    :return: number of failed observations
+    """
+    failures = 0
+    for (observation_id, error) in results:
+        if error is None:
+            out.write('{}\t{}\n'.format(observation_id, OK_STATUS))
+        else:
+            out.write('{}\t{}\t{}\n'.format(observation_id, FAILED_STATUS, error))
+            failures += 1
+    return failures
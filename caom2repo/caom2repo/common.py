@@ -0,0 +1,230 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Helpers shared by the commands that read and write many observation documents """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import glob
+import os
+import posixpath
+import socket
+import tarfile
+import threading
+from collections import deque
+
+from caom2.caom_util import LazyImport
+
+obs_reader_writer = LazyImport('caom2.obs_reader_writer')
+
+__all__ = ['DATE_FORMAT', 'iter_source', 'batches', 'imap_bounded', 'get_document_namespace',
+           'get_tar_mode', 'write_atomic']
+
+# format of the dates of the repo listings, the journals and the checkpoints
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+# number of tasks queued for each worker process. The source is read ahead by at most that
+# many batches, so that the documents of a large archive are not all in memory at once
+TASKS_PER_PROCESS = 2
+# the namespace is declared on the root element, at the start of the documents
+NAMESPACE_PREFIX_SIZE = 2048
+
+
+def iter_source(source):
+    """
+    Lists the observation documents of a source without reading them, except for the members
+    of tar archives that are read sequentially.
+    :param source: directory (searched recursively for .xml files), tar archive (optionally
+    compressed) or glob pattern of files
+    :return: generator of (name, path, data) tuples, where name is the path of the document
+    relative to the source, and either path is the path of the file or data its content
+    :raise ValueError: for tar members with an absolute name or a name containing ..
+    """
+    if os.path.isdir(source):
+        for (dirpath, dirnames, filenames) in os.walk(source):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith('.xml'):
+                    path = os.path.join(dirpath, filename)
+                    yield os.path.relpath(path, source), path, None
+    elif os.path.isfile(source) and tarfile.is_tarfile(source):
+        # streaming mode: the members are read in order without seeking
+        with tarfile.open(source, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith('.xml'):
+                    yield _member_name(member.name), None, archive.extractfile(member).read()
+    else:
+        for path in glob.iglob(source):
+            if os.path.isfile(path):
+                yield os.path.basename(path), path, None
+
+
+def _member_name(name):
+    """
+    :return: the normalized name of a tar member, used as a path relative to the output
+    :raise ValueError: for absolute names and names outside of the archive
+    """
+    normalized = posixpath.normpath(name)
+    if posixpath.isabs(normalized) or normalized == '..' or normalized.startswith('../'):
+        raise ValueError('Unsafe name of tar member: {}'.format(name))
+    return normalized
+
+
+def batches(items, size):
+    """
+    :return: generator of lists of at most size consecutive items
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def imap_bounded(pool, func, tasks, processes):
+    """
+    Like pool.imap, but reads the next tasks only when previous results are consumed, so
+    that at most TASKS_PER_PROCESS tasks per worker process are queued at once.
+    :return: generator of the results in the order of the tasks
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= processes * TASKS_PER_PROCESS:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def get_document_namespace(data):
+    """
+    :return: CAOM2 namespace of the document data, or None if it is not found
+    """
+    prefix = data[:NAMESPACE_PREFIX_SIZE]
+    namespace = None
+    for ns in (obs_reader_writer.CAOM20_NAMESPACE, obs_reader_writer.CAOM21_NAMESPACE,
+               obs_reader_writer.CAOM22_NAMESPACE):
+        if ns.encode('utf-8') in prefix:
+            namespace = ns
+    return namespace
+
+
+def get_tar_mode(path):
+    """
+    :return: mode of tarfile.open that writes an archive compressed as its extension says
+    """
+    if path.endswith('.gz') or path.endswith('.tgz'):
+        return 'w:gz'
+    if path.endswith('.bz2'):
+        return 'w:bz2'
+    return 'w'
+
+
+def write_atomic(path, content, overwrite=True):
+    """
+    Writes a file so that it is never seen partially written, by other threads, processes
+    or hosts: the content is written to a temporary file renamed to path. The directory of
+    the file is created if needed.
+    :param content: bytes, or function called with the temporary file open in binary mode
+    :param overwrite: if False, the file is not replaced when it already exists
+    :return: False if overwrite is False and the file already exists, True otherwise
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created by another writer in the meantime
+            if not os.path.isdir(directory):
+                raise
+    tmp_path = '{}.{}-{}-{}.tmp'.format(path, socket.gethostname(), os.getpid(),
+                                        threading.current_thread().ident)
+    with open(tmp_path, 'wb') as f:
+        if callable(content):
+            content(f)
+        else:
+            f.write(content)
+    try:
+        if overwrite:
+            os.rename(tmp_path, path)
+        else:
+            # link fails when the destination exists, unlike rename
+            os.link(tmp_path, path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
@@ -0,0 +1,257 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Conversion of observation documents between the versions of CAOM2 """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import logging
+import os
+import tarfile
+import time
+from multiprocessing import Pool
+
+from caom2.caom_util import LazyImport
+
+from .bulk import FAILED_STATUS, OK_STATUS
+from .common import iter_source, batches, imap_bounded, get_document_namespace, get_tar_mode, \
+    write_atomic
+from .offline import DEFAULT_TASK_SIZE
+
+obs_reader_writer = LazyImport('caom2.obs_reader_writer')
+
+__all__ = ['convert_observations', 'write_conversion_report']
+
+# versions of CAOM2 the documents can be converted to
+VERSIONS = ['2.0', '2.1', '2.2']
+# status of the documents written without some of the content of the original
+LOSSY_STATUS = 'LOSSY'
+
+# state of the worker processes, set by _init_worker
+_reader = None
+_writer = None
+_version = None
+
+
+def get_namespace(version):
+    """
+    :param version: one of VERSIONS
+    :return: the namespace of the documents of this version of CAOM2
+    """
+    return {'2.0': obs_reader_writer.CAOM20_NAMESPACE,
+            '2.1': obs_reader_writer.CAOM21_NAMESPACE,
+            '2.2': obs_reader_writer.CAOM22_NAMESPACE}[version]
+
+
+def _get_version(namespace):
+    for version in VERSIONS:
+        if get_namespace(version) == namespace:
+            return version
+    return None
+
+
+def _init_worker(version, validate):
+    global _reader, _writer, _version
+    _reader = obs_reader_writer.ObservationReader(validate)
+    _writer = obs_reader_writer.ObservationWriter(validate, False, 'caom2',
+                                                  get_namespace(version))
+    _version = version
+
+
+def get_losses(observation, source_version, version):
+    """
+    Lists the content of an observation that the documents of a version of CAOM2 cannot hold.
+    The UUIDs that cannot be represented in CAOM-2.0 are not listed: the conversion of the
+    observation to CAOM-2.0 fails instead.
+    :param observation: the observation read from a document
+    :param source_version: version of the document, or None if unknown
+    :param version: version the observation is converted to
+    :return: list of descriptions of the lost content
+    """
+    losses = []
+    if version < '2.1':
+        if observation.requirements is not None:
+            losses.append('requirements')
+        for plane in observation.planes.values():
+            if plane.quality is not None:
+                losses.append('quality of plane {}'.format(plane.product_id))
+    if version < '2.2' and source_version == '2.2':
+        # set to a default by the reader of older documents
+        for plane in observation.planes.values():
+            for artifact in plane.artifacts.values():
+                losses.append('release type of artifact {}'.format(artifact.uri))
+    return losses
+
+
+def _convert_batch(batch):
+    """
+    Converts a batch of documents. Runs in the worker processes.
+    :param batch: list of (name, path, data) tuples
+    :return: list of (name, converted document or None, list of losses, error message or
+             None) tuples
+    """
+    results = []
+    for (name, path, data) in batch:
+        try:
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            observation = _reader.read(io.BytesIO(data))
+            losses = get_losses(observation, _get_version(get_document_namespace(data)), _version)
+            output = io.BytesIO()
+            _writer.write(observation, output)
+            results.append((name, output.getvalue(), losses, None))
+        except Exception as e:
+            results.append((name, None, [], '{}: {}'.format(type(e).__name__, e)))
+    return results
+
+
+def convert_observations(source, version, output_dir=None, archive=None, processes=1,
+                         batch_size=DEFAULT_TASK_SIZE, validate=False):
+    """
+    Converts the observation documents of a directory, tar archive or glob pattern from any
+    version of CAOM2 to another one. The documents are converted in batches by a pool of
+    worker processes and written by this process to output_dir or to a tar archive, at the
+    same path relative to the source. Documents that cannot be converted are reported
+    without interrupting the conversion of the others.
+    :param source: directory (searched recursively for .xml files), tar archive or glob
+                   pattern of files
+    :param version: version of CAOM2 the documents are converted to, one of VERSIONS
+    :param output_dir: directory the converted documents are written to
+    :param archive: path of the tar archive the converted documents are written to instead of
+                    a directory, compressed if the name ends with .gz or .bz2
+    :param processes: number of worker processes
+    :param batch_size: number of documents per task sent to a worker process
+    :param validate: True to validate the documents read and written against the schemas
+    :return: list of (document name, list of the content lost by the conversion, error
+             message or None) tuples in the order of the source
+    """
+    assert (output_dir is None) != (archive is None), 'output_dir or archive required'
+    assert version in VERSIONS, 'invalid version {}'.format(version)
+    assert processes >= 1
+    assert batch_size >= 1
+    tasks = batches(iter_source(source), batch_size)
+    if archive is not None:
+        tar = tarfile.open(archive, get_tar_mode(archive))
+    else:
+        tar = None
+    results = []
+    pool = None
+    try:
+        if processes > 1:
+            pool = Pool(processes, _init_worker, (version, validate))
+            converted = imap_bounded(pool, _convert_batch, tasks, processes)
+        else:
+            _init_worker(version, validate)
+            converted = (_convert_batch(batch) for batch in tasks)
+        for batch_results in converted:
+            for (name, content, losses, error) in batch_results:
+                if error is None:
+                    try:
+                        if tar is None:
+                            write_atomic(os.path.join(output_dir, name), content)
+                        else:
+                            info = tarfile.TarInfo(name)
+                            info.size = len(content)
+                            info.mtime = time.time()
+                            tar.addfile(info, io.BytesIO(content))
+                    except (IOError, OSError) as e:
+                        error = '{}: {}'.format(type(e).__name__, e)
+                results.append((name, losses, error))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if tar is not None:
+            tar.close()
+    failures = len([error for (_, _, error) in results if error is not None])
+    logging.info('Converted {} observations from {} to CAOM-{}, {} failed'.format(
+        len(results) - failures, source, version, failures))
+    return results
+
+
+def write_conversion_report(results, out):
+    """
+    Writes the status of each document of a conversion
+    :param results: list of (document name, list of losses, error message or None) tuples
+    :param out: file-like object the report is written to
+    :return: number of documents that could not be converted
+    """
+    failures = 0
+    for (name, losses, error) in results:
+        if error is not None:
+            out.write('{}\t{}\t{}\n'.format(name, FAILED_STATUS, error))
+            failures += 1
+        elif losses:
+            out.write('{}\t{}\t{}\n'.format(name, LOSSY_STATUS, ', '.join(losses)))
+        else:
+            out.write('{}\t{}\n'.format(name, OK_STATUS))
+    return failures
@@ -71,47 +71,107 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import argparse
-import imp
+import difflib
+import io
+import itertools
+import json
 import logging
 import os
 import os.path
 import sys
+import threading
+import time
 from StringIO import StringIO
-from datetime import datetime
+from datetime import datetime, timedelta
+from multiprocessing import Pool
 
+import requests
 from cadcutils import net
 from cadcutils import util
-from caom2.obs_reader_writer import ObservationReader, ObservationWriter
+from caom2.caom_util import LazyImport
 from caom2.version import version as caom2_version
 from six.moves.urllib.parse import urlparse
 
+# not imported by the commands that do not parse or write observations
+obs_reader_writer = LazyImport('caom2.obs_reader_writer')
+
 # from . import version as caom2repo_version
 from . import version
+from .bulk import read_ids, read_observations, load_observations, delete_observations, \
+    write_report, DEFAULT_THREADS
+from .common import DATE_FORMAT
+from .convert import convert_observations, write_conversion_report, get_namespace, \
+    VERSIONS as CAOM_VERSIONS
+from .filters import AllFilters, ListingFilter
+from .journal import FailureJournal, read_journal, GET_STAGE, PLUGIN_STAGE, POST_STAGE, \
+    WRITE_STAGE
+from .listing import read_listing, write_listing
+from .metrics import Metrics, NULL_METRICS, PROMETHEUS_FORMAT, JSONL_FORMAT
+from .offline import visit_local
+from .plugin import load_plugin, is_analysis_plugin
+from .progress import ProgressReporter, DEFAULT_INTERVAL as DEFAULT_PROGRESS_INTERVAL
+from .shard import ShardedVisit, TIME_SHARDS, HASH_SHARDS, DEFAULT_LEASE_TTL
+from .sync import CollectionMirror
 
 __all__ = ['CAOM2RepoClient']
 
 BATCH_SIZE = int(10000)
 # TODO replace with SERVICE_URI when server supports it
 SERVICE_URL = 'www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/'
-# IVOA dateformat
-DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
 DEFAULT_RESOURCE_ID = 'ivo://cadc.nrc.ca/caom2repo'
+# strategies used to split a visit into sub-ranges (see CAOM2RepoClient.visit)
+EQUAL_PARTITION = 'equal'
+ADAPTIVE_PARTITION = 'adaptive'
+# gap between consecutive sub-ranges so that their (inclusive) bounds do not overlap
+PARTITION_GAP = timedelta(microseconds=1)
+# number of observations passed to the update_batch method of the plugins that implement it
+DEFAULT_UPDATE_BATCH_SIZE = 100
+# size of the blocks of the documents streamed by read
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 class CAOM2RepoClient:
 
     """Class to do CRUD + visitor actions on a CAOM2 collection repo."""
 
-    def __init__(self, resource_id=DEFAULT_RESOURCE_ID, anon=True, cert_file=None, host=None):
+    def __init__(self, resource_id=DEFAULT_RESOURCE_ID, anon=True, cert_file=None, host=None,
+                 metrics=None, progress=None, validate=False, namespace=None):
         """
         Instance of a CAOM2RepoClient
         :param resource_id: The identifier of the service resource (e.g 'ivo://cadc.nrc.ca/caom2repo')
         :param anon: True if anonymous access, False otherwise
         :param cert_file: Location of X509 certificate used for authentication
         :param host: Host server for the caom2repo service
+        :param metrics: optional caom2repo.metrics.Metrics collecting the latency, bytes and
+                        errors of each stage of the operations. Not collected by default
+        :param progress: optional caom2repo.progress.ProgressReporter reporting the progress
+                        of the visits
+        :param validate: True to validate the observations read from and sent to the repo
+                        against the CAOM2 schemas
+        :param namespace: CAOM2 namespace of the documents sent to the repo. Defaults to the
+                        latest version
         """
 
         self.resource_id = resource_id
+        # arguments required to build an equivalent client in a worker process
+        self._client_args = {'resource_id': resource_id, 'anon': anon,
+                             'cert_file': cert_file, 'host': host,
+                             'validate': validate, 'namespace': namespace}
+        self.metrics = NULL_METRICS if metrics is None else metrics
+        self.progress = progress
+        # output of the dry runs of visit
+        self._output_dir = None
+        self._diff = False
+        # FailureJournal of the failure-tolerant visits
+        self._journal = None
+        # aggregate computed by the map and reduce methods of an analysis plugin
+        self.result = None
+        self._reduced = False
+        # readers and writers are built once per thread, as their schemas are costly to
+        # build and are not shared between threads
+        self._validate = validate
+        self._namespace = namespace
+        self._local = threading.local()
 
         # TODO This is just a temporary hack to be replaced with proper registry lookup functionaliy
         resource_url = urlparse(resource_id)
@@ -125,7 +185,9 @@ class CAOM2RepoClient:
                                              agent=agent, retry=True, host=self.host)
         logging.info('Service URL: {}'.format(self._repo_client.base_url))
 
-    def visit(self, plugin, collection, start=None, end=None):
+    def visit(self, plugin, collection, start=None, end=None, processes=1,
+              partition=EQUAL_PARTITION, accept=None, batch_size=DEFAULT_UPDATE_BATCH_SIZE,
+              output_dir=None, diff=False, journal=None):
         """
         Main processing function that iterates through the observations of
         the collection and updates them according to the algorithm
@@ -134,7 +196,29 @@ class CAOM2RepoClient:
                         observations
         :param collection: name of the CAOM2 collection
         :param start: optional earliest date-time of the targeted observation set
-        :param end: optional latest date-time of the targeted observation set
+        :param end: optional latest date-time of the targeted observation set. Defaults to the
+                        time the visit starts
+        :param processes: number of worker processes. When greater than 1, the [start, end]
+                        interval is split into sub-ranges that are visited in parallel, each
+                        with its own client and plugin instance
+        :param partition: how the interval is split between the worker processes:
+                        EQUAL_PARTITION for equal time windows or ADAPTIVE_PARTITION for
+                        windows with the same number of observations in the listing
+        :param accept: optional function called with the ID and last modified date of each
+                        listed observation, e.g. a ListingFilter. The observations it returns
+                        False for are skipped without being read. It must be picklable when
+                        processes is greater than 1. Plugins can also implement an accept
+                        method with the same arguments, combined with this function
+        :param batch_size: maximum number of observations passed at once to the update_batch
+                        method of the plugin. Ignored by plugins that only implement update
+        :param output_dir: dry run: the updated observations are written to
+                        <output_dir>/<collection>/<observation ID>.xml instead of being posted
+                        to the repo
+        :param diff: with output_dir, also write the changes made by the plugin as a unified
+                        diff to <observation ID>.diff
+        :param journal: failure-tolerant visit: path of the FailureJournal file the observations
+                        that fail to be read, updated or saved are recorded in, instead of
+                        aborting the visit
         :return: number of visited observations
         """
         if not os.path.isfile(plugin):
@@ -144,73 +228,480 @@ class CAOM2RepoClient:
             assert type(start) is datetime
         if end is not None:
             assert type(end) is datetime
+        assert processes >= 1
+        assert batch_size >= 1
+        if end is None:
+            # observations posted back by the visit move to the end of the listing and must not
+            # be visited again
+            end = datetime.utcnow()
+        if processes > 1:
+            return self._visit_partitioned(plugin, collection, start, end, processes, partition,
+                                           {'accept': accept, 'batch_size': batch_size,
+                                            'output_dir': output_dir, 'diff': diff,
+                                            'journal': journal})
+        self._init_visit(plugin, output_dir, diff, journal)
+        if not hasattr(self.plugin, 'update_batch'):
+            batch_size = 1
+        if hasattr(self.plugin, 'accept'):
+            accept = AllFilters(accept, self.plugin.accept)
+
+        count = 0
+        pending = []
+        if self.progress is not None:
+            self.progress.begin(start, end)
+        # list_observations skips the rows repeated at the boundaries of the pages of the
+        # listing, which would otherwise be visited twice when nothing is posted back
+        rows = self.list_observations(collection, start, end)
+        while True:
+            page = list(itertools.islice(rows, BATCH_SIZE))
+            # filtered before getting the observations
+            accepted = [observationID for (observationID, last_modified) in page
+                        if accept is None or accept(observationID, last_modified)]
+            if self.progress is not None:
+                self.progress.listed(len(accepted), page[-1][1] if page else None,
+                                     len(page) < BATCH_SIZE)
+            for observationID in accepted:
+                pending.append(observationID)
+                if len(pending) == batch_size:
+                    count += self._process_observations(collection, pending)
+                    pending = []
+            if len(page) < BATCH_SIZE:
+                break
+        if pending:
+            count += self._process_observations(collection, pending)
+        self.metrics.export()
+        if self.progress is not None:
+            self.progress.finish()
+        if self._journal is not None and self._journal.count:
+            logging.warn('{} observations failed, see {}'.format(self._journal.count, journal))
+        return count
+
+    def analyze(self, plugin, collection, **kwargs):
+        """
+        Read-only visit computing an aggregate of the observations of a collection with an
+        analysis plugin implementing:
+
+            map(observation): returns a partial result computed from an observation
+            reduce(a, b): combines two partial results
+
+        The partial results of the worker processes are combined by the visiting process, so
+        they must be picklable. Nothing is written to the repo.
+        :param plugin: path to python file that contains the analysis plugin
+        :param collection: name of the CAOM2 collection
+        :param kwargs: additional arguments of visit, e.g. start, end, processes or accept
+        :return: the aggregate, or None if no observation was visited
+        """
+        self.visit(plugin, collection, **kwargs)
+        return self.result
+
+    def visit_observations(self, plugin, collection, observation_ids, processes=1,
+                           batch_size=DEFAULT_UPDATE_BATCH_SIZE, output_dir=None, diff=False,
+                           journal=None, accept=None):
+        """
+        Visits a list of observations of a collection, e.g. the failures of a previous visit
+        read from its journal with read_journal.
+        :param plugin: path to python file that contains the algorithm to be applied to visited
+                        observations
+        :param collection: name of the CAOM2 collection
+        :param observation_ids: IDs of the observations to visit, or (observation ID, last
+                        modified) rows of a listing read with read_listing
+        :param processes: number of worker processes, each visiting a part of the list
+        :param batch_size, output_dir, diff, journal: as in visit
+        :param accept: optional filter of the observations, as in visit. Combined with the
+                        accept method of the plugin. The last modified date is None for IDs
+        :return: number of visited observations
+        """
+        if not os.path.isfile(plugin):
+            raise Exception('Cannot find plugin file ' + plugin)
+        assert collection is not None
+        assert processes >= 1
+        assert batch_size >= 1
+        visit_args = {'batch_size': batch_size, 'output_dir': output_dir, 'diff': diff,
+                      'journal': journal, 'accept': accept}
+        if processes > 1 and len(observation_ids) > 1:
+            return self._visit_observations_partitioned(plugin, collection, observation_ids,
+                                                        processes, visit_args)
+        self._init_visit(plugin, output_dir, diff, journal)
+        if not hasattr(self.plugin, 'update_batch'):
+            batch_size = 1
+        if hasattr(self.plugin, 'accept'):
+            accept = AllFilters(accept, self.plugin.accept)
+        rows = [row if isinstance(row, tuple) else (row, None) for row in observation_ids]
+        observation_ids = [observation_id for (observation_id, last_modified) in rows
+                           if accept is None or accept(observation_id, last_modified)]
+        count = 0
+        for i in range(0, len(observation_ids), batch_size):
+            count += self._process_observations(collection, observation_ids[i:i + batch_size])
+        self.metrics.export()
+        if self._journal is not None and self._journal.count:
+            logging.warn('{} observations failed, see {}'.format(self._journal.count, journal))
+        return count
+
+    def _visit_observations_partitioned(self, plugin, collection, observation_ids, processes,
+                                        visit_args):
+        """
+        Splits a list of observations into parts visited in separate worker processes.
+        :return: total number of visited observations
+        """
+        n = min(processes, len(observation_ids))
+        tasks = [(self._client_args, plugin, collection, observation_ids[i::n], visit_args,
+                  self.metrics.enabled) for i in range(n)]
+        count = 0
+        failures = []
+        # the plugin of this process combines the partial results of the workers
+        self._init_visit(plugin)
+        pool = Pool(n)
+        try:
+            for (visited, error, metrics, result) in pool.imap_unordered(_visit_ids, tasks):
+                count += visited
+                self.metrics.merge(metrics)
+                self._merge_result(*result)
+                if error is not None:
+                    failures.append(error)
+        finally:
+            pool.close()
+            pool.join()
+        self.metrics.export()
+        if failures:
+            raise Exception('Failed to visit {} of {} parts after visiting {} observations:\n{}'.
+                            format(len(failures), n, count, '\n'.join(failures)))
+        return count
+
+    def _init_visit(self, plugin, output_dir=None, diff=False, journal=None):
+        """
+        Loads the plugin and resets the state of a visit
+        """
         self._load_plugin_class(plugin)
+        self._output_dir = output_dir
+        self._diff = diff
+        self._journal = FailureJournal(journal) if journal else None
+        self.result = None
+        self._reduced = False
 
-        # this is updated by _get_observations with the timestamp of last observation in the batch
-        self._start = start
+    def _merge_result(self, reduced, result):
+        """
+        Combines a partial result of an analysis plugin with the aggregate
+        :param reduced: False if the partial result is empty
+        :param result: the partial result
+        """
+        if not reduced:
+            return
+        if self._reduced:
+            self.result = self.plugin.reduce(self.result, result)
+        else:
+            self.result = result
+            self._reduced = True
+
+    def _analyze_observations(self, collection, observations):
+        """
+        Maps observations with an analysis plugin and reduces the results into the aggregate
+        :return: number of analyzed observations
+        """
         count = 0
-        observations = self._get_observations(collection, self._start, end)
-        while len(observations) > 0:
-            for observationID in observations:
+        for observation in observations:
+            try:
+                with self.metrics.timer('plugin'):
+                    self._merge_result(True, self.plugin.map(observation))
+                count += 1
+            except Exception as e:
+                if self._journal is None:
+                    raise
+                self._journal.record(collection, observation.observation_id, PLUGIN_STAGE, e)
+        return count
+
+    def _process_observations(self, collection, observation_ids):
+        """
+        Gets observations, updates them with the plugin and posts them back to the repo, or
+        writes them to the output directory of a dry run. The observations are passed all at
+        once to the update_batch method of the plugin if it has one and one by one to its
+        update method otherwise.
+        :param collection: name of the collection
+        :param observation_ids: IDs of the observations to process
+        :return: number of processed observations
+        """
+        start_time = time.time()
+        observations = []
+        for observationID in observation_ids:
+            try:
                 observation = self.get_observation(collection, observationID)
-                logging.info("Process observation: " + observation.observation_id)
-                self.plugin.update(observation)
-                self.post_observation(observation)
+            except Exception as e:
+                if self._journal is None:
+                    raise
+                self._journal.record(collection, observationID, GET_STAGE, e)
+                continue
+            logging.info("Process observation: " + observation.observation_id)
+            observations.append(observation)
+        if is_analysis_plugin(self.plugin):
+            # read-only
+            count = self._analyze_observations(collection, observations)
+            if self.progress is not None:
+                self.progress.observations_visited(count, time.time() - start_time)
+            return count
+        originals = {}
+        if self._output_dir is not None and self._diff:
+            originals = dict((observation.observation_id, self._to_xml(observation))
+                             for observation in observations)
+        if hasattr(self.plugin, 'update_batch'):
+            try:
+                with self.metrics.timer('plugin'):
+                    self.plugin.update_batch(observations)
+            except Exception as e:
+                if self._journal is None:
+                    raise
+                # the observation that caused the failure is unknown
+                for observation in observations:
+                    self._journal.record(collection, observation.observation_id,
+                                         PLUGIN_STAGE, e)
+                observations = []
+        else:
+            updated = []
+            for observation in observations:
+                try:
+                    with self.metrics.timer('plugin'):
+                        self.plugin.update(observation)
+                    updated.append(observation)
+                except Exception as e:
+                    if self._journal is None:
+                        raise
+                    self._journal.record(collection, observation.observation_id,
+                                         PLUGIN_STAGE, e)
+            observations = updated
+        count = 0
+        for observation in observations:
+            try:
+                if self._output_dir is None:
+                    self.post_observation(observation)
+                else:
+                    self._write_observation(observation,
+                                            originals.get(observation.observation_id))
                 count += 1
-            if len(observations) == BATCH_SIZE:
-                observations = self._get_observations(collection)
-            else:
-                # the last batch was smaller so it must have been the last
-                break
+            except Exception as e:
+                if self._journal is None:
+                    raise
+                self._journal.record(collection, observation.observation_id,
+                                     POST_STAGE if self._output_dir is None else WRITE_STAGE, e)
+        if self.progress is not None:
+            self.progress.observations_visited(count, time.time() - start_time)
         return count
 
+    def _write_observation(self, observation, original=None):
+        """
+        Writes an observation visited by a dry run to the output directory
+        :param observation: the updated observation
+        :param original: optional XML document of the observation before the update, to write
+                        the changes made by the plugin as a diff next to it
+        """
+        directory = os.path.join(self._output_dir, observation.collection)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another worker process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        with self.metrics.timer('serialize'):
+            obs_xml = self._to_xml(observation)
+        path = os.path.join(directory, observation.observation_id)
+        with self.metrics.timer('write'):
+            with open(path + '.xml', 'w') as f:
+                f.write(obs_xml)
+            if original is not None:
+                name = observation.observation_id + '.xml'
+                changes = ''.join(difflib.unified_diff(
+                    original.splitlines(True), obs_xml.splitlines(True),
+                    'a/' + name, 'b/' + name))
+                if changes:
+                    with open(path + '.diff', 'w') as f:
+                        f.write(changes)
+        self.metrics.add_bytes('write', len(obs_xml))
+
+    def _visit_partitioned(self, plugin, collection, start, end, processes, partition, visit_args):
+        """
+        Splits the [start, end] interval into sub-ranges and visits each of them in a
+        separate worker process.
+        :param visit_args: dictionary of additional arguments of the visit of each sub-range
+        :return: total number of visited observations
+        """
+        ranges = self._partition(collection, start, end, processes, partition)
+        if not ranges:
+            return 0
+        logging.info('Visit {} sub-ranges in {} processes'.format(len(ranges), processes))
+        tasks = [(self._client_args, plugin, collection, sub_start, sub_end, visit_args,
+                  self.metrics.enabled, slot)
+                 for (slot, (sub_start, sub_end)) in enumerate(ranges)]
+        count = 0
+        failures = []
+        shared_progress = None
+        if self.progress is not None:
+            self.progress.begin(start, end)
+            shared_progress = self.progress.share(len(tasks))
+            self.progress.watch(shared_progress)
+        # the plugin of this process combines the partial results of the workers
+        self._init_visit(plugin)
+        pool = Pool(min(processes, len(tasks)), _init_worker, (shared_progress,))
+        try:
+            for (sub_start, sub_end, visited, error, metrics, result) in \
+                    pool.imap_unordered(_visit_range, tasks):
+                count += visited
+                self.metrics.merge(metrics)
+                self._merge_result(*result)
+                if error is not None:
+                    failures.append('[{}, {}]: {}'.format(sub_start, sub_end, error))
+        finally:
+            pool.close()
+            pool.join()
+            if self.progress is not None:
+                self.progress.finish()
+        self.metrics.export()
+        if failures:
+            raise Exception('Failed to visit {} of {} sub-ranges after visiting {} observations:\n{}'.
+                            format(len(failures), len(ranges), count, '\n'.join(failures)))
+        return count
+
+    def _partition(self, collection, start, end, n, partition=EQUAL_PARTITION):
+        """
+        Splits the [start, end] interval into n sub-ranges.
+        :param partition: EQUAL_PARTITION or ADAPTIVE_PARTITION
+        :return: list of (start, end) sub-ranges
+        """
+        if partition == EQUAL_PARTITION:
+            return self._equal_partition(collection, start, end, n)
+        elif partition == ADAPTIVE_PARTITION:
+            return self._adaptive_partition(collection, start, end, n)
+        else:
+            raise ValueError('Unknown partition strategy: {}'.format(partition))
+
+    def _equal_partition(self, collection, start, end, n):
+        """
+        Splits the [start, end] interval into n time windows of equal length. A missing start
+        is replaced by the date of the oldest observation in the collection and a missing end
+        by the current time.
+        :return: list of (start, end) sub-ranges
+        """
+        lower = start
+        if lower is None:
+            first = self._get_listing(collection, None, end, maxrec=1)
+            if not first:
+                return []
+            lower = first[0][1]
+        upper = end
+        if upper is None:
+            upper = datetime.utcnow()
+        if upper <= lower:
+            return [(start, end)]
+        step = (upper - lower) // n
+        return _split_range(start, end, [lower + step * i for i in range(1, n)])
+
+    def _adaptive_partition(self, collection, start, end, n):
+        """
+        Splits the [start, end] interval into n time windows that contain approximately the
+        same number of observations according to the listing of the collection.
+        :return: list of (start, end) sub-ranges
+        """
+        dates = [last_modified for (_, last_modified) in
+                 self.list_observations(collection, start, end)]
+        if not dates:
+            return []
+        boundaries = [dates[len(dates) * i // n - 1] for i in range(1, n)]
+        return _split_range(start, end, boundaries)
+
     def _get_observations(self, collection, start=None, end=None):
         """
         Returns a list of datasets from the collection
         :param collection: name of the collection
         :param start: earliest observation
         :param end: latest observation
-        :return:
+        :return: list of (observation ID, last modified date) tuples in last modified order
+        """
+        rows = self._get_listing(collection, start, end)
+        if len(rows) > 0:
+            self._start = rows[-1][1]
+        return rows
+
+    def _get_listing(self, collection, start=None, end=None, maxrec=None):
+        """
+        Returns a page of the listing of a collection
+        :param collection: name of the collection
+        :param start: earliest observation
+        :param end: latest observation
+        :param maxrec: maximum number of rows in the page (default BATCH_SIZE)
+        :return: list of (observation ID, last modified date) tuples in last modified order
         """
         assert collection is not None
-        observations = []
-        params = {'MAXREC': BATCH_SIZE}
+        rows = []
+        params = {'MAXREC': BATCH_SIZE if maxrec is None else maxrec}
         if start is not None:
             params['START'] = start.strftime(DATE_FORMAT)
         if end is not None:
             params['END'] = end.strftime(DATE_FORMAT)
 
-        response = self._repo_client.get(collection, params=params)
-        last_datetime = None
+        with self.metrics.timer('list'):
+            response = self._repo_client.get(collection, params=params)
+        self.metrics.add_bytes('list', len(response.content))
         for line in response.content.splitlines():
             (obs, last_datetime) = line.split(',')
-            observations.append(obs)
-        if last_datetime is not None:
-            self._start = datetime.strptime(last_datetime, DATE_FORMAT)
-        return observations
+            rows.append((obs, datetime.strptime(last_datetime, DATE_FORMAT)))
+        return rows
+
+    def list_observations(self, collection, start=None, end=None):
+        """
+        Lists the observations of a collection, paging through the listing of the repo
+        :param collection: name of the collection
+        :param start: earliest observation
+        :param end: latest observation
+        :return: iterator of (observation ID, last modified date) tuples in last modified order
+        """
+        # pages start at the date of the last row of the previous one, whose rows are skipped
+        seen = set()
+        while True:
+            rows = self._get_listing(collection, start, end)
+            for (observation_id, last_modified) in rows:
+                if last_modified != start:
+                    start = last_modified
+                    seen = set()
+                if observation_id not in seen:
+                    seen.add(observation_id)
+                    yield observation_id, last_modified
+            if len(rows) < BATCH_SIZE:
+                return
+            if rows[0][1] == rows[-1][1]:
+                raise Exception('More than {} observations of {} modified at {}'.format(
+                    BATCH_SIZE, collection, start))
 
     def _load_plugin_class(self, filepath):
         """
         Loads the plugin method and sets the self.plugin to refer to it.
         :param filepath: path to the file containing the python function
         """
-        expected_class = 'ObservationUpdater'
-    
-        mod_name, file_ext = os.path.splitext(os.path.split(filepath)[-1])
+        self.plugin = load_plugin(filepath)
 
-        if file_ext.lower() == '.pyc':
-            py_mod = imp.load_compiled(mod_name, filepath)
-        else:
-            py_mod = imp.load_source(mod_name, filepath)
-    
-        if hasattr(py_mod, expected_class):
-            self.plugin = getattr(py_mod, expected_class)()
-        else:
-            raise Exception(
-                'Cannot find ObservationUpdater class in pluging file ' + filepath)
-        
-        if not hasattr(self.plugin, 'update'):
-            raise Exception('Cannot find update method in plugin class ' + filepath)
+    @property
+    def reader(self):
+        """
+        ObservationReader of the current thread
+        """
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            reader = obs_reader_writer.ObservationReader(self._validate)
+            self._local.reader = reader
+        return reader
+
+    @property
+    def writer(self):
+        """
+        ObservationWriter of the current thread
+        """
+        writer = getattr(self._local, 'writer', None)
+        if writer is None:
+            writer = obs_reader_writer.ObservationWriter(self._validate, False, 'caom2',
+                                                         self._namespace)
+            self._local.writer = writer
+        return writer
+
+    def _to_xml(self, observation):
+        ibuffer = StringIO()
+        self.writer.write(observation, ibuffer)
+        return ibuffer.getvalue()
 
     def get_observation(self, collection, observation_id):
         """
@@ -219,19 +710,62 @@ class CAOM2RepoClient:
         :param observation_id: the ID of the observation
         :return: the caom2.observation.Observation object
         """
+        content = self.get_observation_xml(collection, observation_id)
+        with self.metrics.timer('parse'):
+            return self.reader.read(StringIO(content))
+
+    def get_observation_xml(self, collection, observation_id):
+        """
+        Get the XML document of an observation from the CAOM2 repo, as returned by the
+        service and without parsing it
+        :param collection: name of the collection
+        :param observation_id: the ID of the observation
+        :return: the content of the document
+        """
         assert collection is not None
         assert observation_id is not None
         resource = '/{}/{}'.format(collection, observation_id)
-        logging.debug('GET '.format(resource))
+        logging.debug('GET {}'.format(resource))
 
-        response = self._repo_client.get(resource)
-        obs_reader = ObservationReader()
+        with self.metrics.timer('get'):
+            response = self._repo_client.get(resource)
         content = response.content
+        self.metrics.add_bytes('get', len(content))
         if len(content) == 0:
             logging.error(response.status_code)
             response.close()
+            self.metrics.error('parse')
             raise Exception('Got empty response for resource: {}'.format(resource))
-        return obs_reader.read(StringIO(content))
+        return content
+
+    def stream_observation_xml(self, collection, observation_id, out):
+        """
+        Copies the XML document of an observation from the CAOM2 repo to out as it is
+        received, without parsing it or keeping it in memory
+        :param collection: name of the collection
+        :param observation_id: the ID of the observation
+        :param out: binary file-like object the document is written to
+        :return: the size of the document
+        """
+        assert collection is not None
+        assert observation_id is not None
+        resource = '/{}/{}'.format(collection, observation_id)
+        logging.debug('GET {}'.format(resource))
+
+        size = 0
+        with self.metrics.timer('get'):
+            response = self._repo_client.get(resource, stream=True)
+            try:
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    out.write(chunk)
+                    size += len(chunk)
+            finally:
+                response.close()
+        self.metrics.add_bytes('get', size)
+        if size == 0:
+            logging.error(response.status_code)
+            raise Exception('Got empty response for resource: {}'.format(resource))
+        return size
 
     def post_observation(self, observation):
         """
@@ -241,15 +775,24 @@ class CAOM2RepoClient:
         """
         assert observation.collection is not None
         assert observation.observation_id is not None
-        resource = '/{}/{}'.format(observation.collection, observation.observation_id)
-        logging.debug('POST {}'.format(resource))
+        with self.metrics.timer('serialize'):
+            obs_xml = self._to_xml(observation)
+        self.post_observation_xml(observation.collection, observation.observation_id, obs_xml)
 
-        ibuffer = StringIO()
-        ObservationWriter().write(observation, ibuffer)
-        obs_xml = ibuffer.getvalue()
+    def post_observation_xml(self, collection, observation_id, obs_xml):
+        """
+        Updates an observation in the CAOM2 repo with its XML document
+        :param collection: name of the collection
+        :param observation_id: ID of the observation
+        :param obs_xml: content of the document
+        """
+        resource = '/{}/{}'.format(collection, observation_id)
+        logging.debug('POST {}'.format(resource))
         headers = {'Content-Type': 'application/xml'}
-        response = self._repo_client.post(
-            resource, headers=headers, data=obs_xml)
+        with self.metrics.timer('post'):
+            response = self._repo_client.post(
+                resource, headers=headers, data=obs_xml)
+        self.metrics.add_bytes('post', len(obs_xml))
         logging.debug('Successfully updated Observation\n')
 
     def put_observation(self, observation):
@@ -260,15 +803,24 @@ class CAOM2RepoClient:
         """
         assert observation.collection is not None
         assert observation.observation_id is not None
-        resource = '/{}/{}'.format(observation.collection, observation.observation_id)
-        logging.debug('PUT {}'.format(resource))
+        with self.metrics.timer('serialize'):
+            obs_xml = self._to_xml(observation)
+        self.put_observation_xml(observation.collection, observation.observation_id, obs_xml)
 
-        ibuffer = StringIO()
-        ObservationWriter().write(observation, ibuffer)
-        obs_xml = ibuffer.getvalue()
+    def put_observation_xml(self, collection, observation_id, obs_xml):
+        """
+        Add an observation to the CAOM2 repo with its XML document
+        :param collection: name of the collection
+        :param observation_id: ID of the observation
+        :param obs_xml: content of the document
+        """
+        resource = '/{}/{}'.format(collection, observation_id)
+        logging.debug('PUT {}'.format(resource))
         headers = {'Content-Type': 'application/xml'}
-        response = self._repo_client.put(
-            resource, headers=headers, data=obs_xml)
+        with self.metrics.timer('put'):
+            response = self._repo_client.put(
+                resource, headers=headers, data=obs_xml)
+        self.metrics.add_bytes('put', len(obs_xml))
         logging.debug('Successfully put Observation\n')
 
     def delete_observation(self, collection, observation_id):
@@ -280,9 +832,155 @@ class CAOM2RepoClient:
         assert observation_id is not None
         resource = '/{}/{}'.format(collection, observation_id)
         logging.debug('DELETE {}'.format(resource))
-        response = self._repo_client.delete(resource)
+        with self.metrics.timer('delete'):
+            response = self._repo_client.delete(resource)
         logging.info('Successfully deleted Observation {}\n')
 
+    def set_max_connections(self, count):
+        """
+        Sizes the pool of connections kept open to the repo, so that count threads can send
+        requests concurrently without opening new connections.
+        :param count: number of concurrent requests
+        """
+        session = self._repo_client._get_session()
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, requests.adapters.HTTPAdapter(pool_maxsize=count))
+
+
+def _split_range(start, end, boundaries):
+    """
+    Splits the [start, end] interval at the given boundaries into disjoint sub-ranges. Each
+    boundary is the inclusive end of a sub-range, the next sub-range starting PARTITION_GAP
+    later. Boundaries outside the interval and empty sub-ranges are dropped.
+    :return: list of (start, end) sub-ranges
+    """
+    ranges = []
+    lower = start
+    for boundary in sorted(set(boundaries)):
+        if (lower is not None and boundary < lower) or (end is not None and boundary >= end):
+            continue
+        ranges.append((lower, boundary))
+        lower = boundary + PARTITION_GAP
+    ranges.append((lower, end))
+    return ranges
+
+
+# progress arrays shared by the parent with the worker processes of a partitioned visit
+_shared_progress = None
+
+
+def _init_worker(shared_progress):
+    """
+    Initializes a worker process of a partitioned visit.
+    """
+    global _shared_progress
+    _shared_progress = shared_progress
+
+
+def _visit_range(args):
+    """
+    Visits a sub-range of a collection with a new client. Used as the target of the worker
+    processes of a partitioned visit.
+    :param args: tuple of (client arguments, plugin file, collection, start, end,
+                 dictionary of additional visit arguments, True to collect metrics,
+                 index of the sub-range in the shared progress arrays)
+    :return: tuple of (start, end, number of visited observations, error message or None,
+             snapshot of the metrics, (False if empty, partial result of an analysis plugin))
+    """
+    client_args, plugin, collection, start, end, visit_args, collect_metrics, slot = args
+    progress = None
+    if _shared_progress is not None:
+        progress = ProgressReporter()
+        progress.attach(_shared_progress, slot)
+    client = CAOM2RepoClient(metrics=Metrics() if collect_metrics else None, progress=progress,
+                             **client_args)
+    try:
+        count = client.visit(plugin, collection, start=start, end=end, **visit_args)
+        return (start, end, count, None, client.metrics.snapshot(),
+                (client._reduced, client.result))
+    except Exception as e:
+        logging.exception('Failed to visit [{}, {}]'.format(start, end))
+        return start, end, 0, str(e), client.metrics.snapshot(), (False, None)
+
+
+def _visit_ids(args):
+    """
+    Visits a list of observations with a new client. Used as the target of the worker
+    processes of CAOM2RepoClient.visit_observations.
+    :param args: tuple of (client arguments, plugin file, collection, observation IDs,
+                 dictionary of additional visit arguments, True to collect metrics)
+    :return: tuple of (number of visited observations, error message or None, snapshot of
+             the metrics, (False if empty, partial result of an analysis plugin))
+    """
+    client_args, plugin, collection, observation_ids, visit_args, collect_metrics = args
+    client = CAOM2RepoClient(metrics=Metrics() if collect_metrics else None, **client_args)
+    try:
+        count = client.visit_observations(plugin, collection, observation_ids, **visit_args)
+        return count, None, client.metrics.snapshot(), (client._reduced, client.result)
+    except Exception as e:
+        logging.exception('Failed to visit {} observations'.format(len(observation_ids)))
+        return 0, str(e), client.metrics.snapshot(), (False, None)
+
+
+def _add_load_arguments(parser):
+    """
+    Adds the arguments of the bulk modes of the create and update commands to their parser
+    """
+    parser.add_argument('--source', metavar='<directory, tar file or glob>',
+                        help='send all the observation files of a directory, tar archive or glob '
+                             'pattern')
+    parser.add_argument('--threads', metavar='<number of threads>', type=int,
+                        default=DEFAULT_THREADS,
+                        help='number of concurrent uploads with --source (default: %(default)s)')
+    parser.add_argument('--processes', metavar='<number of processes>', type=int, default=1,
+                        help='number of processes parsing the files of --source '
+                             '(default: %(default)s)')
+
+
+def _str2window(value):
+    """
+    Parses a <start>/<end> time window of the command line
+    :return: tuple of (start, end) dates, None for the empty ones
+    """
+    try:
+        (start, end) = value.split('/')
+        return (util.str2ivoa(start) if start else None,
+                util.str2ivoa(end) if end else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid window {}: <start>/<end> expected'.format(value))
+
+
+def _read(client, args, out):
+    """
+    Writes the observation of the read command to out. The document is copied as returned by
+    the repo unless it is converted to another namespace, or parsed and validated first with
+    --validate.
+    """
+    if args.namespace:
+        observation = client.get_observation(args.collection, args.observation)
+        obs_reader_writer.ObservationWriter(args.validate, False, 'caom2',
+                                            get_namespace(args.namespace)).write(observation, out)
+    elif args.validate:
+        content = client.get_observation_xml(args.collection, args.observation)
+        obs_reader_writer.ObservationReader(True).read(io.BytesIO(content))
+        out.write(content)
+    else:
+        client.stream_observation_xml(args.collection, args.observation, out)
+
+
+def _write_result(result, out):
+    """
+    Writes the aggregate of an analysis plugin as JSON, or its representation if it cannot be
+    serialized to JSON
+    :param result: the aggregate
+    :param out: the text stream the aggregate is written to
+    """
+    try:
+        text = json.dumps(result, indent=2, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        text = repr(result)
+    out.write('{}\n'.format(text))
+
 
 def main():
 
@@ -298,27 +996,72 @@ def main():
     subparsers = parser.add_subparsers(dest='cmd', )
 
     create_parser = subparsers.add_parser('create', parents=[base_parser],
-                                          description='Create a new observation',
+                                          description='Create a new observation, or many of them '
+                                                      'with --source',
                                           help='Create a new observation')
-    create_parser.add_argument('observation', metavar='<new observation file>', type=file)
+    _add_load_arguments(create_parser)
+    create_parser.add_argument('observation', metavar='<new observation file>', type=file,
+                               nargs='?')
 
     read_parser = subparsers.add_parser('read', parents=[base_parser],
-                                        description='Read an existing observation',
+                                        description='Read an existing observation, or many of them '
+                                                    'with --ids, --start or --end',
                                         help='Read an existing observation')
     read_parser.add_argument('--collection', metavar='<collection>', required=True)
     read_parser.add_argument('--output', '-o', metavar='<destination file>', required=False)
-    read_parser.add_argument('observation', metavar='<observation>')
+    read_parser.add_argument('--ids', metavar='<file>',
+                             help='read the observations listed in this file, one ID per line or '
+                                  'a listing of the list command (- for the standard input)')
+    read_parser.add_argument('--start', metavar='<datetime start point>', type=util.str2ivoa,
+                             help='read the observations modified since this date (UTC)')
+    read_parser.add_argument('--end', metavar='<datetime end point>', type=util.str2ivoa,
+                             help='read the observations modified until this date (UTC)')
+    read_parser.add_argument('--output-dir', metavar='<directory>',
+                             help='directory the observations read with --ids, --start or --end '
+                                  'are written to, in a sub-directory of the collection')
+    read_parser.add_argument('--archive', metavar='<tar file>',
+                             help='tar archive the observations read with --ids, --start or --end '
+                                  'are written to instead of --output-dir')
+    read_parser.add_argument('--threads', metavar='<number of threads>', type=int,
+                             default=DEFAULT_THREADS,
+                             help='number of concurrent downloads (default: %(default)s)')
+    read_parser.add_argument('--validate', action='store_true',
+                             help='check the observation against the CAOM2 schemas before '
+                                  'writing it')
+    read_parser.add_argument('--namespace', choices=CAOM_VERSIONS,
+                             help='convert the observation to this version of CAOM2. By default '
+                                  'it is written as returned by the repo')
+    read_parser.add_argument('observation', metavar='<observation>', nargs='?')
 
     update_parser = subparsers.add_parser('update', parents=[base_parser],
-                                          description='Update an existing observation',
+                                          description='Update an existing observation, or many of '
+                                                      'them with --source',
                                           help='Update an existing observation')
-    update_parser.add_argument('observation', metavar='<observation file>', type=file)
+    _add_load_arguments(update_parser)
+    update_parser.add_argument('observation', metavar='<observation file>', type=file, nargs='?')
 
     delete_parser = subparsers.add_parser('delete', parents=[base_parser],
-                                          description='Delete an existing observation',
+                                          description='Delete an existing observation, or many of '
+                                                      'them with --ids, --start or --end',
                                           help='Delete an existing observation')
     delete_parser.add_argument('--collection', metavar='<collection>', required=True)
-    delete_parser.add_argument('observationID', metavar='<ID of observation>')
+    delete_parser.add_argument('--ids', metavar='<file>',
+                               help='delete the observations listed in this file, one ID per line '
+                                    'or a listing of the list command (- for the standard input)')
+    delete_parser.add_argument('--start', metavar='<datetime start point>', type=util.str2ivoa,
+                               help='delete the observations modified since this date (UTC)')
+    delete_parser.add_argument('--end', metavar='<datetime end point>', type=util.str2ivoa,
+                               help='delete the observations modified until this date (UTC)')
+    delete_parser.add_argument('--threads', metavar='<number of threads>', type=int,
+                               default=DEFAULT_THREADS,
+                               help='number of concurrent deletes (default: %(default)s)')
+    delete_parser.add_argument('--rate', metavar='<deletes per second>', type=float,
+                               help='maximum number of deletes per second')
+    delete_parser.add_argument('--dry-run', action='store_true',
+                               help='only print the number of observations that would be deleted')
+    delete_parser.add_argument('--journal', metavar='<file>',
+                               help='file the deleted observations are appended to')
+    delete_parser.add_argument('observationID', metavar='<ID of observation>', nargs='?')
 
     # Note: RawTextHelpFormatter allows for the use of newline in epilog
     visit_parser = subparsers.add_parser('visit', parents=[base_parser],
@@ -336,10 +1079,71 @@ def main():
                               help='earliest dataset to visit (UTC %%Y-%%m-%%d format)')
     visit_parser.add_argument('--retries', metavar='<number of retries>', type=int,
                               help='number of tries with transient server errors')
+    visit_parser.add_argument('--processes', metavar='<number of processes>', type=int, default=1,
+                              help='number of worker processes, each visiting a sub-range of [start, end]')
+    visit_parser.add_argument('--partition', choices=[EQUAL_PARTITION, ADAPTIVE_PARTITION],
+                              default=EQUAL_PARTITION,
+                              help='split [start, end] into equal time windows or adaptively from the '
+                                   'listing density (default: %(default)s)')
+    visit_parser.add_argument('--batch-size', metavar='<number of observations>', type=int,
+                              default=DEFAULT_UPDATE_BATCH_SIZE,
+                              help='number of observations passed at once to the update_batch method '
+                                   'of the plugin (default: %(default)s)')
+    visit_parser.add_argument('--metrics-file', metavar='<file>',
+                              help='file the per-stage latency, byte and error metrics are written to')
+    visit_parser.add_argument('--metrics-format', choices=[PROMETHEUS_FORMAT, JSONL_FORMAT],
+                              default=PROMETHEUS_FORMAT,
+                              help='format of the metrics file (default: %(default)s)')
+    visit_parser.add_argument('--metrics-interval', metavar='<seconds>', type=int, default=60,
+                              help='seconds between updates of the metrics file (default: %(default)s)')
+    visit_parser.add_argument('--progress', action='store_true',
+                              help='report throughput, latency and ETA to stderr')
+    visit_parser.add_argument('--status-file', metavar='<file>',
+                              help='file overwritten with the latest progress report (JSON)')
+    visit_parser.add_argument('--progress-interval', metavar='<seconds>', type=int,
+                              default=DEFAULT_PROGRESS_INTERVAL,
+                              help='seconds between progress reports (default: %(default)s)')
+    visit_parser.add_argument('--shard-dir', metavar='<directory>',
+                              help='directory shared by the workers of a sharded visit')
+    visit_parser.add_argument('--shards', metavar='<number of shards>', type=int,
+                              help='number of shards created by the first worker of a sharded visit')
+    visit_parser.add_argument('--shard-by', choices=[TIME_SHARDS, HASH_SHARDS], default=TIME_SHARDS,
+                              help='split a sharded visit into time windows or by hash of the '
+                                   'observation IDs (default: %(default)s)')
+    visit_parser.add_argument('--lease-ttl', metavar='<seconds>', type=int, default=DEFAULT_LEASE_TTL,
+                              help='seconds after which the shard of an unresponsive worker is '
+                                   'reclaimed (default: %(default)s)')
     visit_parser.add_argument("-s", "--server", metavar='<CAOM2 service URL>',
                               help="URL of the CAOM2 repo server")
 
-    visit_parser.add_argument('collection', metavar='<datacollection>', type=str,
+    visit_parser.add_argument('--source', metavar='<directory, tar file or glob>',
+                              help='visit the observation files of a local directory, tar archive or '
+                                   'glob pattern instead of a collection in the CAOM2 repo')
+    visit_parser.add_argument('--output-dir', metavar='<directory>',
+                              help='directory the observations visited from --source or by a dry run '
+                                   'are written to')
+    visit_parser.add_argument('--dry-run', action='store_true',
+                              help='write the updated observations to --output-dir instead of '
+                                   'updating them in the repo')
+    visit_parser.add_argument('--diff', action='store_true',
+                              help='with --dry-run, also write the changes made by the plugin as a '
+                                   'unified diff next to each observation')
+    visit_parser.add_argument('--listing', metavar='<file>',
+                              help='visit the observations of a listing written by the list command '
+                                   'instead of listing the collection again')
+    visit_parser.add_argument('--id-pattern', metavar='<regular expression>',
+                              help='only visit the observations whose ID matches this expression')
+    visit_parser.add_argument('--window', metavar='<start>/<end>', type=_str2window,
+                              action='append',
+                              help='only visit the observations modified in this window (UTC). '
+                                   'Either date can be empty. Can be repeated')
+    visit_parser.add_argument('--journal', metavar='<file>',
+                              help='record the observations that fail in this file and continue '
+                                   'the visit instead of aborting it')
+    visit_parser.add_argument('--result', metavar='<file>',
+                              help='file the aggregate computed by the map and reduce methods of '
+                                   'the plugin is written to, instead of the standard output')
+    visit_parser.add_argument('collection', metavar='<datacollection>', type=str, nargs='?',
                               help='data collection in CAOM2 repo')
     visit_parser.epilog =\
 """
@@ -354,8 +1158,154 @@ Minimum plugin file format:
             'observation {} is not an Observation'.format(observation))
         # custom code to update the observation
 ----
+Plugins that can process several observations at once may implement
+instead, or in addition to update:
+----
+    def update_batch(self, observations):
+        # custom code to update the list of observations
+----
+Plugins may also skip observations before they are read from the repo:
+----
+    def accept(self, observation_id, last_modified):
+        # return False to skip the observation
+----
+Analysis plugins compute an aggregate of the observations without
+updating them. The aggregate is printed as JSON, or written to --result:
+----
+    def map(self, observation):
+        # return a partial result computed from the observation
+
+    def reduce(self, a, b):
+        # return the combination of two partial results
+----
 """
+
+    replay_parser = subparsers.add_parser('replay', parents=[base_parser],
+                                          description='Visit again the observations recorded in the '
+                                                      'journal of a visit',
+                                          help='Visit again the observations recorded in the journal '
+                                               'of a visit')
+    replay_parser.add_argument('--plugin', required=True, type=file,
+                               metavar='<pluginClassFile>',
+                               help='Plugin class to update each observation')
+    replay_parser.add_argument('--processes', metavar='<number of processes>', type=int, default=1,
+                               help='number of worker processes, each visiting a part of the '
+                                    'observations')
+    replay_parser.add_argument('--batch-size', metavar='<number of observations>', type=int,
+                               default=DEFAULT_UPDATE_BATCH_SIZE,
+                               help='number of observations passed at once to the update_batch '
+                                    'method of the plugin (default: %(default)s)')
+    replay_parser.add_argument('--output-dir', metavar='<directory>',
+                               help='directory the observations visited by a dry run are written to')
+    replay_parser.add_argument('--dry-run', action='store_true',
+                               help='write the updated observations to --output-dir instead of '
+                                    'updating them in the repo')
+    replay_parser.add_argument('--diff', action='store_true',
+                               help='with --dry-run, also write the changes made by the plugin as a '
+                                    'unified diff next to each observation')
+    replay_parser.add_argument('--journal', metavar='<file>',
+                               help='record the observations that fail again in this file and '
+                                    'continue instead of aborting')
+    replay_parser.add_argument('failures', metavar='<journal file>',
+                               help='journal of the failed observations of a visit')
+
+    sync_parser = subparsers.add_parser('sync', parents=[base_parser],
+                                        description='Copy the observations of collections modified '
+                                                    'since the last sync to a local directory',
+                                        help='Copy the observations of collections modified since '
+                                             'the last sync to a local directory')
+    sync_parser.add_argument('--threads', metavar='<number of threads>', type=int,
+                             default=DEFAULT_THREADS,
+                             help='number of concurrent downloads (default: %(default)s)')
+    sync_parser.add_argument('--prune', action='store_true',
+                             help='remove the local observations that were deleted from the repo '
+                                  '(lists the whole collection)')
+    sync_parser.add_argument('--full', action='store_true',
+                             help='ignore the watermark of the last sync and copy the whole '
+                                  'collection')
+    sync_parser.add_argument('--listing', metavar='<file>',
+                             help='copy the observations of a listing written by the list command '
+                                  'instead of listing the collection. Requires a single collection')
+    sync_parser.add_argument('directory', metavar='<directory>',
+                             help='local directory with a sub-directory for each collection')
+    sync_parser.add_argument('collections', metavar='<collection>', nargs='+',
+                             help='data collection in CAOM2 repo')
+
+    list_parser = subparsers.add_parser('list', parents=[base_parser],
+                                        description='List the observations of a collection as '
+                                                    '<observation ID>,<last modified date> lines',
+                                        help='List the observations of a collection')
+    list_parser.add_argument('--start', metavar='<datetime start point>', type=util.str2ivoa,
+                             help='list the observations modified since this date (UTC)')
+    list_parser.add_argument('--end', metavar='<datetime end point>', type=util.str2ivoa,
+                             help='list the observations modified until this date (UTC)')
+    list_parser.add_argument('--output', '-o', metavar='<destination file>',
+                             help='file the listing is written to, instead of the standard output')
+    list_parser.add_argument('collection', metavar='<collection>',
+                             help='data collection in CAOM2 repo')
+
+    convert_parser = subparsers.add_parser('convert', parents=[base_parser],
+                                           description='Convert the observation files of a '
+                                                       'directory, tar archive or glob pattern to '
+                                                       'another version of CAOM2',
+                                           help='Convert observation files to another version '
+                                                'of CAOM2')
+    convert_parser.add_argument('--to', dest='caom_version', metavar='<version>',
+                                choices=CAOM_VERSIONS, required=True,
+                                help='version of CAOM2 the observations are converted to: '
+                                     '{}'.format(', '.join(CAOM_VERSIONS)))
+    convert_parser.add_argument('--output-dir', metavar='<directory>',
+                                help='directory the converted observations are written to, at the '
+                                     'same path as in the source')
+    convert_parser.add_argument('--archive', metavar='<tar file>',
+                                help='tar archive the converted observations are written to '
+                                     'instead of --output-dir')
+    convert_parser.add_argument('--processes', metavar='<number of processes>', type=int,
+                                default=1,
+                                help='number of processes converting the observations '
+                                     '(default: %(default)s)')
+    convert_parser.add_argument('--validate', action='store_true',
+                                help='check the observations read and written against the CAOM2 '
+                                     'schemas')
+    convert_parser.add_argument('source', metavar='<directory, tar file or glob>',
+                                help='observation files to convert, in any version of CAOM2')
+
     args = parser.parse_args()
+    if args.cmd == 'visit':
+        if (args.source or args.dry_run) and not args.output_dir:
+            visit_parser.error('--output-dir is required with --source and --dry-run')
+        if not args.source and not args.collection:
+            visit_parser.error('a collection or --source is required')
+        analysis = is_analysis_plugin(load_plugin(args.plugin.name))
+        if (args.source or args.shard_dir) and analysis:
+            visit_parser.error('--source and --shard-dir cannot be used with a map and reduce '
+                               'plugin')
+    if args.cmd in ['create', 'update'] and bool(args.source) == bool(args.observation):
+        subparsers.choices[args.cmd].error('an observation file or --source is required')
+    if args.cmd == 'read':
+        bulk = args.ids or args.start or args.end
+        if bool(bulk) == bool(args.observation):
+            read_parser.error('an observation, or --ids, --start or --end is required')
+        if args.ids and (args.start or args.end):
+            read_parser.error('--ids cannot be used with --start and --end')
+        if bulk and bool(args.output_dir) == bool(args.archive):
+            read_parser.error('--output-dir or --archive is required with --ids, --start and '
+                              '--end')
+    if args.cmd == 'delete':
+        bulk = args.ids or args.start or args.end
+        if bool(bulk) == bool(args.observationID):
+            delete_parser.error('an observation, or --ids, --start or --end is required')
+        if args.ids and (args.start or args.end):
+            delete_parser.error('--ids cannot be used with --start and --end')
+    if args.cmd == 'sync' and args.listing and len(args.collections) > 1:
+        sync_parser.error('--listing requires a single collection')
+    if args.cmd == 'convert' and bool(args.output_dir) == bool(args.archive):
+        convert_parser.error('--output-dir or --archive is required')
+    if args.cmd == 'replay':
+        if args.dry_run and not args.output_dir:
+            replay_parser.error('--output-dir is required with --dry-run')
+        if args.journal and os.path.abspath(args.journal) == os.path.abspath(args.failures):
+            replay_parser.error('--journal must be different from the replayed journal')
     if args.verbose:
         logging.basicConfig(level=logging.INFO)
     if args.debug:
@@ -365,7 +1315,35 @@ Minimum plugin file format:
     if os.path.isfile(args.certfile):
         cert_file = args.certfile
 
-    client = CAOM2RepoClient(args.resourceID, anon=args.anonymous, cert_file=cert_file, host=args.host)
+    metrics = None
+    progress = None
+    if args.cmd == 'visit':
+        if args.metrics_file:
+            metrics = Metrics(export_file=args.metrics_file, export_format=args.metrics_format,
+                              export_interval=args.metrics_interval)
+        if args.progress or args.status_file:
+            progress = ProgressReporter(stream=sys.stderr if args.progress else None,
+                                        status_file=args.status_file,
+                                        interval=args.progress_interval)
+
+    if args.cmd == 'visit' and args.source:
+        # local files: no access to the repo
+        logging.info("Visit {}".format(args.source))
+        visit_local(args.plugin.name, args.source, args.output_dir, processes=args.processes,
+                    batch_size=args.batch_size)
+        logging.info("DONE")
+        return
+    if args.cmd == 'convert':
+        logging.info("Convert {}".format(args.source))
+        results = convert_observations(args.source, args.caom_version, output_dir=args.output_dir,
+                                       archive=args.archive, processes=args.processes,
+                                       validate=args.validate)
+        if write_conversion_report(results, sys.stdout):
+            sys.exit(1)
+        return
+
+    client = CAOM2RepoClient(args.resourceID, anon=args.anonymous, cert_file=cert_file, host=args.host,
+                             metrics=metrics, progress=progress)
     if args.cmd == 'visit':
         logging.info("Visit")
         plugin = args.plugin
@@ -373,28 +1351,113 @@ Minimum plugin file format:
         end = args.end
         retries = args.retries
         collection = args.collection
+        output_dir = args.output_dir if args.dry_run else None
+        listing_filter = None
+        if args.id_pattern or args.window:
+            listing_filter = ListingFilter(args.id_pattern, args.window)
         logging.debug("Call visitor with plugin={}, start={}, end={}, dataset={}".
                       format(plugin, start, end, collection, retries))
-        client.visit(plugin.name, collection, start=start, end=end)
+        if args.listing:
+            # the rows keep the last modified dates for the filters
+            client.visit_observations(plugin.name, collection,
+                                      list(read_listing(args.listing, start, end)),
+                                      processes=args.processes, batch_size=args.batch_size,
+                                      output_dir=output_dir, diff=args.diff, journal=args.journal,
+                                      accept=listing_filter)
+        elif args.shard_dir:
+            sharded_visit = ShardedVisit(client, args.shard_dir, lease_ttl=args.lease_ttl)
+            sharded_visit.run(plugin.name, collection, start=start, end=end, shards=args.shards,
+                              shard_by=args.shard_by, processes=args.processes,
+                              partition=args.partition, batch_size=args.batch_size,
+                              output_dir=output_dir, diff=args.diff, journal=args.journal,
+                              accept=listing_filter)
+        else:
+            client.visit(plugin.name, collection, start=start, end=end,
+                         processes=args.processes, partition=args.partition,
+                         batch_size=args.batch_size, output_dir=output_dir, diff=args.diff,
+                         journal=args.journal, accept=listing_filter)
+        if analysis:
+            if args.result:
+                with io.open(args.result, 'w', encoding='utf-8') as out:
+                    _write_result(client.result, out)
+            else:
+                _write_result(client.result, sys.stdout)
+    elif args.cmd == 'replay':
+        logging.info("Replay {}".format(args.failures))
+        output_dir = args.output_dir if args.dry_run else None
+        for collection, observation_ids in read_journal(args.failures):
+            client.visit_observations(args.plugin.name, collection, observation_ids,
+                                      processes=args.processes, batch_size=args.batch_size,
+                                      output_dir=output_dir, diff=args.diff,
+                                      journal=args.journal)
 
+    elif args.cmd == 'list':
+        logging.info("List {}".format(args.collection))
+        rows = client.list_observations(args.collection, args.start, args.end)
+        if args.output:
+            with io.open(args.output, 'w', encoding='utf-8') as out:
+                count = write_listing(rows, out)
+        else:
+            count = write_listing(rows, sys.stdout)
+        logging.info("Listed {} observations".format(count))
+    elif args.cmd == 'sync':
+        mirror = CollectionMirror(client, args.directory, threads=args.threads)
+        for collection in args.collections:
+            logging.info("Sync {}".format(collection))
+            listing = read_listing(args.listing) if args.listing else None
+            mirror.sync(collection, prune=args.prune, full=args.full, listing=listing)
+    elif args.cmd in ['create', 'update'] and args.source:
+        logging.info("Load {}".format(args.source))
+        results = load_observations(client, args.source, update=args.cmd == 'update',
+                                    threads=args.threads, processes=args.processes)
+        if write_report(results, sys.stdout):
+            sys.exit(1)
     elif args.cmd == 'create':
         logging.info("Create")
-        obs_reader = ObservationReader()
+        obs_reader = obs_reader_writer.ObservationReader()
         client.put_observation(obs_reader.read(args.observation))
+    elif args.cmd == 'read' and args.observation is None:
+        logging.info("Read {}".format(args.collection))
+        if args.ids:
+            observation_ids = read_ids(args.ids)
+        else:
+            observation_ids = [observation_id for (observation_id, _) in
+                               client.list_observations(args.collection, args.start, args.end)]
+        results = read_observations(client, args.collection, observation_ids,
+                                    output_dir=args.output_dir, archive=args.archive,
+                                    threads=args.threads, validate=args.validate,
+                                    namespace=get_namespace(args.namespace)
+                                    if args.namespace else None)
+        if write_report(results, sys.stdout):
+            sys.exit(1)
     elif args.cmd == 'read':
         logging.info("Read")
-        observation = client.get_observation(args.collection, args.observation)
-        observation_writer = ObservationWriter()
         if args.output:
-            with open(args.output, 'w') as obsfile:
-                observation_writer.write(observation, obsfile)
+            with open(args.output, 'wb') as obsfile:
+                _read(client, args, obsfile)
         else:
-            observation_writer.write(observation, sys.stdout)
+            _read(client, args, sys.stdout)
     elif args.cmd == 'update':
         logging.info("Update")
-        obs_reader = ObservationReader()
+        obs_reader = obs_reader_writer.ObservationReader()
         # TODO not sure if need to read in string first
         client.post_observation(obs_reader.read(args.observation))
+    elif args.cmd == 'delete' and args.observationID is None:
+        logging.info("Delete {}".format(args.collection))
+        if args.ids:
+            observation_ids = read_ids(args.ids)
+        else:
+            observation_ids = [observation_id for (observation_id, _) in
+                               client.list_observations(args.collection, args.start, args.end)]
+        if args.dry_run:
+            print('{} observations would be deleted from {}'.format(len(observation_ids),
+                                                                    args.collection))
+        else:
+            results = delete_observations(client, args.collection, observation_ids,
+                                          threads=args.threads, rate=args.rate,
+                                          journal=args.journal)
+            if write_report(results, sys.stdout):
+                sys.exit(1)
     else:
         logging.info("Delete")
         client.delete_observation(collection=args.collection, observation_id=args.observationID)
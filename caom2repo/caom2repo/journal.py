@@ -0,0 +1,160 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Journal of the observations that failed during a visit, used to replay them """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from .common import DATE_FORMAT
+
+__all__ = ['FailureJournal', 'read_journal']
+
+# stages of the processing of an observation recorded in the journal
+GET_STAGE = 'get'
+PLUGIN_STAGE = 'plugin'
+POST_STAGE = 'post'
+WRITE_STAGE = 'write'
+
+
+class FailureJournal(object):
+    """
+    Appends the failures of a visit to a file with one JSON object per line:
+
+        {"collection": "cfht", "observationID": "7000000o", "stage": "get",
+         "error": "HTTPError: 404 ...", "time": "2017-01-01T10:00:00.000000"}
+
+    Each line is written with a single call on a file opened in append mode, so the worker
+    processes of a visit can share the same journal.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the journal file, created if it does not exist
+        """
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, collection, observation_id, stage, error):
+        """
+        Records the failure of an observation
+        :param collection: collection of the observation
+        :param observation_id: ID of the observation
+        :param stage: processing stage that failed, e.g. GET_STAGE
+        :param error: the exception
+        """
+        entry = {'collection': collection, 'observationID': observation_id, 'stage': stage,
+                 'error': '{}: {}'.format(type(error).__name__, error),
+                 'time': datetime.utcnow().strftime(DATE_FORMAT)}
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        logging.error('Failed to visit {}/{} ({}): {}'.format(collection, observation_id, stage,
+                                                             entry['error']))
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+            self.count += 1
+
+
+def read_journal(path):
+    """
+    Reads the observations recorded in a journal
+    :param path: path of the journal file
+    :return: list of (collection, list of the IDs of its failed observations) tuples, in the
+    order of their first failure and without duplicates
+    """
+    failed = {}
+    collections = []
+    with io.open(path, encoding='utf-8') as f:
+        for (number, line) in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                collection = entry['collection']
+                observation_id = entry['observationID']
+            except (ValueError, KeyError) as e:
+                raise ValueError('Invalid entry on line {} of {}: {}'.format(number, path, e))
+            if collection not in failed:
+                failed[collection] = ([], set())
+                collections.append(collection)
+            (ids, seen) = failed[collection]
+            if observation_id not in seen:
+                ids.append(observation_id)
+                seen.add(observation_id)
+    return [(collection, failed[collection][0]) for collection in collections]
@@ -0,0 +1,297 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Per-stage latency, byte and error metrics of the repo operations """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+__all__ = ['Metrics', 'NullMetrics', 'NULL_METRICS']
+
+PROMETHEUS_FORMAT = 'prometheus'
+JSONL_FORMAT = 'jsonl'
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = 'caom2repo'
+
+
+class _Timer(object):
+    """Context manager recording the duration of a stage and its errors."""
+
+    __slots__ = ('_metrics', '_stage', '_start')
+
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._metrics.record(self._stage, time.time() - self._start, error=exc_type is not None)
+        return False
+
+
+class _NullTimer(object):
+    """Timer that does not record anything."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics(object):
+
+    """Metrics that are not collected. Used when instrumentation is disabled."""
+
+    enabled = False
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+    def record(self, stage, seconds, error=False):
+        pass
+
+    def add_bytes(self, stage, nbytes):
+        pass
+
+    def error(self, stage):
+        pass
+
+    def snapshot(self):
+        return {}
+
+    def merge(self, snapshot):
+        pass
+
+    def export(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics(object):
+
+    """
+    Latency histograms, byte counts and error counts of the stages of the repo operations
+    (e.g. list, get, parse, plugin, serialize, post). The metrics are available through
+    snapshot() and are optionally written to a file in Prometheus text format or as JSON
+    lines, at most every export_interval seconds and when export() is called.
+    """
+
+    enabled = True
+
+    def __init__(self, export_file=None, export_format=PROMETHEUS_FORMAT, export_interval=60):
+        """
+        :param export_file: optional file the metrics are written to
+        :param export_format: PROMETHEUS_FORMAT to overwrite the file with the current metrics
+                        or JSONL_FORMAT to append them as a JSON line
+        :param export_interval: minimum number of seconds between periodic exports
+        """
+        if export_format not in (PROMETHEUS_FORMAT, JSONL_FORMAT):
+            raise ValueError('Unknown metrics format: {}'.format(export_format))
+        self.export_file = export_file
+        self.export_format = export_format
+        self.export_interval = export_interval
+        self._next_export = time.time() + export_interval
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage):
+        """
+        Returns a context manager that records the duration of the enclosed code as the
+        latency of the stage, and an error if it raises an exception.
+        """
+        return _Timer(self, stage)
+
+    def _get_stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = {'count': 0, 'sum': 0.0, 'buckets': [0] * (len(BUCKETS) + 1),
+                                   'bytes': 0, 'errors': 0}
+        return self._stages[stage]
+
+    def record(self, stage, seconds, error=False):
+        """
+        Records the latency of a stage.
+        """
+        with self._lock:
+            stats = self._get_stage(stage)
+            stats['count'] += 1
+            stats['sum'] += seconds
+            index = 0
+            while index < len(BUCKETS) and seconds > BUCKETS[index]:
+                index += 1
+            stats['buckets'][index] += 1
+            if error:
+                stats['errors'] += 1
+        self._export_if_due()
+
+    def add_bytes(self, stage, nbytes):
+        """
+        Adds to the number of bytes transferred by a stage.
+        """
+        with self._lock:
+            self._get_stage(stage)['bytes'] += nbytes
+
+    def error(self, stage):
+        """
+        Counts an error in a stage that is not timed.
+        """
+        with self._lock:
+            self._get_stage(stage)['errors'] += 1
+
+    def snapshot(self):
+        """
+        :return: dictionary of stage name to a dictionary with the number of recorded
+        latencies (count), their sum in seconds (sum), the non-cumulative counts in the
+        histogram buckets (buckets, the last one being +Inf), bytes and errors.
+        """
+        with self._lock:
+            return copy.deepcopy(self._stages)
+
+    def merge(self, snapshot):
+        """
+        Adds the metrics of a snapshot, e.g. collected by another process.
+        """
+        with self._lock:
+            for stage, other in snapshot.items():
+                stats = self._get_stage(stage)
+                for key in ('count', 'sum', 'bytes', 'errors'):
+                    stats[key] += other[key]
+                stats['buckets'] = [a + b for (a, b) in zip(stats['buckets'], other['buckets'])]
+        self._export_if_due()
+
+    def _export_if_due(self):
+        if self.export_file is not None and time.time() >= self._next_export:
+            self.export()
+
+    def export(self):
+        """
+        Writes the current metrics to the export file, if any.
+        """
+        if self.export_file is None:
+            return
+        self._next_export = time.time() + self.export_interval
+        try:
+            if self.export_format == PROMETHEUS_FORMAT:
+                # write and rename so that scrapers never read a partial file
+                tmp_file = '{}.{}.tmp'.format(self.export_file, os.getpid())
+                with open(tmp_file, 'w') as f:
+                    f.write(self.to_prometheus())
+                os.rename(tmp_file, self.export_file)
+            else:
+                with open(self.export_file, 'a') as f:
+                    f.write(json.dumps({'time': time.time(), 'stages': self.snapshot()}) + '\n')
+        except (IOError, OSError) as e:
+            logging.warn('Cannot export metrics to {}: {}'.format(self.export_file, e))
+
+    def to_prometheus(self):
+        """
+        :return: the metrics in the Prometheus text exposition format
+        """
+        stages = self.snapshot()
+        lines = ['# HELP {}_stage_seconds Latency of the stages of the repo operations'.
+                 format(METRIC_PREFIX),
+                 '# TYPE {}_stage_seconds histogram'.format(METRIC_PREFIX)]
+        for stage in sorted(stages):
+            stats = stages[stage]
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), stats['buckets']):
+                cumulative += count
+                lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(
+                    METRIC_PREFIX, stage, bound, cumulative))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(METRIC_PREFIX, stage,
+                                                                       repr(stats['sum'])))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(METRIC_PREFIX, stage,
+                                                                         stats['count']))
+        for name, key, description in (('bytes', 'bytes', 'Bytes transferred by'),
+                                       ('errors', 'errors', 'Errors in')):
+            lines.append('# HELP {}_stage_{}_total {} the stages of the repo operations'.
+                         format(METRIC_PREFIX, name, description))
+            lines.append('# TYPE {}_stage_{}_total counter'.format(METRIC_PREFIX, name))
+            for stage in sorted(stages):
+                lines.append('{}_stage_{}_total{{stage="{}"}} {}'.format(
+                    METRIC_PREFIX, name, stage, stages[stage][key]))
+        return '\n'.join(lines) + '\n'
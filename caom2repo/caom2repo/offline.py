@@ -0,0 +1,211 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+""" Visit of observations stored in local files instead of a CAOM2 repo """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import os
+from io import BytesIO
+from multiprocessing import Pool
+
+from caom2.caom_util import LazyImport
+
+from .common import iter_source, batches, imap_bounded, get_document_namespace, write_atomic
+from .plugin import load_plugin
+
+obs_reader_writer = LazyImport('caom2.obs_reader_writer')
+
+__all__ = ['visit_local']
+
+# number of observations sent at once to a worker process, or to the update_batch method of
+# the plugins that implement it
+DEFAULT_TASK_SIZE = 100
+# number of failures listed in the exception raised at the end of a visit
+MAX_REPORTED_FAILURES = 20
+
+# state of the worker processes, set by _init_worker
+_plugin = None
+_output_dir = None
+_reader = None
+_writers = {}
+
+
+def _init_worker(plugin, output_dir):
+    global _plugin, _output_dir, _reader, _writers
+    _plugin = load_plugin(plugin)
+    _output_dir = output_dir
+    _reader = obs_reader_writer.ObservationReader()
+    _writers = {}
+
+
+def _get_writer(data):
+    """
+    :return: ObservationWriter that writes in the namespace of the document data
+    """
+    namespace = get_document_namespace(data)
+    if namespace not in _writers:
+        _writers[namespace] = obs_reader_writer.ObservationWriter(False, False, 'caom2', namespace)
+    return _writers[namespace]
+
+
+def _write(name, data, observation):
+    write_atomic(os.path.join(_output_dir, name),
+                 lambda f: _get_writer(data).write(observation, f))
+
+
+def _visit_batch(batch):
+    """
+    Reads, updates and writes a batch of observations. Runs in the worker processes.
+    :param batch: list of (name, path, data) tuples
+    :return: (number of visited observations, list of (name, error message) of the failures)
+    """
+    failures = []
+    loaded = []
+    for (name, path, data) in batch:
+        try:
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            loaded.append((name, data, _reader.read(BytesIO(data))))
+        except Exception as e:
+            failures.append((name, 'read: {}'.format(e)))
+    if hasattr(_plugin, 'update_batch'):
+        try:
+            _plugin.update_batch([observation for (_, _, observation) in loaded])
+        except Exception as e:
+            failures.extend([(name, 'update_batch: {}'.format(e)) for (name, _, _) in loaded])
+            loaded = []
+    else:
+        updated = []
+        for (name, data, observation) in loaded:
+            try:
+                _plugin.update(observation)
+                updated.append((name, data, observation))
+            except Exception as e:
+                failures.append((name, 'update: {}'.format(e)))
+        loaded = updated
+    count = 0
+    for (name, data, observation) in loaded:
+        try:
+            _write(name, data, observation)
+            count += 1
+        except Exception as e:
+            failures.append((name, 'write: {}'.format(e)))
+    return count, failures
+
+
+def visit_local(plugin, source, output_dir, processes=1, batch_size=DEFAULT_TASK_SIZE):
+    """
+    Applies a visitor plugin to observations stored in local files and writes the updated
+    observations to output_dir, in the namespace of the original documents and at the same
+    path relative to the source. The source is listed lazily and the observations are
+    processed in batches by a pool of processes, so the memory use does not depend on the
+    number of files.
+    :param plugin: path to python file that contains the ObservationUpdater class
+    :param source: directory, tar archive or glob pattern of the observation documents
+    :param output_dir: directory the updated documents are written to
+    :param processes: number of worker processes
+    :param batch_size: number of observations per task sent to a worker process, and passed
+    at once to the update_batch method of the plugins that implement it
+    :return: number of visited observations
+    """
+    if not os.path.isfile(plugin):
+        raise Exception('Cannot find plugin file ' + plugin)
+    assert processes >= 1
+    assert batch_size >= 1
+    tasks = batches(iter_source(source), batch_size)
+    count = 0
+    failures = []
+    if processes > 1:
+        pool = Pool(processes, _init_worker, (plugin, output_dir))
+        try:
+            results = imap_bounded(pool, _visit_batch, tasks, processes)
+            for (batch_count, batch_failures) in results:
+                count += batch_count
+                failures.extend(batch_failures)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(plugin, output_dir)
+        for batch in tasks:
+            (batch_count, batch_failures) = _visit_batch(batch)
+            count += batch_count
+            failures.extend(batch_failures)
+    for (name, error) in failures:
+        logging.error('Failed to visit {}: {}'.format(name, error))
+    logging.info('Visited {} observations from {}'.format(count, source))
+    if failures:
+        raise Exception('Failed to visit {} of {} observations from {}:\n{}'.format(
+            len(failures), count + len(failures), source,
+            '\n'.join('{}: {}'.format(name, error)
+                      for (name, error) in failures[:MAX_REPORTED_FAILURES])))
+    return count
@@ -0,0 +1,329 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Throughput, ETA and progress reporting of long visits """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from multiprocessing.sharedctypes import RawArray
+
+__all__ = ['ProgressReporter']
+
+# default number of seconds between reports
+DEFAULT_INTERVAL = 60
+# indexes of the counters of a worker in the shared progress arrays
+_TOTAL, _VISITED, _LATENCY = range(3)
+
+
+class ProgressReporter(object):
+
+    """
+    Reports the progress of a visit: number of visited observations, estimated total,
+    observations per second, moving-average latency per observation and ETA.
+
+    The total is estimated from the listing pages: the density of the observations in the
+    part of the [start, end] interval that has been listed is extrapolated to the rest of
+    the interval until the last page is listed.
+
+    Reports are written at most every interval seconds as a line to stream and/or as a JSON
+    document to status_file.
+    """
+
+    def __init__(self, stream=None, status_file=None, interval=DEFAULT_INTERVAL):
+        """
+        :param stream: optional file-like object reports are written to (e.g. sys.stderr)
+        :param status_file: optional file overwritten with the latest report in JSON
+        :param interval: minimum number of seconds between reports
+        """
+        self.stream = stream
+        self.status_file = status_file
+        self.interval = interval
+        self.visited = 0
+        self.latency_sum = 0.0
+        self._total = None
+        # observations visited before the current interval (e.g. by previous shards)
+        self._base = 0
+        self._listed = 0
+        self._origin = None
+        self._origin_listed = 0
+        self._end = None
+        self._started = time.time()
+        self._next_report = self._started + interval
+        # counters at the previous report, used for the moving averages
+        self._previous = (self._started, 0, 0.0)
+        # shared arrays and slot published to by a worker process
+        self._shared = None
+        self._watcher = None
+
+    def begin(self, start=None, end=None):
+        """
+        Starts reporting the visit of the [start, end] interval.
+        """
+        self._origin = start
+        self._end = end
+        self._base = self.visited
+        self._listed = 0
+        self._origin_listed = 0
+        self._total = None
+        self._started = time.time()
+        self._next_report = self._started + self.interval
+        self._previous = (self._started, self.visited, self.latency_sum)
+
+    def listed(self, count, last_date, complete):
+        """
+        Updates the estimated total with a page of the listing.
+        :param count: number of observations to visit in the page
+        :param last_date: last modified date of the last observation in the page
+        :param complete: True if this is the last page of the listing
+        """
+        self._listed += count
+        if complete:
+            self._total = self._base + self._listed
+        elif last_date is not None:
+            if self._origin is None:
+                # no start date: extrapolate from the pages following this one
+                self._origin = last_date
+                self._origin_listed = self._listed
+            else:
+                end = self._end if self._end is not None else datetime.utcnow()
+                covered = _seconds(last_date - self._origin)
+                if covered > 0:
+                    density = (self._listed - self._origin_listed) / covered
+                    remaining = max(0.0, _seconds(end - last_date))
+                    self._total = self._base + self._listed + int(density * remaining)
+        self._publish()
+        self.report()
+
+    def observations_visited(self, count, seconds):
+        """
+        Records visited observations.
+        :param count: number of observations
+        :param seconds: time spent visiting them
+        """
+        self.visited += count
+        self.latency_sum += seconds
+        self._publish()
+        self.report()
+
+    def estimated_total(self):
+        """
+        :return: the estimated number of observations to visit or None if unknown
+        """
+        if self._total is None:
+            return None
+        return max(self._total, self.visited)
+
+    def status(self):
+        """
+        :return: dictionary with the elapsed time, number of visited observations, estimated
+        total, observations per second and average latency (seconds) since the previous
+        report, and ETA (seconds)
+        """
+        now = time.time()
+        (previous_time, previous_visited, previous_latency) = self._previous
+        window_visited = self.visited - previous_visited
+        window = now - previous_time
+        rate = window_visited / window if window > 0 else None
+        latency = None
+        if window_visited > 0:
+            latency = (self.latency_sum - previous_latency) / window_visited
+        elif self.visited > 0:
+            latency = self.latency_sum / self.visited
+        total = self.estimated_total()
+        eta = None
+        if total is not None and rate:
+            eta = (total - self.visited) / rate
+        return {'elapsed': now - self._started, 'visited': self.visited, 'total': total,
+                'rate': rate, 'latency': latency, 'eta': eta}
+
+    def report(self, force=False):
+        """
+        Writes a report if the interval has elapsed since the previous one or force is True.
+        """
+        now = time.time()
+        if not force and now < self._next_report:
+            return
+        self._next_report = now + self.interval
+        if self.stream is None and self.status_file is None:
+            return
+        status = self.status()
+        self._previous = (now, self.visited, self.latency_sum)
+        if self.stream is not None:
+            self.stream.write(format_status(status) + '\n')
+            self.stream.flush()
+        if self.status_file is not None:
+            status['time'] = now
+            tmp_file = '{}.{}.tmp'.format(self.status_file, os.getpid())
+            try:
+                with open(tmp_file, 'w') as f:
+                    json.dump(status, f)
+                os.rename(tmp_file, self.status_file)
+            except (IOError, OSError) as e:
+                logging.warn('Cannot write status file {}: {}'.format(self.status_file, e))
+
+    def finish(self):
+        """
+        Writes the final report.
+        """
+        self.stop_watching()
+        self._total = self.visited
+        self.report(force=True)
+
+    def share(self, slots):
+        """
+        Creates the arrays shared with the worker processes of a partitioned visit.
+        :param slots: number of workers
+        :return: the shared arrays, to be passed to attach() in each worker
+        """
+        return (RawArray('d', slots), RawArray('d', slots), RawArray('d', slots))
+
+    def attach(self, shared, slot):
+        """
+        Publishes the counters of this (worker) reporter to a slot of the shared arrays.
+        """
+        self._shared = (shared, slot)
+        self._publish()
+
+    def _publish(self):
+        if self._shared is not None:
+            (arrays, slot) = self._shared
+            total = self.estimated_total()
+            # -1 flags an unknown total
+            arrays[_TOTAL][slot] = -1 if total is None else total
+            arrays[_VISITED][slot] = self.visited
+            arrays[_LATENCY][slot] = self.latency_sum
+
+    def watch(self, shared):
+        """
+        Starts a thread reporting the sum of the counters published by the workers.
+        """
+        self._watcher = _Watcher(self, shared)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _aggregate(self, shared):
+        totals = list(shared[_TOTAL])
+        self.visited = int(sum(shared[_VISITED]))
+        self.latency_sum = sum(shared[_LATENCY])
+        self._total = None if min(totals) < 0 else int(sum(totals))
+
+
+class _Watcher(threading.Thread):
+    """Thread aggregating and reporting the progress of the worker processes."""
+
+    def __init__(self, reporter, shared):
+        super(_Watcher, self).__init__(name='progress')
+        self.daemon = True
+        self._reporter = reporter
+        self._shared = shared
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(min(1, self._reporter.interval)):
+            self._reporter._aggregate(self._shared)
+            self._reporter.report()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self._reporter._aggregate(self._shared)
+
+
+def format_status(status):
+    """
+    :return: a one line summary of a status returned by ProgressReporter.status
+    """
+    text = '{} Visited {}'.format(datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'), status['visited'])
+    if status['total'] is not None:
+        percent = 100.0 * status['visited'] / status['total'] if status['total'] else 100.0
+        text += ' of ~{} observations ({:.1f}%)'.format(status['total'], percent)
+    else:
+        text += ' observations'
+    if status['rate'] is not None:
+        text += ', {:.2f} obs/s'.format(status['rate'])
+    if status['latency'] is not None:
+        text += ', latency {:.0f} ms'.format(1000 * status['latency'])
+    if status['eta'] is not None:
+        text += ', ETA {}'.format(timedelta(seconds=int(status['eta'])))
+    return text
+
+
+def _seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
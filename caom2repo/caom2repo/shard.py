@@ -0,0 +1,437 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Visit of a collection split into shards between workers sharing a directory """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from .common import DATE_FORMAT, write_atomic
+from .filters import AllFilters
+from .plugin import load_plugin, is_analysis_plugin
+
+__all__ = ['ShardedVisit', 'HashShardFilter', 'LeaseLostError']
+
+# ways of splitting the observations of a collection into shards
+TIME_SHARDS = 'time'
+HASH_SHARDS = 'hash'
+# seconds after which the lease of a worker that stopped renewing it expires
+DEFAULT_LEASE_TTL = 300
+PLAN_FILE = 'plan.json'
+LEASE_EXT = '.lease.'
+DONE_EXT = '.done'
+
+
+class LeaseLostError(Exception):
+    """The lease of a shard has been claimed by another worker."""
+    pass
+
+
+class HashShardFilter(object):
+    """Accepts the observation IDs of one of the hash shards of a collection"""
+
+    def __init__(self, index, count):
+        """
+        :param index: index of the shard
+        :param count: total number of shards
+        """
+        self.index = index
+        self.count = count
+
+    def __call__(self, observation_id, last_modified=None):
+        # crc32 is stable across processes and machines, unlike the built-in hash
+        checksum = zlib.crc32(observation_id.encode('utf-8')) & 0xffffffff
+        return checksum % self.count == self.index
+
+
+class _LeaseFilter(object):
+    """
+    Accepts every observation but raises LeaseLostError once another worker has claimed the
+    shard, which stops the visit. The lease files are checked on the first call and then at
+    most every interval seconds.
+    Unlike the lease keeper it can be passed to the worker processes of the visit.
+    """
+
+    def __init__(self, shard_dir, shard_name, generation, interval):
+        self.shard_dir = shard_dir
+        self.shard_name = shard_name
+        self.generation = generation
+        self.interval = interval
+        # checked by the first call
+        self._checked = 0
+
+    def __call__(self, observation_id, last_modified=None):
+        if time.time() - self._checked > self.interval:
+            self._checked = time.time()
+            lease = _get_lease(self.shard_dir, self.shard_name)
+            if lease is None or lease[0] != self.generation:
+                raise LeaseLostError('Lease {} on {} lost'.format(self.generation,
+                                                                   self.shard_name))
+        return True
+
+
+class _LeaseKeeper(threading.Thread):
+    """Thread renewing the lease of a shard while it is being visited."""
+
+    def __init__(self, sharded_visit, shard_name, generation, interval):
+        super(_LeaseKeeper, self).__init__(name='lease-{}'.format(shard_name))
+        self.daemon = True
+        self._sharded_visit = sharded_visit
+        self._shard_name = shard_name
+        self._generation = generation
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self._interval):
+            lease = self._sharded_visit._get_lease(self._shard_name)
+            if lease is None or lease[0] != self._generation:
+                logging.warn('Lost lease on {}'.format(self._shard_name))
+                self.lost.set()
+                return
+            try:
+                os.utime(lease[1], None)
+            except OSError as e:
+                logging.warn('Cannot renew lease on {}: {}'.format(self._shard_name, e))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ShardedVisit(object):
+
+    """
+    Visits a collection split into shards between several workers, possibly on different
+    machines, that coordinate through lease files in a shared directory.
+
+    The first worker computes the shards and saves them in the plan file of the directory.
+    Workers then claim shards by creating lease files and renew them while visiting the
+    shard. The lease of a worker that dies expires after lease_ttl seconds and the shard is
+    claimed by another worker. Completed shards are recorded in the directory so an
+    interrupted visit can be restarted by running the workers again.
+    """
+
+    def __init__(self, client, shard_dir, lease_ttl=DEFAULT_LEASE_TTL, worker_id=None):
+        """
+        :param client: CAOM2RepoClient used to visit the claimed shards
+        :param shard_dir: directory shared by the workers
+        :param lease_ttl: seconds after which a lease that is not renewed expires
+        :param worker_id: identifier of this worker (default <hostname>:<pid>)
+        """
+        assert client is not None
+        assert shard_dir is not None
+        assert lease_ttl > 0
+        self.client = client
+        self.shard_dir = shard_dir
+        self.lease_ttl = lease_ttl
+        if worker_id is None:
+            worker_id = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.worker_id = worker_id
+        if not os.path.isdir(shard_dir):
+            try:
+                os.makedirs(shard_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def run(self, plugin, collection, start=None, end=None, shards=None, shard_by=TIME_SHARDS,
+            partition=None, **kwargs):
+        """
+        Claims and visits shards until all of them are completed.
+        :param plugin: path to python file that contains the algorithm to be applied to visited
+                        observations
+        :param collection: name of the CAOM2 collection
+        :param start: optional earliest date-time of the targeted observation set
+        :param end: optional latest date-time of the targeted observation set
+        :param shards: number of shards. Only required by the worker creating the plan
+        :param shard_by: TIME_SHARDS to split [start, end] into time windows or HASH_SHARDS
+                        to split the observations by the hash of their IDs
+        :param partition: strategy used for the time shards and for the sub-ranges of the
+                        worker processes (see CAOM2RepoClient.visit). Defaults to
+                        EQUAL_PARTITION
+        :param kwargs: additional arguments of CAOM2RepoClient.visit used to visit each shard,
+                        e.g. processes
+        :return: number of observations visited by this worker
+        """
+        # core imports this module
+        from .core import EQUAL_PARTITION
+        if not os.path.isfile(plugin):
+            raise Exception('Cannot find plugin file ' + plugin)
+        if is_analysis_plugin(load_plugin(plugin)):
+            # the result of each shard would only be known to the worker that visited it
+            raise Exception('Map and reduce plugins cannot be used in sharded visits: ' + plugin)
+        if partition is None:
+            partition = EQUAL_PARTITION
+        plan = self._get_plan(collection, start, end, shards, shard_by, partition)
+        visit_args = dict(kwargs)
+        visit_args['partition'] = partition
+
+        count = 0
+        while True:
+            pending = [shard for shard in plan['shards'] if not self._is_done(shard['name'])]
+            if not pending:
+                break
+            claimed = False
+            for shard in pending:
+                generation = self._claim(shard['name'])
+                if generation is None:
+                    continue
+                claimed = True
+                count += self._visit_shard(plugin, plan, shard, generation, visit_args)
+            if not claimed:
+                # remaining shards are leased by other workers: wait for them to complete
+                # or for their leases to expire
+                logging.info('Waiting for {} shards leased by other workers'.format(len(pending)))
+                time.sleep(max(1, self.lease_ttl / 4))
+        logging.info('All {} shards completed'.format(len(plan['shards'])))
+        return count
+
+    def _visit_shard(self, plugin, plan, shard, generation, visit_args):
+        """
+        Visits a claimed shard and records its completion.
+        :return: number of visited observations
+        """
+        name = shard['name']
+        if self._is_done(name):
+            # completed by another worker since the list of pending shards was built
+            self._release(name, generation)
+            return 0
+        logging.info('Worker {} visits {}'.format(self.worker_id, name))
+        interval = max(1, self.lease_ttl / 3)
+        keeper = _LeaseKeeper(self, name, generation, interval)
+        keeper.start()
+        visit_args = dict(visit_args)
+        hash_filter = None
+        if plan['shard_by'] == HASH_SHARDS:
+            hash_filter = HashShardFilter(shard['index'], len(plan['shards']))
+        visit_args['accept'] = AllFilters(
+            _LeaseFilter(self.shard_dir, name, generation, interval), hash_filter,
+            visit_args.get('accept'))
+        try:
+            if plan['shard_by'] == HASH_SHARDS:
+                count = self.client.visit(plugin, plan['collection'],
+                                          start=_str2date(plan['start']),
+                                          end=_str2date(plan['end']),
+                                          **visit_args)
+            else:
+                count = self.client.visit(plugin, plan['collection'],
+                                          start=_str2date(shard['start']),
+                                          end=_str2date(shard['end']),
+                                          **visit_args)
+        except Exception as e:
+            keeper.stop()
+            lost = keeper.lost.is_set() or isinstance(e, LeaseLostError) or \
+                not self._holds(name, generation)
+            self._release(name, generation)
+            if lost:
+                # another worker has taken over the shard and will record its completion
+                logging.warn('Lease on {} expired while visiting it: {}'.format(name, e))
+                return 0
+            raise
+        keeper.stop()
+        if keeper.lost.is_set() or not self._holds(name, generation):
+            logging.warn('Lease on {} expired while visiting it'.format(name))
+            self._release(name, generation)
+            return count
+        done = {'worker': self.worker_id, 'count': count,
+                'completed': datetime.utcnow().strftime(DATE_FORMAT)}
+        write_atomic(os.path.join(self.shard_dir, name + DONE_EXT),
+                     json.dumps(done).encode('utf-8'))
+        self._release(name, generation)
+        logging.info('Worker {} completed {} ({} observations)'.format(self.worker_id, name, count))
+        return count
+
+    def _get_plan(self, collection, start, end, shards, shard_by, partition):
+        """
+        Returns the plan of the visit, creating it if this is the first worker.
+        """
+        plan_file = os.path.join(self.shard_dir, PLAN_FILE)
+        if not os.path.isfile(plan_file):
+            if shards is None or shards < 1:
+                raise ValueError('Number of shards required to create the plan in {}'.
+                                 format(self.shard_dir))
+            if end is None:
+                # observations posted back by the visit move to the end of the listing and must
+                # not be visited again by the shards that start later
+                end = datetime.utcnow()
+            if shard_by == HASH_SHARDS:
+                shard_list = [{'index': i} for i in range(shards)]
+            elif shard_by == TIME_SHARDS:
+                ranges = self.client._partition(collection, start, end, shards, partition)
+                shard_list = [{'start': _date2str(lower), 'end': _date2str(upper)}
+                              for (lower, upper) in ranges]
+            else:
+                raise ValueError('Unknown shard type: {}'.format(shard_by))
+            for i, shard in enumerate(shard_list):
+                shard['name'] = 'shard-{:04d}'.format(i)
+            plan = {'collection': collection, 'start': _date2str(start), 'end': _date2str(end),
+                    'shard_by': shard_by, 'shards': shard_list}
+            if write_atomic(plan_file, json.dumps(plan).encode('utf-8'), overwrite=False):
+                logging.info('Created plan with {} shards in {}'.format(len(shard_list), plan_file))
+                return plan
+        with open(plan_file) as f:
+            plan = json.load(f)
+        if plan['collection'] != collection or plan['shard_by'] != shard_by:
+            raise ValueError('{} is a plan to visit {} by {}'.format(
+                plan_file, plan['collection'], plan['shard_by']))
+        return plan
+
+    def _get_lease(self, name):
+        """
+        Returns the most recent lease of a shard.
+        :return: tuple of (generation, path, age in seconds) or None when the shard is not leased
+        """
+        return _get_lease(self.shard_dir, name)
+
+    def _holds(self, name, generation):
+        """
+        :return: True if generation is the most recent lease of the shard
+        """
+        lease = self._get_lease(name)
+        return lease is not None and lease[0] == generation
+
+    def _claim(self, name):
+        """
+        Claims the lease of a shard. A new lease generation is created when the shard is not
+        leased or its lease has expired. Creating the lease file is exclusive so only one
+        worker can claim a given generation.
+        :return: the claimed generation or None if the shard is leased by another worker
+        """
+        lease = self._get_lease(name)
+        if lease is None:
+            generation = 0
+        elif lease[2] > self.lease_ttl:
+            logging.info('Lease {} on {} expired'.format(lease[0], name))
+            generation = lease[0] + 1
+        else:
+            return None
+        path = os.path.join(self.shard_dir, '{}{}{}'.format(name, LEASE_EXT, generation))
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return None
+            raise
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.worker_id)
+        return generation
+
+    def _release(self, name, generation):
+        """
+        Removes the lease file of a generation of a shard. The more recent leases of workers
+        that have taken over the shard are kept.
+        """
+        try:
+            os.remove(os.path.join(self.shard_dir, '{}{}{}'.format(name, LEASE_EXT, generation)))
+        except OSError:
+            pass
+
+    def _is_done(self, name):
+        return os.path.isfile(os.path.join(self.shard_dir, name + DONE_EXT))
+
+
+def _get_lease(shard_dir, name):
+    """
+    Returns the most recent lease of a shard.
+    :return: tuple of (generation, path, age in seconds) or None when the shard is not leased
+    """
+    prefix = name + LEASE_EXT
+    generations = []
+    for file_name in os.listdir(shard_dir):
+        if file_name.startswith(prefix) and file_name[len(prefix):].isdigit():
+            generations.append(int(file_name[len(prefix):]))
+    while generations:
+        generation = max(generations)
+        path = os.path.join(shard_dir, '{}{}'.format(prefix, generation))
+        try:
+            return generation, path, time.time() - os.path.getmtime(path)
+        except OSError:
+            # released in the meantime
+            generations.remove(generation)
+    return None
+
+
+def _date2str(d):
+    return None if d is None else d.strftime(DATE_FORMAT)
+
+
+def _str2date(s):
+    return None if s is None else datetime.strptime(s, DATE_FORMAT)
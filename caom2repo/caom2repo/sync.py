@@ -0,0 +1,243 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Incremental copy of collections of a CAOM2 repo to a local directory """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+from .bulk import DEFAULT_THREADS
+from .common import DATE_FORMAT, batches, write_atomic
+
+__all__ = ['CollectionMirror']
+
+# number of observations downloaded between two saves of the watermark
+DEFAULT_PAGE_SIZE = 10000
+WATERMARK_FILE = '.watermark'
+XML_EXT = '.xml'
+
+
+class CollectionMirror(object):
+    """
+    Keeps a copy of collections in a local directory, with one file per observation:
+
+        <mirror_dir>/<collection>/<observation ID>.xml
+
+    The documents are saved as returned by the repo. The listing of a collection is ordered
+    by the last modification of the observations, so the latest modification date copied is
+    saved as a watermark in <mirror_dir>/<collection>/.watermark and the next sync only lists
+    and downloads the observations modified since then.
+
+    The listing does not include deleted observations: they are found by comparing the
+    complete listing of the collection with the local files when pruning.
+    """
+
+    def __init__(self, client, mirror_dir, threads=DEFAULT_THREADS,
+                 page_size=DEFAULT_PAGE_SIZE):
+        """
+        :param client: CAOM2RepoClient used to list and download the observations
+        :param mirror_dir: directory of the local copies
+        :param threads: number of concurrent downloads
+        :param page_size: number of observations downloaded between two saves of the
+                          watermark
+        """
+        assert client is not None
+        assert mirror_dir is not None
+        assert threads >= 1
+        assert page_size > 1
+        self.client = client
+        self.mirror_dir = mirror_dir
+        self.threads = threads
+        self.page_size = page_size
+
+    def sync(self, collection, prune=False, full=False, listing=None):
+        """
+        Downloads the observations of a collection modified since the last sync.
+        :param collection: name of the collection
+        :param prune: also remove the local observations that are no longer in the repo
+        :param full: ignore the watermark and download the whole collection again
+        :param listing: complete listing of the collection used instead of the listing of
+                        the repo, as (observation ID, last modified date) tuples in last
+                        modified order, e.g. read with caom2repo.listing.read_listing
+        :return: tuple of (number of downloaded observations, number of removed observations)
+        """
+        assert collection is not None
+        directory = os.path.join(self.mirror_dir, collection)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        watermark = None if full else self.get_watermark(collection)
+        if watermark is None:
+            start, done = None, set()
+        else:
+            start, done = watermark
+        # observations modified during the sync are copied by the next one
+        end = datetime.utcnow()
+        logging.info('Sync {} from {}'.format(collection, start))
+
+        if listing is not None:
+            listing = list(listing)
+            rows = [row for row in listing if start is None or row[1] >= start]
+        else:
+            rows = self.client.list_observations(collection, start, end)
+        pages = batches(rows, self.page_size)
+        count = 0
+        pool = ThreadPool(self.threads)
+        try:
+            for rows in pages:
+                rows = [row for row in rows if row[1] != start or row[0] not in done]
+                failures = []
+                results = pool.imap(lambda row: self._download(collection, row[0]), rows)
+                for (row, error) in zip(rows, results):
+                    if error is not None:
+                        failures.append((row[0], error))
+                    elif not failures:
+                        # the watermark only moves past the observations that were copied
+                        if row[1] != start:
+                            start, done = row[1], set()
+                        done.add(row[0])
+                        count += 1
+                self._set_watermark(collection, start, done)
+                if failures:
+                    raise Exception('Failed to download {} observations of {}:\n{}'.format(
+                        len(failures), collection,
+                        '\n'.join('{}: {}'.format(observation_id, error)
+                                  for (observation_id, error) in failures[:20])))
+        finally:
+            pool.close()
+            pool.join()
+
+        removed = self.prune(collection, listing) if prune else 0
+        logging.info('Sync {}: {} observations downloaded, {} removed'.format(
+            collection, count, removed))
+        return count, removed
+
+    def prune(self, collection, listing=None):
+        """
+        Removes the local copies of the observations that are not in the listing of the
+        collection anymore.
+        :param collection: name of the collection
+        :param listing: complete listing of the collection used instead of the listing of
+                        the repo
+        :return: number of removed observations
+        """
+        if listing is None:
+            listing = self.client.list_observations(collection)
+        listed = set(observation_id for (observation_id, _) in listing)
+        directory = os.path.join(self.mirror_dir, collection)
+        removed = 0
+        for name in os.listdir(directory):
+            if name.endswith(XML_EXT) and name[:-len(XML_EXT)] not in listed:
+                logging.info('Remove {}/{}'.format(collection, name))
+                os.remove(os.path.join(directory, name))
+                removed += 1
+        return removed
+
+    def get_watermark(self, collection):
+        """
+        :param collection: name of the collection
+        :return: tuple of (last modification date copied, set of the IDs of the observations
+        copied with that date) or None when the collection has not been synced yet
+        """
+        path = os.path.join(self.mirror_dir, collection, WATERMARK_FILE)
+        if not os.path.isfile(path):
+            return None
+        with io.open(path, encoding='utf-8') as f:
+            watermark = json.load(f)
+        if watermark['lastModified'] is None:
+            return None
+        return (datetime.strptime(watermark['lastModified'], DATE_FORMAT),
+                set(watermark['observationIDs']))
+
+    def _set_watermark(self, collection, last_modified, observation_ids):
+        watermark = {'collection': collection,
+                     'lastModified': None if last_modified is None else
+                     last_modified.strftime(DATE_FORMAT),
+                     'observationIDs': sorted(observation_ids)}
+        path = os.path.join(self.mirror_dir, collection, WATERMARK_FILE)
+        write_atomic(path, json.dumps(watermark, sort_keys=True).encode('utf-8'))
+
+    def _download(self, collection, observation_id):
+        """
+        Downloads an observation to the mirror. Runs in the threads of the pool.
+        :return: None or the error
+        """
+        try:
+            content = self.client.get_observation_xml(collection, observation_id)
+            write_atomic(os.path.join(self.mirror_dir, collection, observation_id + XML_EXT), content)
+            return None
+        except Exception as e:
+            logging.debug('Failed to download {}/{}: {}'.format(collection, observation_id, e))
+            return e
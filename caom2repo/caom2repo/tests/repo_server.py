@@ -0,0 +1,477 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+
+""" Local stand-in for a CAOM2 repo service, used for tests and benchmarks """
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import errno
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs, unquote
+
+from caom2repo.common import DATE_FORMAT
+
+__all__ = ['RepoServer', 'MemoryStore', 'DirectoryStore']
+
+# resolution of the lastModified dates of the repo
+RESOLUTION = timedelta(milliseconds=1)
+DEFAULT_MAXREC = 10000
+# prefixes of the repo resources depending on the authentication (see cadcutils BaseWsClient)
+AUTH_PREFIXES = ('auth', 'pub')
+# number of bytes written at a time when the bandwidth is capped
+CHUNK_SIZE = 8192
+
+
+class MemoryStore(object):
+
+    """
+    Observation documents kept in memory and indexed by collection, observation ID and
+    lastModified date.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # collection -> observation ID -> last modified date
+        self._index = {}
+        self._last_modified = datetime(1970, 1, 1)
+        self._documents = {}
+
+    def _next_date(self, last_modified=None):
+        """
+        :return: a lastModified date that is unique and more recent than the previous ones,
+        unless a date is imposed
+        """
+        if last_modified is None:
+            now = datetime.utcnow()
+            last_modified = max(now - timedelta(microseconds=now.microsecond % 1000),
+                                self._last_modified + RESOLUTION)
+        self._last_modified = max(self._last_modified, last_modified)
+        return last_modified
+
+    def add(self, collection, observation_id, document, last_modified=None):
+        """
+        Adds or replaces an observation document.
+        :param last_modified: date of the observation in the listing (default: now)
+        :return: the lastModified date of the observation
+        """
+        with self._lock:
+            last_modified = self._next_date(last_modified)
+            self._write(collection, observation_id, document)
+            self._index.setdefault(collection, {})[observation_id] = last_modified
+            return last_modified
+
+    def get(self, collection, observation_id):
+        """
+        :return: the observation document or None if it does not exist
+        """
+        with self._lock:
+            if observation_id not in self._index.get(collection, {}):
+                return None
+        return self._read(collection, observation_id)
+
+    def exists(self, collection, observation_id):
+        with self._lock:
+            return observation_id in self._index.get(collection, {})
+
+    def remove(self, collection, observation_id):
+        """
+        :return: True if the observation existed, False otherwise
+        """
+        with self._lock:
+            if self._index.get(collection, {}).pop(observation_id, None) is None:
+                return False
+            self._delete(collection, observation_id)
+            return True
+
+    def listing(self, collection, start=None, end=None, maxrec=DEFAULT_MAXREC):
+        """
+        :return: list of (observation ID, lastModified) of a collection in lastModified order,
+        with start and end inclusive
+        """
+        with self._lock:
+            rows = [(last_modified, observation_id) for (observation_id, last_modified)
+                    in self._index.get(collection, {}).items()
+                    if (start is None or last_modified >= start) and
+                    (end is None or last_modified <= end)]
+        rows.sort()
+        return [(observation_id, last_modified) for (last_modified, observation_id) in rows[:maxrec]]
+
+    def count(self, collection):
+        with self._lock:
+            return len(self._index.get(collection, {}))
+
+    def _write(self, collection, observation_id, document):
+        self._documents[(collection, observation_id)] = document
+
+    def _read(self, collection, observation_id):
+        return self._documents.get((collection, observation_id))
+
+    def _delete(self, collection, observation_id):
+        self._documents.pop((collection, observation_id), None)
+
+
+class DirectoryStore(MemoryStore):
+
+    """
+    Observation documents kept in <root>/<collection>/<observation ID>.xml files. The index
+    is built from the files and their modification times when the store is created.
+    """
+
+    def __init__(self, root):
+        super(DirectoryStore, self).__init__()
+        self.root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        for collection in os.listdir(root):
+            collection_dir = os.path.join(root, collection)
+            if not os.path.isdir(collection_dir):
+                continue
+            for file_name in os.listdir(collection_dir):
+                if file_name.endswith('.xml'):
+                    mtime = datetime.utcfromtimestamp(
+                        os.path.getmtime(os.path.join(collection_dir, file_name)))
+                    mtime -= timedelta(microseconds=mtime.microsecond % 1000)
+                    self._index.setdefault(collection, {})[file_name[:-len('.xml')]] = mtime
+                    self._last_modified = max(self._last_modified, mtime)
+
+    def _path(self, collection, observation_id):
+        return os.path.join(self.root, collection, observation_id + '.xml')
+
+    def _write(self, collection, observation_id, document):
+        path = self._path(collection, observation_id)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(path, 'wb') as f:
+            f.write(document)
+
+    def _read(self, collection, observation_id):
+        try:
+            with open(self._path(collection, observation_id), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def _delete(self, collection, observation_id):
+        try:
+            os.remove(self._path(collection, observation_id))
+        except OSError:
+            pass
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Implements the listing, GET, PUT, POST and DELETE endpoints of the repo."""
+
+    protocol_version = 'HTTP/1.1'
+    # the status line, headers and body are written separately: without TCP_NODELAY each
+    # response waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug('repo_server: ' + format % args)
+
+    def _parse_path(self):
+        """
+        :return: tuple of (collection, observation ID or None, query parameters) or None if
+        the path is not a resource of the service
+        """
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        if not parts or parts[0] != self.server.repo.service:
+            return None
+        parts = parts[1:]
+        if parts and parts[0] in AUTH_PREFIXES:
+            parts = parts[1:]
+        if len(parts) == 1:
+            return parts[0], None, parse_qs(url.query)
+        if len(parts) == 2:
+            return parts[0], parts[1], parse_qs(url.query)
+        return None
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = b''
+        while len(body) < length:
+            data = self.rfile.read(min(CHUNK_SIZE, length - len(body)))
+            if not data:
+                break
+            body += data
+            self.server.repo.throttle(len(data))
+        return body
+
+    def _send(self, status, body=b'', content_type='text/plain', headers=None):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        for offset in range(0, len(body), CHUNK_SIZE):
+            chunk = body[offset:offset + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            self.server.repo.throttle(len(chunk))
+
+    def _handle(self):
+        server = self.server.repo
+        server.count_request(self.command)
+        body = self._read_body() if self.command in ('PUT', 'POST') else None
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and server.random.random() < server.error_rate:
+            server.count_request('ERROR')
+            self._send(server.error_status, 'Injected error',
+                       headers={'Retry-After': '0'})
+            return
+        resource = self._parse_path()
+        if resource is None:
+            self._send(404, 'Not found: {}'.format(self.path))
+            return
+        (collection, observation_id, params) = resource
+        store = server.store
+        if observation_id is None:
+            if self.command != 'GET':
+                self._send(405, 'Method not allowed')
+                return
+            try:
+                start = _get_date(params, 'START')
+                end = _get_date(params, 'END')
+                maxrec = int(params.get('MAXREC', [DEFAULT_MAXREC])[0])
+            except ValueError as e:
+                self._send(400, str(e))
+                return
+            rows = store.listing(collection, start, end, maxrec)
+            self._send(200, ''.join(['{},{}\n'.format(observation_id,
+                                                      last_modified.strftime(DATE_FORMAT)[:-3])
+                                     for (observation_id, last_modified) in rows]), 'text/csv')
+        elif self.command == 'GET':
+            document = store.get(collection, observation_id)
+            if document is None:
+                self._send(404, 'Observation not found: {}/{}'.format(collection, observation_id))
+            else:
+                self._send(200, document, 'text/xml')
+        elif self.command == 'PUT':
+            if store.exists(collection, observation_id):
+                self._send(409, 'Observation already exists: {}/{}'.format(collection,
+                                                                           observation_id))
+            else:
+                store.add(collection, observation_id, body)
+                self._send(200)
+        elif self.command == 'POST':
+            if not store.exists(collection, observation_id):
+                self._send(404, 'Observation not found: {}/{}'.format(collection, observation_id))
+            else:
+                store.add(collection, observation_id, body)
+                self._send(200)
+        elif self.command == 'DELETE':
+            if store.remove(collection, observation_id):
+                self._send(200)
+            else:
+                self._send(404, 'Observation not found: {}/{}'.format(collection, observation_id))
+        else:
+            self._send(405, 'Method not allowed')
+
+    do_GET = _handle
+    do_HEAD = _handle
+    do_PUT = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class RepoServer(object):
+
+    """
+    Lightweight HTTP server implementing the listing, GET, PUT, POST and DELETE endpoints of
+    a CAOM2 repo over a MemoryStore or DirectoryStore. Latency, injected errors and bandwidth
+    can be configured to exercise the client:
+
+        with RepoServer() as server:
+            client = CAOM2RepoClient(host=server.host)
+
+    """
+
+    def __init__(self, store=None, port=0, service='caom2repo', latency=0, error_rate=0,
+                 error_status=503, bandwidth=None, seed=None):
+        """
+        :param store: store of the observations (default: a new MemoryStore)
+        :param port: port to listen to on localhost (default: any free port)
+        :param service: name of the service in the resource ID of the client
+        :param latency: seconds added to the processing of each request
+        :param error_rate: probability of answering a request with error_status
+        :param error_status: HTTP status of the injected errors
+        :param bandwidth: maximum number of bytes per second transferred by each request
+        :param seed: seed of the random injection of errors
+        """
+        self.store = store if store is not None else MemoryStore()
+        self.service = service
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.error_status = error_status
+        self.bandwidth = bandwidth
+        self.requests = {}
+        self._requests_lock = threading.Lock()
+        self._httpd = _ThreadingHTTPServer(('127.0.0.1', port), _RequestHandler)
+        # the handlers read the settings from this object at each request
+        self._httpd.repo = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def host(self):
+        """Host to pass to the client, e.g. CAOM2RepoClient(host=server.host)"""
+        return '127.0.0.1:{}'.format(self.port)
+
+    def count_request(self, method):
+        with self._requests_lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def throttle(self, nbytes):
+        if self.bandwidth:
+            time.sleep(nbytes / self.bandwidth)
+
+    def start(self):
+        """
+        Serves requests from a background thread.
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='repo-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+
+def _get_date(params, name):
+    if name not in params:
+        return None
+    return datetime.strptime(params[name][0], DATE_FORMAT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for a CAOM2 repo service')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen to on localhost')
+    parser.add_argument('--dir', help='directory of the observations (default: in memory)')
+    parser.add_argument('--service', default='caom2repo', help='name of the service')
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to each request')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='probability of answering a request with an error')
+    parser.add_argument('--bandwidth', type=float, help='bytes per second of each request')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    store = DirectoryStore(args.dir) if args.dir else None
+    server = RepoServer(store=store, port=args.port, service=args.service, latency=args.latency,
+                        error_rate=args.error_rate, bandwidth=args.bandwidth)
+    logging.info('Serving {} on {}'.format(args.service, server.host))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
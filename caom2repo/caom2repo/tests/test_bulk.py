@@ -0,0 +1,256 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from StringIO import StringIO
+
+import requests
+from mock import patch
+
+from caom2.obs_reader_writer import ObservationWriter, CAOM20_NAMESPACE
+from caom2.observation import SimpleObservation
+from caom2.plane import Plane
+from caom2repo.bulk import read_ids, read_observations, load_observations, \
+    delete_observations, write_report
+from caom2repo.core import CAOM2RepoClient
+from caom2repo.tests.repo_server import RepoServer
+
+
+class TestBulk(unittest.TestCase):
+
+    """Test the bulk operations"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # dated in the past, like the observations of a collection read later
+        self.date = (datetime.utcnow() - timedelta(hours=1)).replace(microsecond=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _add_observations(self, store, count):
+        for i in range(count):
+            store.add('cfht', 'obs{}'.format(i), '<obs{}/>'.format(i).encode('utf-8'),
+                      last_modified=self.date + timedelta(seconds=i // 2))
+
+    def test_read_ids(self):
+        path = os.path.join(self.tmp_dir, 'ids')
+        with open(path, 'w') as f:
+            f.write('a\n\n# comment\n b \nc,2017-01-01T00:00:00.000\n')
+        self.assertEquals(['a', 'b', 'c'], read_ids(path))
+        with patch('sys.stdin', StringIO('d\ne\n')):
+            self.assertEquals(['d', 'e'], read_ids('-'))
+
+    def test_read_observations(self):
+        with RepoServer() as server:
+            self._add_observations(server.store, 10)
+            client = CAOM2RepoClient(host=server.host)
+            results = read_observations(client, 'cfht', ['obs3', 'missing', 'obs7'],
+                                        output_dir=self.tmp_dir, threads=2)
+            self.assertEquals(['obs3', 'missing', 'obs7'], [row[0] for row in results])
+            self.assertIsNone(results[0][1])
+            self.assertTrue('HTTPError' in results[1][1])
+            self.assertEquals(['obs3.xml', 'obs7.xml'],
+                              sorted(os.listdir(os.path.join(self.tmp_dir, 'cfht'))))
+            with open(os.path.join(self.tmp_dir, 'cfht', 'obs7.xml'), 'rb') as f:
+                self.assertEquals(b'<obs7/>', f.read())
+
+            archive = os.path.join(self.tmp_dir, 'observations.tar.gz')
+            ids = [row[0] for row in client.list_observations('cfht')]
+            self.assertEquals(['obs{}'.format(i) for i in range(10)], ids)
+            results = read_observations(client, 'cfht', ids, archive=archive, threads=4)
+            self.assertEquals(10, len(results))
+            with tarfile.open(archive) as tar:
+                self.assertEquals(sorted('cfht/obs{}.xml'.format(i) for i in range(10)),
+                                  sorted(tar.getnames()))
+                self.assertEquals(b'<obs2/>', tar.extractfile('cfht/obs2.xml').read())
+
+        out = StringIO()
+        self.assertEquals(1, write_report([('a', None), ('b', 'HTTPError: 404')], out))
+        self.assertEquals('a\tOK\nb\tFAILED\tHTTPError: 404\n', out.getvalue())
+
+    def test_read_converted(self):
+        with RepoServer() as server:
+            for i in range(3):
+                content = io.BytesIO()
+                ObservationWriter().write(SimpleObservation('cfht', 'obs{}'.format(i)), content)
+                server.store.add('cfht', 'obs{}'.format(i), content.getvalue())
+            server.store.add('cfht', 'invalid', b'<invalid/>')
+            client = CAOM2RepoClient(host=server.host)
+            results = read_observations(client, 'cfht', ['obs0', 'obs1', 'obs2', 'invalid'],
+                                        output_dir=self.tmp_dir, threads=2,
+                                        namespace=CAOM20_NAMESPACE, validate=True)
+            self.assertEquals([None, None, None], [error for (_, error) in results[:3]])
+            self.assertIsNotNone(results[3][1])
+            with open(os.path.join(self.tmp_dir, 'cfht', 'obs1.xml'), 'rb') as f:
+                self.assertTrue(CAOM20_NAMESPACE.encode('utf-8') in f.read())
+            self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'cfht', 'invalid.xml')))
+
+    def test_load_observations(self):
+        source = os.path.join(self.tmp_dir, 'source')
+        os.makedirs(os.path.join(source, 'sub'))
+        for i in range(7):
+            observation = SimpleObservation('cfht', 'obs{}'.format(i))
+            with open(os.path.join(source, 'sub' if i % 2 else '', 'obs{}.xml'.format(i)),
+                      'wb') as f:
+                ObservationWriter().write(observation, f)
+        with open(os.path.join(source, 'invalid.xml'), 'wb') as f:
+            f.write(b'<invalid/>')
+
+        with RepoServer() as server:
+            client = CAOM2RepoClient(host=server.host)
+            server.store.add('cfht', 'obs4', b'<obs4/>')
+            results = load_observations(client, source, threads=3, processes=2, window=3)
+            self.assertEquals(['invalid.xml', 'obs0.xml', 'obs2.xml', 'obs4.xml', 'obs6.xml',
+                               'sub/obs1.xml', 'sub/obs3.xml', 'sub/obs5.xml'],
+                              [name for (name, _) in results])
+            errors = dict(results)
+            self.assertTrue(errors['invalid.xml'] is not None)
+            # already exists
+            self.assertTrue('409' in errors['obs4.xml'])
+            self.assertEquals(6, len([error for error in errors.values() if error is None]))
+            self.assertEquals(7, server.requests['PUT'])
+            self.assertEquals('obs1', client.get_observation('cfht', 'obs1').observation_id)
+
+            # update from an archive
+            archive = os.path.join(self.tmp_dir, 'observations.tar')
+            with tarfile.open(archive, 'w') as tar:
+                for i in range(2):
+                    observation = SimpleObservation('cfht', 'obs{}'.format(i))
+                    observation.planes['p'] = Plane('p')
+                    path = os.path.join(self.tmp_dir, 'obs{}.xml'.format(i))
+                    with open(path, 'wb') as f:
+                        ObservationWriter().write(observation, f)
+                    tar.add(path, 'obs{}.xml'.format(i))
+            self.assertEquals([('obs0.xml', None), ('obs1.xml', None)],
+                              load_observations(client, archive, update=True))
+            self.assertEquals(1, len(client.get_observation('cfht', 'obs1').planes))
+
+    @patch('caom2repo.bulk.RETRY_DELAY', 0)
+    def test_load_retries(self):
+        path = os.path.join(self.tmp_dir, 'obs.xml')
+        with open(path, 'wb') as f:
+            ObservationWriter().write(SimpleObservation('cfht', 'obs'), f)
+        client = CAOM2RepoClient(host='127.0.0.1:1')
+        with patch.object(client, 'put_observation_xml',
+                          side_effect=[requests.ConnectionError('refused'), None]) as put_mock:
+            self.assertEquals([('obs.xml', None)], load_observations(client, path))
+            self.assertEquals(2, put_mock.call_count)
+        with patch.object(client, 'put_observation_xml',
+                          side_effect=requests.ConnectionError('refused')) as put_mock:
+            self.assertEquals([('obs.xml', 'ConnectionError: refused')],
+                              load_observations(client, path, retries=2))
+            self.assertEquals(3, put_mock.call_count)
+
+    def test_delete_observations(self):
+        journal = os.path.join(self.tmp_dir, 'deleted.csv')
+        with RepoServer() as server:
+            self._add_observations(server.store, 10)
+            client = CAOM2RepoClient(host=server.host)
+            ids = ['obs1', 'obs3', 'missing', 'obs5', 'obs7', 'obs9']
+            start = time.time()
+            results = delete_observations(client, 'cfht', ids, threads=3, rate=50,
+                                          journal=journal)
+            # 6 deletes at most 50 per second
+            self.assertTrue(time.time() - start >= 0.1)
+            self.assertEquals(ids, [row[0] for row in results])
+            self.assertEquals(['missing'], [row[0] for row in results if row[1] is not None])
+            self.assertEquals(['obs0', 'obs2', 'obs4', 'obs6', 'obs8'],
+                              [row[0] for row in client.list_observations('cfht')])
+            self.assertEquals(['obs1', 'obs3', 'obs5', 'obs7', 'obs9'], sorted(read_ids(journal)))
+            # appended
+            delete_observations(client, 'cfht', ['obs0'], journal=journal)
+            self.assertEquals(6, len(read_ids(journal)))
+
+    @patch('caom2repo.core.BATCH_SIZE', 3)
+    def test_list_observations(self):
+        with RepoServer() as server:
+            # rows with the same date at the end of the pages are listed again by the repo
+            self._add_observations(server.store, 10)
+            client = CAOM2RepoClient(host=server.host)
+            self.assertEquals(['obs{}'.format(i) for i in range(10)],
+                              [row[0] for row in client.list_observations('cfht')])
+            self.assertEquals([('obs4', self.date + timedelta(seconds=2)),
+                               ('obs5', self.date + timedelta(seconds=2))],
+                              list(client.list_observations(
+                                  'cfht', start=self.date + timedelta(seconds=2),
+                                  end=self.date + timedelta(seconds=2))))
+            server.store.add('cfht', 'obs10', b'<obs10/>',
+                             last_modified=self.date + timedelta(seconds=4))
+            with self.assertRaises(Exception):
+                list(client.list_observations('cfht', start=self.date + timedelta(seconds=4)))
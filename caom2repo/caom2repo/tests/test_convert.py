@@ -0,0 +1,196 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import uuid
+from StringIO import StringIO
+
+from caom2.artifact import Artifact, ReleaseType
+from caom2.chunk import ProductType
+from caom2.obs_reader_writer import ObservationReader, ObservationWriter, CAOM20_NAMESPACE, \
+    CAOM21_NAMESPACE, CAOM22_NAMESPACE
+from caom2.observation import SimpleObservation, Requirements, Status
+from caom2.plane import Plane
+
+from caom2repo.convert import convert_observations, write_conversion_report
+
+
+class TestConvert(unittest.TestCase):
+
+    """Test the conversion of observation files between CAOM2 versions"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, 'source')
+        os.makedirs(os.path.join(self.source, 'sub'))
+        # in every version
+        self._write('obs0.xml', SimpleObservation('cfht', 'obs0'), CAOM20_NAMESPACE)
+        self._write('obs1.xml', SimpleObservation('cfht', 'obs1'), CAOM21_NAMESPACE)
+        obs = SimpleObservation('cfht', 'obs2')
+        obs.requirements = Requirements(Status.FAIL)
+        plane = Plane('product')
+        plane.artifacts.add(Artifact('ad:CFHT/obs2', ProductType.SCIENCE, ReleaseType.META))
+        obs.planes.add(plane)
+        self._write(os.path.join('sub', 'obs2.xml'), obs, CAOM22_NAMESPACE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, observation, namespace):
+        with open(os.path.join(self.source, name), 'wb') as f:
+            ObservationWriter(False, False, 'caom2', namespace).write(observation, f)
+
+    def _read(self, path):
+        with open(os.path.join(self.tmp_dir, path)) as f:
+            content = f.read()
+        return content, ObservationReader().read(StringIO(content))
+
+    def test_convert_directory(self):
+        output = os.path.join(self.tmp_dir, 'out')
+        results = convert_observations(self.source, '2.2', output_dir=output, processes=2)
+        self.assertEquals([('obs0.xml', [], None), ('obs1.xml', [], None),
+                           (os.path.join('sub', 'obs2.xml'), [], None)], results)
+        for name in ['obs0.xml', 'obs1.xml']:
+            (content, obs) = self._read(os.path.join('out', name))
+            self.assertTrue(CAOM22_NAMESPACE in content)
+            self.assertEquals(name[:-4], obs.observation_id)
+
+        # content that CAOM-2.1 and CAOM-2.0 cannot hold is reported
+        output = os.path.join(self.tmp_dir, 'out21')
+        results = convert_observations(self.source, '2.1', output_dir=output)
+        self.assertEquals((os.path.join('sub', 'obs2.xml'),
+                           ['release type of artifact ad:CFHT/obs2'], None), results[2])
+        (content, obs) = self._read(os.path.join('out21', 'sub', 'obs2.xml'))
+        self.assertTrue(CAOM21_NAMESPACE in content)
+        self.assertEquals(Status.FAIL, obs.requirements.flag)
+        output = os.path.join(self.tmp_dir, 'out20')
+        results = convert_observations(self.source, '2.0', output_dir=output)
+        self.assertEquals(['requirements', 'release type of artifact ad:CFHT/obs2'],
+                          results[2][1])
+        (content, obs) = self._read(os.path.join('out20', 'obs1.xml'))
+        self.assertTrue(CAOM20_NAMESPACE in content)
+
+    def test_convert_tar(self):
+        archive = os.path.join(self.tmp_dir, 'source.tar')
+        with tarfile.open(archive, 'w') as tar:
+            tar.add(self.source, arcname='snapshot')
+        output = os.path.join(self.tmp_dir, 'out.tar.gz')
+        results = convert_observations(archive, '2.1', archive=output)
+        self.assertEquals(3, len(results))
+        with tarfile.open(output) as tar:
+            self.assertEquals(['snapshot/obs0.xml', 'snapshot/obs1.xml', 'snapshot/sub/obs2.xml'],
+                              sorted(tar.getnames()))
+            content = tar.extractfile('snapshot/obs0.xml').read()
+        self.assertTrue(CAOM21_NAMESPACE in content)
+
+    def test_unsafe_tar_members(self):
+        with open(os.path.join(self.source, 'obs0.xml'), 'rb') as f:
+            content = f.read()
+        archive = os.path.join(self.tmp_dir, 'unsafe.tar')
+        with tarfile.open(archive, 'w') as tar:
+            info = tarfile.TarInfo('../escaped.xml')
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        output = os.path.join(self.tmp_dir, 'out', 'sub')
+        with self.assertRaises(ValueError):
+            convert_observations(archive, '2.2', output_dir=output)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'out', 'escaped.xml')))
+        with self.assertRaises(ValueError):
+            convert_observations(archive, '2.2', archive=os.path.join(self.tmp_dir, 'out.tar'),
+                                 processes=2)
+
+    def test_failures(self):
+        # UUIDs that do not fit in a CAOM-2.0 long
+        obs = SimpleObservation('cfht', 'obs3')
+        obs._id = uuid.UUID('10000000-0000-0000-0000-000000000001')
+        self._write('obs3.xml', obs, CAOM22_NAMESPACE)
+        with open(os.path.join(self.source, 'bad.xml'), 'w') as f:
+            f.write('<bad/>')
+        output = os.path.join(self.tmp_dir, 'out')
+        results = convert_observations(self.source, '2.0', output_dir=output, processes=2)
+        # the other documents are converted
+        self.assertEquals(['obs0.xml', 'obs1.xml', 'sub'], sorted(os.listdir(output)))
+        errors = dict((name, error) for (name, _, error) in results)
+        self.assertTrue(errors['obs3.xml'].startswith('ValueError: lossy conversion'))
+        self.assertTrue(errors['bad.xml'] is not None)
+
+        out = StringIO()
+        self.assertEquals(2, write_conversion_report(results, out))
+        lines = out.getvalue().splitlines()
+        self.assertEquals('bad.xml\tFAILED', lines[0][:len('bad.xml\tFAILED')])
+        self.assertEquals('obs0.xml\tOK', lines[1])
+        self.assertEquals('{}\tLOSSY\trequirements, release type of artifact ad:CFHT/obs2'.format(
+            os.path.join('sub', 'obs2.xml')), lines[4])
@@ -70,21 +70,25 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import copy
+import json
 import os
 import sys
 import unittest
 # TODO to be changed to io.StringIO when caom2 is prepared for python3
 from StringIO import StringIO
-from datetime import datetime
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 
 import requests
 from cadcutils import util
-from caom2.obs_reader_writer import ObservationWriter
+from caom2.obs_reader_writer import ObservationWriter, CAOM20_NAMESPACE
 from caom2.observation import SimpleObservation
-from mock import Mock, patch, MagicMock, ANY
+from mock import Mock, patch, MagicMock, ANY, call
 
 from caom2repo import core
 from caom2repo.core import CAOM2RepoClient, DATE_FORMAT
+from caom2repo.metrics import Metrics
+from caom2repo.progress import ProgressReporter
 
 THIS_DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -93,6 +97,13 @@ class MyExitError(Exception):
     pass
 
 
+def _listing(pages):
+    """Adds last modified dates, in the order of the IDs, to pages of observation IDs"""
+    date = datetime(2000, 1, 1)
+    return [[(observation_id, date + timedelta(seconds=ord(observation_id[0])))
+             for observation_id in page] for page in pages]
+
+
 class TestCAOM2Repo(unittest.TestCase):
 
     """Test the Caom2Visitor class"""
@@ -116,6 +127,11 @@ class TestCAOM2Repo(unittest.TestCase):
         visitor.plugin.update(obs)
         self.assertNotEquals(expect_obs, obs)
         self.assertEquals(len(expect_obs.planes) + 1, len(obs.planes))
+
+        # plugin class with update_batch only
+        visitor._load_plugin_class(os.path.join(THIS_DIR, 'batchplugin.py'))
+        visitor.plugin.update_batch([obs])
+        self.assertEquals([1], visitor.plugin.batches)
         
         # non-existent the plugin file
         with self.assertRaises(Exception):
@@ -148,7 +164,35 @@ class TestCAOM2Repo(unittest.TestCase):
         ibuffer.seek(0)  # reposition the buffer for reading
         visitor = CAOM2RepoClient(host=service_url)
         self.assertEquals(obs, visitor.get_observation(collection, observation_id))
-        
+
+        # metrics of the stages
+        visitor = CAOM2RepoClient(host=service_url, metrics=Metrics())
+        self.assertEquals(obs, visitor.get_observation(collection, observation_id))
+        snapshot = visitor.metrics.snapshot()
+        self.assertEquals(1, snapshot['get']['count'])
+        self.assertEquals(len(response.content), snapshot['get']['bytes'])
+        self.assertEquals(1, snapshot['parse']['count'])
+
+        # the reader and writer are reused by the calls of a thread but not shared with others
+        reader = visitor.reader
+        self.assertEquals(obs, visitor.get_observation(collection, observation_id))
+        self.assertTrue(reader is visitor.reader)
+        self.assertTrue(visitor.writer is visitor.writer)
+        other = ThreadPool(1).apply(lambda: visitor.reader)
+        self.assertFalse(reader is other)
+
+        # the document is copied as it is received
+        content = response.content
+        response.iter_content.return_value = [content[:10], content[10:]]
+        out = StringIO()
+        self.assertEquals(len(content), visitor.stream_observation_xml(collection, observation_id,
+                                                                      out))
+        self.assertEquals(content, out.getvalue())
+        self.assertTrue(mock_get.call_args[1]['stream'])
+        response.iter_content.return_value = []
+        with self.assertRaises(Exception):
+            visitor.stream_observation_xml(collection, observation_id, StringIO())
+
         # signal problems
         http_error = requests.HTTPError()
         response.status_code = 500
@@ -193,7 +237,8 @@ class TestCAOM2Repo(unittest.TestCase):
         visitor = CAOM2RepoClient()
         end_date = datetime.strptime(last_datetime, DATE_FORMAT)
         
-        expect_observations = ['700000o', '700001o']
+        expect_observations = [('700000o', datetime(2000, 10, 10, 12, 20, 11, 123000)),
+                               ('700001o', end_date)]
         self.assertEquals(expect_observations, visitor._get_observations('cfht'))
         self.assertEquals(end_date, visitor._start)
         mock_get.assert_called_once_with('cfht', params={'MAXREC': core.BATCH_SIZE})
@@ -358,22 +403,176 @@ class TestCAOM2Repo(unittest.TestCase):
         with self.assertRaises(requests.HTTPError):
             visitor.delete_observation(collection, observation_id)
 
+    @patch('caom2repo.core.BATCH_SIZE', 3)  # size of the batch is 3
     def test_process(self):
-        core.BATCH_SIZE = 3  # size of the batch is 3
         obs = [['a', 'b', 'c'], ['d'], []]
         visitor = CAOM2RepoClient()
         visitor.get_observation = MagicMock(return_value=MagicMock(spec=SimpleObservation))
         visitor.post_observation = MagicMock()
-        visitor._get_observations = MagicMock(side_effect=obs)
+        visitor._get_listing = MagicMock(side_effect=_listing(obs))
 
         self.assertEquals(4, visitor.visit(os.path.join(
                 THIS_DIR, 'passplugin.py'), 'cfht'))
 
         obs = [['a', 'b', 'c'], ['d', 'e', 'f'], []]
-        visitor._get_observations = MagicMock(side_effect=obs)
+        visitor._get_listing = MagicMock(side_effect=_listing(obs))
         self.assertEquals(6, visitor.visit(os.path.join(
                 THIS_DIR, 'passplugin.py'), 'cfht'))
 
+        # observations rejected by accept are not visited
+        obs = [['a', 'b', 'c'], ['d', 'e', 'f'], []]
+        visitor._get_listing = MagicMock(side_effect=_listing(obs))
+        visitor.get_observation.reset_mock()
+        self.assertEquals(2, visitor.visit(os.path.join(
+                THIS_DIR, 'passplugin.py'), 'cfht',
+            accept=lambda obs_id, last_modified: obs_id in ['b', 'e']))
+        self.assertEquals([(('cfht', 'b'),), (('cfht', 'e'),)],
+                          visitor.get_observation.call_args_list)
+
+        # and by the accept method of the plugin
+        obs = [['a', 'b', 'c'], ['d', 'e', 'f'], []]
+        visitor._get_listing = MagicMock(side_effect=_listing(obs))
+        visitor.get_observation.reset_mock()
+        self.assertEquals(1, visitor.visit(os.path.join(
+                THIS_DIR, 'acceptplugin.py'), 'cfht',
+            accept=lambda obs_id, last_modified: obs_id in ['b', 'e']))
+        self.assertEquals([(('cfht', 'e'),)], visitor.get_observation.call_args_list)
+
+        # plugin with update_batch gets batches of observations
+        obs = [['a', 'b', 'c'], ['d', 'e'], []]
+        visitor._get_listing = MagicMock(side_effect=_listing(obs))
+        visitor.post_observation.reset_mock()
+        self.assertEquals(5, visitor.visit(os.path.join(
+                THIS_DIR, 'batchplugin.py'), 'cfht', batch_size=2))
+        self.assertEquals([2, 2, 1], visitor.plugin.batches)
+        self.assertEquals(5, visitor.post_observation.call_count)
+
+        # analysis plugins reduce the results of map and do not update the observations
+        obs = [['a', 'b', 'c'], ['d', 'e'], []]
+        visitor._get_listing = MagicMock(side_effect=_listing(obs))
+        visitor.post_observation.reset_mock()
+        self.assertEquals({'observations': 5, 'planes': 0}, visitor.analyze(os.path.join(
+                THIS_DIR, 'mapreduceplugin.py'), 'cfht'))
+        self.assertEquals(5, visitor.result['observations'])
+        self.assertFalse(visitor.post_observation.called)
+        visitor._get_listing = MagicMock(side_effect=_listing([[]]))
+        self.assertEquals(None, visitor.analyze(os.path.join(
+                THIS_DIR, 'mapreduceplugin.py'), 'cfht'))
+
+        # progress reporting
+        obs = [['a', 'b', 'c'], ['d'], []]
+        visitor._get_listing = MagicMock(side_effect=_listing(obs))
+        visitor.progress = ProgressReporter()
+        self.assertEquals(4, visitor.visit(os.path.join(
+                THIS_DIR, 'passplugin.py'), 'cfht'))
+        self.assertEquals(4, visitor.progress.visited)
+        self.assertEquals(4, visitor.progress.estimated_total())
+
+    @patch('caom2repo.core.net.BaseWsClient.get')
+    def test_partition(self, mock_get):
+        start = datetime(2000, 1, 1)
+        end = datetime(2000, 1, 5)
+        visitor = CAOM2RepoClient()
+
+        # equal time windows
+        self.assertEquals([(start, datetime(2000, 1, 2)),
+                           (datetime(2000, 1, 2) + core.PARTITION_GAP, datetime(2000, 1, 3)),
+                           (datetime(2000, 1, 3) + core.PARTITION_GAP, datetime(2000, 1, 4)),
+                           (datetime(2000, 1, 4) + core.PARTITION_GAP, end)],
+                          visitor._equal_partition('cfht', start, end, 4))
+        mock_get.assert_not_called()
+
+        # missing start is replaced with the date of the oldest observation
+        response = MagicMock()
+        response.content = 'a,2000-01-03T00:00:00.000'
+        mock_get.return_value = response
+        self.assertEquals([(None, datetime(2000, 1, 4)),
+                           (datetime(2000, 1, 4) + core.PARTITION_GAP, end)],
+                          visitor._equal_partition('cfht', None, end, 2))
+        mock_get.assert_called_once_with('cfht', params={'END': '2000-01-05T00:00:00.000000',
+                                                         'MAXREC': 1})
+
+        # empty collection
+        response.content = ''
+        self.assertEquals([], visitor._equal_partition('cfht', None, end, 2))
+
+        # adaptive windows split the listing in sub-ranges of equal size
+        response.content = '\n'.join(['{},2000-01-0{}T00:00:00.000'.format(i, i) for i in range(1, 7)])
+        self.assertEquals([(start, datetime(2000, 1, 2)),
+                           (datetime(2000, 1, 2) + core.PARTITION_GAP, datetime(2000, 1, 4)),
+                           (datetime(2000, 1, 4) + core.PARTITION_GAP, end)],
+                          visitor._adaptive_partition('cfht', start, end, 3))
+        response.content = ''
+        self.assertEquals([], visitor._adaptive_partition('cfht', start, end, 3))
+
+        # the rows at the boundaries of the pages are counted once
+        pages = [[1, 2, 3], [3, 4, 5], [5, 6]]
+        mock_get.return_value = None
+        mock_get.side_effect = [MagicMock(content='\n'.join(
+            ['{},2000-01-0{}T00:00:00.000'.format(i, i) for i in page])) for page in pages]
+        with patch('caom2repo.core.BATCH_SIZE', 3):
+            self.assertEquals([(start, datetime(2000, 1, 1)),
+                               (datetime(2000, 1, 1) + core.PARTITION_GAP, datetime(2000, 1, 3)),
+                               (datetime(2000, 1, 3) + core.PARTITION_GAP, datetime(2000, 1, 4)),
+                               (datetime(2000, 1, 4) + core.PARTITION_GAP, end)],
+                              visitor._adaptive_partition('cfht', start, end, 4))
+
+        # a full page of observations modified at the same time cannot be paged through
+        mock_get.side_effect = [MagicMock(content='\n'.join(
+            ['{},2000-01-01T00:00:00.000'.format(i) for i in range(3)]))]
+        with patch('caom2repo.core.BATCH_SIZE', 3):
+            with self.assertRaises(Exception):
+                visitor._adaptive_partition('cfht', start, end, 3)
+
+    @patch('caom2repo.core.Pool', ThreadPool)
+    @patch('caom2repo.core._visit_range')
+    def test_process_partitioned(self, visit_range_mock):
+        start = datetime(2000, 1, 1)
+        end = datetime(2000, 1, 3)
+        visit_range_mock.side_effect = lambda args: (args[3], args[4], 2, None, {}, (False, None))
+        visitor = CAOM2RepoClient()
+        plugin = os.path.join(THIS_DIR, 'passplugin.py')
+        self.assertEquals(4, visitor.visit(plugin, 'cfht', start=start, end=end, processes=2))
+        self.assertEquals(2, visit_range_mock.call_count)
+        for args in visit_range_mock.call_args_list:
+            self.assertEquals(visitor._client_args, args[0][0][0])
+            self.assertEquals(plugin, args[0][0][1])
+
+        # failures in sub-ranges are reported once all of them have been visited
+        visit_range_mock.reset_mock()
+        visit_range_mock.side_effect = lambda args: \
+            (args[3], args[4], 0, 'Error', {}, (False, None)) if args[3] == start \
+            else (args[3], args[4], 2, None, {}, (False, None))
+        with self.assertRaises(Exception):
+            visitor.visit(plugin, 'cfht', start=start, end=end, processes=2)
+        self.assertEquals(2, visit_range_mock.call_count)
+
+        with self.assertRaises(ValueError):
+            visitor.visit(plugin, 'cfht', start=start, end=end, processes=2, partition='blah')
+
+        # metrics of the worker processes are merged
+        visitor = CAOM2RepoClient(metrics=Metrics())
+        worker_metrics = Metrics()
+        worker_metrics.record('get', 0.1)
+        visit_range_mock.side_effect = lambda args: (args[3], args[4], 2, None, worker_metrics.snapshot(),
+                                                 (False, None))
+        self.assertEquals(4, visitor.visit(plugin, 'cfht', start=start, end=end, processes=2))
+        self.assertEquals(2, visitor.metrics.snapshot()['get']['count'])
+        self.assertTrue(visit_range_mock.call_args[0][0][6])
+
+        # progress of the worker processes is aggregated
+        visitor = CAOM2RepoClient(progress=ProgressReporter())
+
+        def visit_range(args):
+            progress = ProgressReporter()
+            progress.attach(core._shared_progress, args[7])
+            progress.observations_visited(2, 1.0)
+            return args[3], args[4], 2, None, {}, (False, None)
+        visit_range_mock.side_effect = visit_range
+        self.assertEquals(4, visitor.visit(plugin, 'cfht', start=start, end=end, processes=2))
+        self.assertEquals(4, visitor.progress.visited)
+        self.assertEquals(2.0, visitor.progress.latency_sum)
+
     @patch('caom2repo.core.CAOM2RepoClient')
     def test_main(self, client_mock):
         collection = 'cfht'
@@ -395,24 +594,125 @@ class TestCAOM2Repo(unittest.TestCase):
         core.main()
         client_mock.return_value.post_observation.assert_called_with(obs)
 
+        # test bulk create and update
+        for (cmd, update) in [('create', False), ('update', True)]:
+            sys.argv = ["caom2tools", cmd, "--source", "/tmp/obs", "--threads", "4",
+                        "--processes", "2"]
+            with patch('caom2repo.core.load_observations') as load_mock, \
+                    patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+                load_mock.return_value = [('a.xml', None)]
+                core.main()
+                load_mock.assert_called_with(client_mock.return_value, '/tmp/obs', update=update,
+                                             threads=4, processes=2)
+                self.assertEqual('a.xml\tOK\n', stdout_mock.getvalue())
+
         # test read
         sys.argv = ["caom2tools", "read", "--collection", collection, observation_id]
-        client_mock.return_value.get_observation.return_value = obs
         core.main()
-        client_mock.return_value.get_observation.assert_called_with(collection, observation_id)
+        client_mock.return_value.stream_observation_xml.assert_called_with(
+            collection, observation_id, sys.stdout)
         # repeat with output argument
         sys.argv = ["caom2tools", "read", "--collection", collection, "--output", ifile, observation_id]
+        core.main()
+        client_mock.return_value.stream_observation_xml.assert_called_with(
+            collection, observation_id, ANY)
+        self.assertFalse(client_mock.return_value.get_observation.called)
+        # conversion to another namespace
+        sys.argv = ["caom2tools", "read", "--collection", collection, "--output", ifile,
+                    "--namespace", "2.0", observation_id]
         client_mock.return_value.get_observation.return_value = obs
         core.main()
         client_mock.return_value.get_observation.assert_called_with(collection, observation_id)
+        with open(ifile) as f:
+            self.assertTrue('CAOM/v2.0' in f.read())
+        # validation of the document returned by the repo
+        sys.argv = ["caom2tools", "read", "--collection", collection, "--output", ifile,
+                    "--validate", observation_id]
+        iobuffer = StringIO()
+        ObservationWriter().write(obs, iobuffer)
+        client_mock.return_value.get_observation_xml.return_value = iobuffer.getvalue()
+        core.main()
+        with open(ifile) as f:
+            self.assertEqual(iobuffer.getvalue(), f.read())
+        client_mock.return_value.get_observation_xml.return_value = '<invalid/>'
+        with self.assertRaises(Exception):
+            core.main()
         os.remove(ifile)
 
+        # test bulk read
+        sys.argv = ["caom2tools", "read", "--collection", collection, "--start", "2012-01-01T11:22:33.44",
+                    "--archive", "/tmp/obs.tar", "--threads", "4"]
+        client_mock.return_value.list_observations.return_value = iter([('a', None), ('b', None)])
+        with patch('caom2repo.core.read_observations') as read_mock, \
+                patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            read_mock.return_value = [('a', None), ('b', None)]
+            core.main()
+            client_mock.return_value.list_observations.assert_called_with(
+                collection, util.str2ivoa("2012-01-01T11:22:33.44"), None)
+            read_mock.assert_called_with(client_mock.return_value, collection, ['a', 'b'],
+                                         output_dir=None, archive='/tmp/obs.tar', threads=4,
+                                         validate=False, namespace=None)
+            self.assertEqual('a\tOK\nb\tOK\n', stdout_mock.getvalue())
+        ids_file = os.path.join(THIS_DIR, 'ids.txt')
+        sys.argv = ["caom2tools", "read", "--collection", collection, "--ids", ids_file,
+                    "--output-dir", "/tmp/out"]
+        with open(ids_file, 'w') as f:
+            f.write('a\nb\n')
+        try:
+            with patch('caom2repo.core.read_observations') as read_mock, \
+                    patch('sys.stdout', new_callable=StringIO):
+                read_mock.return_value = [('a', None), ('b', 'HTTPError: 404')]
+                with self.assertRaises(SystemExit):
+                    core.main()
+                read_mock.assert_called_with(client_mock.return_value, collection, ['a', 'b'],
+                                             output_dir='/tmp/out', archive=None,
+                                             threads=core.DEFAULT_THREADS, validate=False,
+                                             namespace=None)
+
+            # the observations are converted and validated like a single one
+            sys.argv = ["caom2tools", "read", "--collection", collection, "--ids", ids_file,
+                        "--output-dir", "/tmp/out", "--namespace", "2.0", "--validate"]
+            with patch('caom2repo.core.read_observations') as read_mock, \
+                    patch('sys.stdout', new_callable=StringIO):
+                read_mock.return_value = [('a', None), ('b', None)]
+                core.main()
+                read_mock.assert_called_with(client_mock.return_value, collection, ['a', 'b'],
+                                             output_dir='/tmp/out', archive=None,
+                                             threads=core.DEFAULT_THREADS, validate=True,
+                                             namespace=CAOM20_NAMESPACE)
+        finally:
+            os.remove(ids_file)
+
         # test delete
         sys.argv = ["caom2tools", "delete", "--collection", collection, observation_id]
         core.main()
         client_mock.return_value.delete_observation.assert_called_with(collection=collection,
                                                                        observation_id=observation_id)
 
+        # test bulk delete
+        sys.argv = ["caom2tools", "delete", "--collection", collection, "--end", "2012-01-01T11:22:33.44",
+                    "--dry-run"]
+        client_mock.return_value.list_observations.return_value = iter([('a', None), ('b', None)])
+        with patch('caom2repo.core.delete_observations') as delete_mock, \
+                patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            core.main()
+            client_mock.return_value.list_observations.assert_called_with(
+                collection, None, util.str2ivoa("2012-01-01T11:22:33.44"))
+            self.assertFalse(delete_mock.called)
+            self.assertEqual('2 observations would be deleted from {}\n'.format(collection),
+                             stdout_mock.getvalue())
+        sys.argv = ["caom2tools", "delete", "--collection", collection, "--ids", "-", "--rate", "10",
+                    "--journal", "/tmp/deleted.csv"]
+        with patch('caom2repo.core.delete_observations') as delete_mock, \
+                patch('sys.stdin', StringIO('a\nb\n')), \
+                patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            delete_mock.return_value = [('a', None), ('b', None)]
+            core.main()
+            delete_mock.assert_called_with(client_mock.return_value, collection, ['a', 'b'],
+                                           threads=core.DEFAULT_THREADS, rate=10.0,
+                                           journal='/tmp/deleted.csv')
+            self.assertEqual('a\tOK\nb\tOK\n', stdout_mock.getvalue())
+
         # test visit
         # get the absolute path to be able to run the tests with the astropy frameworks
         plugin_file = THIS_DIR + "/passplugin.py"
@@ -423,10 +723,140 @@ class TestCAOM2Repo(unittest.TestCase):
             client_mock.return_value.visit.assert_called_with(
                 ANY, collection,
                 start=util.str2ivoa("2012-01-01T11:22:33.44"),
-                end=util.str2ivoa("2013-01-01T11:33:22.443"))
+                end=util.str2ivoa("2013-01-01T11:33:22.443"),
+                processes=1, partition=core.EQUAL_PARTITION,
+                batch_size=core.DEFAULT_UPDATE_BATCH_SIZE, output_dir=None, diff=False,
+                journal=None, accept=None)
+
+        # test dry run
+        sys.argv = ["caom2tools", "visit", "--plugin", plugin_file, "--dry-run", "--diff",
+                    "--output-dir", "/tmp/out", "--journal", "/tmp/failures.jsonl", collection]
+        core.main()
+        client_mock.return_value.visit.assert_called_with(
+            ANY, collection, start=None, end=None, processes=1, partition=core.EQUAL_PARTITION,
+            batch_size=core.DEFAULT_UPDATE_BATCH_SIZE, output_dir='/tmp/out', diff=True,
+            journal='/tmp/failures.jsonl', accept=None)
+
+        # test filters of the listing
+        sys.argv = ["caom2tools", "visit", "--plugin", plugin_file, "--id-pattern", "^70",
+                    "--window", "2012-01-01T00:00:00.000/2012-02-01T00:00:00.000",
+                    "--window", "2013-01-01T00:00:00.000/", collection]
+        core.main()
+        accept = client_mock.return_value.visit.call_args[1]['accept']
+        self.assertEqual('^70', accept.pattern)
+        self.assertEqual([(datetime(2012, 1, 1), datetime(2012, 2, 1)), (datetime(2013, 1, 1), None)],
+                         accept.windows)
+
+        # test sharded visit
+        sys.argv = ["caom2tools", "visit", "--plugin", plugin_file, "--shard-dir", "/tmp/shards",
+                    "--shards", "4", "--shard-by", "hash", collection]
+        with patch('caom2repo.core.ShardedVisit') as sharded_mock:
+            core.main()
+            sharded_mock.assert_called_with(client_mock.return_value, '/tmp/shards',
+                                            lease_ttl=core.DEFAULT_LEASE_TTL)
+            sharded_mock.return_value.run.assert_called_with(
+                ANY, collection, start=None, end=None, shards=4, shard_by=core.HASH_SHARDS,
+                processes=1, partition=core.EQUAL_PARTITION,
+                batch_size=core.DEFAULT_UPDATE_BATCH_SIZE, output_dir=None, diff=False,
+                journal=None, accept=None)
+
+        # test aggregate of an analysis plugin
+        analysis_file = os.path.join(THIS_DIR, 'mapreduceplugin.py')
+        client_mock.return_value.result = {'observations': 2, 'planes': 3}
+        sys.argv = ["caom2tools", "visit", "--plugin", analysis_file, "--processes", "2",
+                    collection]
+        with patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            core.main()
+            self.assertEqual('{\n  "observations": 2, \n  "planes": 3\n}\n',
+                             stdout_mock.getvalue())
+        result_file = os.path.join(THIS_DIR, 'result.json')
+        sys.argv = ["caom2tools", "visit", "--plugin", analysis_file, "--result", result_file,
+                    collection]
+        try:
+            core.main()
+            with open(result_file) as f:
+                self.assertEqual({'observations': 2, 'planes': 3}, json.load(f))
+        finally:
+            os.remove(result_file)
+
+        # test visit of local files
+        sys.argv = ["caom2tools", "visit", "--plugin", plugin_file, "--source", "/tmp/obs",
+                    "--output-dir", "/tmp/out", "--processes", "3"]
+        with patch('caom2repo.core.visit_local') as visit_local_mock:
+            core.main()
+            visit_local_mock.assert_called_with(ANY, '/tmp/obs', '/tmp/out', processes=3,
+                                                batch_size=core.DEFAULT_UPDATE_BATCH_SIZE)
+
+        # test replay of the failures of a visit
+        sys.argv = ["caom2tools", "replay", "--plugin", plugin_file, "--processes", "2",
+                    "--journal", "/tmp/failures2.jsonl", "/tmp/failures.jsonl"]
+        with patch('caom2repo.core.read_journal') as read_journal_mock:
+            read_journal_mock.return_value = [('cfht', ['a', 'b']), ('dao', ['c'])]
+            core.main()
+            read_journal_mock.assert_called_with('/tmp/failures.jsonl')
+            client_mock.return_value.visit_observations.assert_has_calls([
+                call(ANY, 'cfht', ['a', 'b'], processes=2,
+                     batch_size=core.DEFAULT_UPDATE_BATCH_SIZE, output_dir=None, diff=False,
+                     journal='/tmp/failures2.jsonl'),
+                call(ANY, 'dao', ['c'], processes=2,
+                     batch_size=core.DEFAULT_UPDATE_BATCH_SIZE, output_dir=None, diff=False,
+                     journal='/tmp/failures2.jsonl')])
+
+        # test listing of a collection
+        sys.argv = ["caom2tools", "list", "--end", "2013-01-01T11:33:22.443", collection]
+        client_mock.return_value.list_observations.return_value = iter(
+            [('a', datetime(2000, 1, 1, 10, 0, 0, 123000))])
+        with patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            core.main()
+            client_mock.return_value.list_observations.assert_called_with(
+                collection, None, util.str2ivoa("2013-01-01T11:33:22.443"))
+            self.assertEqual('a,2000-01-01T10:00:00.123000\n', stdout_mock.getvalue())
+
+        # test conversion of local files
+        sys.argv = ["caom2tools", "convert", "--to", "2.0", "--archive", "/tmp/out.tar",
+                    "--processes", "3", "/tmp/obs"]
+        client_mock.reset_mock()
+        with patch('caom2repo.core.convert_observations') as convert_mock, \
+                patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            convert_mock.return_value = [('a.xml', ['requirements'], None)]
+            core.main()
+            convert_mock.assert_called_with('/tmp/obs', '2.0', output_dir=None,
+                                            archive='/tmp/out.tar', processes=3, validate=False)
+            self.assertEqual('a.xml\tLOSSY\trequirements\n', stdout_mock.getvalue())
+            self.assertFalse(client_mock.called)
+
+        # test visit of a listing
+        listing_file = os.path.join(THIS_DIR, 'listing.csv')
+        with open(listing_file, 'w') as f:
+            f.write('a,2000-01-01T10:00:00.123000\nb,2014-01-01T10:00:00.000000\n'
+                    'c,2000-01-01T10:00:00.123000\n')
+        try:
+            sys.argv = ["caom2tools", "visit", "--plugin", plugin_file, "--listing", listing_file,
+                        "--end", "2013-01-01T11:33:22.443", "--processes", "2", "--id-pattern", "a",
+                        collection]
+            core.main()
+            client_mock.return_value.visit_observations.assert_called_with(
+                ANY, collection, [('a', datetime(2000, 1, 1, 10, 0, 0, 123000)),
+                                  ('c', datetime(2000, 1, 1, 10, 0, 0, 123000))],
+                processes=2, batch_size=core.DEFAULT_UPDATE_BATCH_SIZE, output_dir=None,
+                diff=False, journal=None, accept=ANY)
+            accept = client_mock.return_value.visit_observations.call_args[1]['accept']
+            self.assertEquals('a', accept.pattern)
+        finally:
+            os.remove(listing_file)
+
+        # test sync of collections
+        sys.argv = ["caom2tools", "sync", "--threads", "4", "--prune", "/tmp/mirror", "cfht", "dao"]
+        with patch('caom2repo.core.CollectionMirror') as mirror_mock:
+            core.main()
+            mirror_mock.assert_called_with(client_mock.return_value, '/tmp/mirror', threads=4)
+            mirror_mock.return_value.sync.assert_has_calls([
+                call('cfht', prune=True, full=False, listing=None),
+                call('dao', prune=True, full=False, listing=None)])
 
     @patch('sys.exit', Mock(side_effect=[MyExitError, MyExitError, MyExitError,
-                                         MyExitError, MyExitError, MyExitError]))
+                                         MyExitError, MyExitError, MyExitError,
+                                         MyExitError, MyExitError]))
     def test_help(self):
         """ Tests the helper displays for commands and subcommands in main"""
 
@@ -435,17 +865,22 @@ class TestCAOM2Repo(unittest.TestCase):
 """usage: caom2-repo-client [-h] [--certfile CERTFILE] [--anonymous]
                          [--host HOST] [--resourceID RESOURCEID] [--verbose]
                          [--debug] [--quiet] [--version]
-                         {create,read,update,delete,visit} ...
+                         {create,read,update,delete,visit,replay,sync,list,convert}
+                         ...
 
 Client for a CAOM2 repo. In addition to CRUD (Create, Read, Update and Delete) operations it also implements a visitor operation that allows for updating multiple observations in a collection
 
 positional arguments:
-  {create,read,update,delete,visit}
+  {create,read,update,delete,visit,replay,sync,list,convert}
     create              Create a new observation
     read                Read an existing observation
     update              Update an existing observation
     delete              Delete an existing observation
     visit               Visit observations in a collection
+    replay              Visit again the observations recorded in the journal of a visit
+    sync                Copy the observations of collections modified since the last sync to a local directory
+    list                List the observations of a collection
+    convert             Convert observation files to another version of CAOM2
 
 optional arguments:
   -h, --help            show this help message and exit
@@ -464,9 +899,12 @@ optional arguments:
 """usage: caom2-repo-client create [-h] [--certfile CERTFILE] [--anonymous]
                                 [--host HOST] [--resourceID RESOURCEID]
                                 [--verbose] [--debug] [--quiet] [--version]
-                                <new observation file>
+                                [--source <directory, tar file or glob>]
+                                [--threads <number of threads>]
+                                [--processes <number of processes>]
+                                [<new observation file>]
 
-Create a new observation
+Create a new observation, or many of them with --source
 
 positional arguments:
   <new observation file>
@@ -486,6 +924,15 @@ optional arguments:
   --debug               debug messages
   --quiet               run quietly
   --version             show program's version number and exit
+  --source <directory, tar file or glob>
+                        send all the observation files of a directory, tar
+                        archive or glob pattern
+  --threads <number of threads>
+                        number of concurrent uploads with --source (default:
+                        8)
+  --processes <number of processes>
+                        number of processes parsing the files of --source
+                        (default: 1)
 """
 
         read_usage =\
@@ -493,10 +940,16 @@ optional arguments:
                               [--host HOST] [--resourceID RESOURCEID]
                               [--verbose] [--debug] [--quiet] [--version]
                               --collection <collection>
-                              [--output <destination file>]
-                              <observation>
+                              [--output <destination file>] [--ids <file>]
+                              [--start <datetime start point>]
+                              [--end <datetime end point>]
+                              [--output-dir <directory>]
+                              [--archive <tar file>]
+                              [--threads <number of threads>] [--validate]
+                              [--namespace {2.0,2.1,2.2}]
+                              [<observation>]
 
-Read an existing observation
+Read an existing observation, or many of them with --ids, --start or --end
 
 positional arguments:
   <observation>
@@ -518,15 +971,38 @@ optional arguments:
   --version             show program's version number and exit
   --collection <collection>
   --output <destination file>, -o <destination file>
+  --ids <file>          read the observations listed in this file, one ID per
+                        line or a listing of the list command (- for the
+                        standard input)
+  --start <datetime start point>
+                        read the observations modified since this date (UTC)
+  --end <datetime end point>
+                        read the observations modified until this date (UTC)
+  --output-dir <directory>
+                        directory the observations read with --ids, --start or
+                        --end are written to, in a sub-directory of the
+                        collection
+  --archive <tar file>  tar archive the observations read with --ids, --start
+                        or --end are written to instead of --output-dir
+  --threads <number of threads>
+                        number of concurrent downloads (default: 8)
+  --validate            check the observation against the CAOM2 schemas before
+                        writing it
+  --namespace {2.0,2.1,2.2}
+                        convert the observation to this version of CAOM2. By
+                        default it is written as returned by the repo
 """
 
         update_usage =\
 """usage: caom2-repo-client update [-h] [--certfile CERTFILE] [--anonymous]
                                 [--host HOST] [--resourceID RESOURCEID]
                                 [--verbose] [--debug] [--quiet] [--version]
-                                <observation file>
+                                [--source <directory, tar file or glob>]
+                                [--threads <number of threads>]
+                                [--processes <number of processes>]
+                                [<observation file>]
 
-Update an existing observation
+Update an existing observation, or many of them with --source
 
 positional arguments:
   <observation file>
@@ -546,16 +1022,30 @@ optional arguments:
   --debug               debug messages
   --quiet               run quietly
   --version             show program's version number and exit
+  --source <directory, tar file or glob>
+                        send all the observation files of a directory, tar
+                        archive or glob pattern
+  --threads <number of threads>
+                        number of concurrent uploads with --source (default:
+                        8)
+  --processes <number of processes>
+                        number of processes parsing the files of --source
+                        (default: 1)
 """
 
         delete_usage =\
 """usage: caom2-repo-client delete [-h] [--certfile CERTFILE] [--anonymous]
                                 [--host HOST] [--resourceID RESOURCEID]
                                 [--verbose] [--debug] [--quiet] [--version]
-                                --collection <collection>
-                                <ID of observation>
+                                --collection <collection> [--ids <file>]
+                                [--start <datetime start point>]
+                                [--end <datetime end point>]
+                                [--threads <number of threads>]
+                                [--rate <deletes per second>] [--dry-run]
+                                [--journal <file>]
+                                [<ID of observation>]
 
-Delete an existing observation
+Delete an existing observation, or many of them with --ids, --start or --end
 
 positional arguments:
   <ID of observation>
@@ -576,6 +1066,20 @@ optional arguments:
   --quiet               run quietly
   --version             show program's version number and exit
   --collection <collection>
+  --ids <file>          delete the observations listed in this file, one ID
+                        per line or a listing of the list command (- for the
+                        standard input)
+  --start <datetime start point>
+                        delete the observations modified since this date (UTC)
+  --end <datetime end point>
+                        delete the observations modified until this date (UTC)
+  --threads <number of threads>
+                        number of concurrent deletes (default: 8)
+  --rate <deletes per second>
+                        maximum number of deletes per second
+  --dry-run             only print the number of observations that would be
+                        deleted
+  --journal <file>      file the deleted observations are appended to
 """
 
         visit_usage =\
@@ -586,8 +1090,26 @@ optional arguments:
                                [--start <datetime start point>]
                                [--end <datetime end point>]
                                [--retries <number of retries>]
+                               [--processes <number of processes>]
+                               [--partition {equal,adaptive}]
+                               [--batch-size <number of observations>]
+                               [--metrics-file <file>]
+                               [--metrics-format {prometheus,jsonl}]
+                               [--metrics-interval <seconds>] [--progress]
+                               [--status-file <file>]
+                               [--progress-interval <seconds>]
+                               [--shard-dir <directory>]
+                               [--shards <number of shards>]
+                               [--shard-by {time,hash}]
+                               [--lease-ttl <seconds>]
                                [-s <CAOM2 service URL>]
-                               <datacollection>
+                               [--source <directory, tar file or glob>]
+                               [--output-dir <directory>] [--dry-run] [--diff]
+                               [--listing <file>]
+                               [--id-pattern <regular expression>]
+                               [--window <start>/<end>] [--journal <file>]
+                               [--result <file>]
+                               [<datacollection>]
 
 Visit observations in a collection
 
@@ -613,8 +1135,45 @@ optional arguments:
                         earliest dataset to visit (UTC %Y-%m-%d format)
   --retries <number of retries>
                         number of tries with transient server errors
+  --processes <number of processes>
+                        number of worker processes, each visiting a sub-range of [start, end]
+  --partition {equal,adaptive}
+                        split [start, end] into equal time windows or adaptively from the listing density (default: equal)
+  --batch-size <number of observations>
+                        number of observations passed at once to the update_batch method of the plugin (default: 100)
+  --metrics-file <file>
+                        file the per-stage latency, byte and error metrics are written to
+  --metrics-format {prometheus,jsonl}
+                        format of the metrics file (default: prometheus)
+  --metrics-interval <seconds>
+                        seconds between updates of the metrics file (default: 60)
+  --progress            report throughput, latency and ETA to stderr
+  --status-file <file>  file overwritten with the latest progress report (JSON)
+  --progress-interval <seconds>
+                        seconds between progress reports (default: 60)
+  --shard-dir <directory>
+                        directory shared by the workers of a sharded visit
+  --shards <number of shards>
+                        number of shards created by the first worker of a sharded visit
+  --shard-by {time,hash}
+                        split a sharded visit into time windows or by hash of the observation IDs (default: time)
+  --lease-ttl <seconds>
+                        seconds after which the shard of an unresponsive worker is reclaimed (default: 300)
   -s <CAOM2 service URL>, --server <CAOM2 service URL>
                         URL of the CAOM2 repo server
+  --source <directory, tar file or glob>
+                        visit the observation files of a local directory, tar archive or glob pattern instead of a collection in the CAOM2 repo
+  --output-dir <directory>
+                        directory the observations visited from --source or by a dry run are written to
+  --dry-run             write the updated observations to --output-dir instead of updating them in the repo
+  --diff                with --dry-run, also write the changes made by the plugin as a unified diff next to each observation
+  --listing <file>      visit the observations of a listing written by the list command instead of listing the collection again
+  --id-pattern <regular expression>
+                        only visit the observations whose ID matches this expression
+  --window <start>/<end>
+                        only visit the observations modified in this window (UTC). Either date can be empty. Can be repeated
+  --journal <file>      record the observations that fail in this file and continue the visit instead of aborting it
+  --result <file>       file the aggregate computed by the map and reduce methods of the plugin is written to, instead of the standard output
 
 Minimum plugin file format:
 ----
@@ -627,6 +1186,118 @@ Minimum plugin file format:
             'observation {} is not an Observation'.format(observation))
         # custom code to update the observation
 ----
+Plugins that can process several observations at once may implement
+instead, or in addition to update:
+----
+    def update_batch(self, observations):
+        # custom code to update the list of observations
+----
+Plugins may also skip observations before they are read from the repo:
+----
+    def accept(self, observation_id, last_modified):
+        # return False to skip the observation
+----
+Analysis plugins compute an aggregate of the observations without
+updating them. The aggregate is printed as JSON, or written to --result:
+----
+    def map(self, observation):
+        # return a partial result computed from the observation
+
+    def reduce(self, a, b):
+        # return the combination of two partial results
+----
+"""
+
+        sync_usage =\
+"""usage: caom2-repo-client sync [-h] [--certfile CERTFILE] [--anonymous]
+                              [--host HOST] [--resourceID RESOURCEID]
+                              [--verbose] [--debug] [--quiet] [--version]
+                              [--threads <number of threads>] [--prune]
+                              [--full] [--listing <file>]
+                              <directory> <collection> [<collection> ...]
+
+Copy the observations of collections modified since the last sync to a local
+directory
+
+positional arguments:
+  <directory>           local directory with a sub-directory for each
+                        collection
+  <collection>          data collection in CAOM2 repo
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --certfile CERTFILE   location of your CADC certificate file (default:
+                        $HOME/.ssl/cadcproxy.pem, otherwise uses $HOME/.netrc
+                        for name/password)
+  --anonymous           Force anonymous connection
+  --host HOST           Base hostname for services - used mainly for testing
+                        (default: www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca)
+  --resourceID RESOURCEID
+                        resource identifier (default
+                        ivo://cadc.nrc.ca/caom2repo)
+  --verbose             verbose messages
+  --debug               debug messages
+  --quiet               run quietly
+  --version             show program's version number and exit
+  --threads <number of threads>
+                        number of concurrent downloads (default: 8)
+  --prune               remove the local observations that were deleted from
+                        the repo (lists the whole collection)
+  --full                ignore the watermark of the last sync and copy the
+                        whole collection
+  --listing <file>      copy the observations of a listing written by the list
+                        command instead of listing the collection. Requires a
+                        single collection
+"""
+
+        replay_usage =\
+"""usage: caom2-repo-client replay [-h] [--certfile CERTFILE] [--anonymous]
+                                [--host HOST] [--resourceID RESOURCEID]
+                                [--verbose] [--debug] [--quiet] [--version]
+                                --plugin <pluginClassFile>
+                                [--processes <number of processes>]
+                                [--batch-size <number of observations>]
+                                [--output-dir <directory>] [--dry-run]
+                                [--diff] [--journal <file>]
+                                <journal file>
+
+Visit again the observations recorded in the journal of a visit
+
+positional arguments:
+  <journal file>        journal of the failed observations of a visit
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --certfile CERTFILE   location of your CADC certificate file (default:
+                        $HOME/.ssl/cadcproxy.pem, otherwise uses $HOME/.netrc
+                        for name/password)
+  --anonymous           Force anonymous connection
+  --host HOST           Base hostname for services - used mainly for testing
+                        (default: www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca)
+  --resourceID RESOURCEID
+                        resource identifier (default
+                        ivo://cadc.nrc.ca/caom2repo)
+  --verbose             verbose messages
+  --debug               debug messages
+  --quiet               run quietly
+  --version             show program's version number and exit
+  --plugin <pluginClassFile>
+                        Plugin class to update each observation
+  --processes <number of processes>
+                        number of worker processes, each visiting a part of
+                        the observations
+  --batch-size <number of observations>
+                        number of observations passed at once to the
+                        update_batch method of the plugin (default: 100)
+  --output-dir <directory>
+                        directory the observations visited by a dry run are
+                        written to
+  --dry-run             write the updated observations to --output-dir instead
+                        of updating them in the repo
+  --diff                with --dry-run, also write the changes made by the
+                        plugin as a unified diff next to each observation
+  --journal <file>      record the observations that fail again in this file
+                        and continue instead of aborting
 """
 
         self.maxDiff = None
@@ -677,3 +1348,19 @@ Minimum plugin file format:
                 core.main()
         #print(stdout_mock.getvalue())
         self.assertEqual(visit_usage, stdout_mock.getvalue())
+
+        # replay --help
+        with patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            sys.argv = ["caom2-repo-client", "replay", "--help"]
+            with self.assertRaises(MyExitError):
+                core.main()
+        #print(stdout_mock.getvalue())
+        self.assertEqual(replay_usage, stdout_mock.getvalue())
+
+        # sync --help
+        with patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            sys.argv = ["caom2-repo-client", "sync", "--help"]
+            with self.assertRaises(MyExitError):
+                core.main()
+        #print(stdout_mock.getvalue())
+        self.assertEqual(sync_usage, stdout_mock.getvalue())
@@ -0,0 +1,118 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import pickle
+import unittest
+from datetime import datetime
+
+from caom2repo.filters import ListingFilter, AllFilters
+from caom2repo.shard import HashShardFilter
+
+
+class TestFilters(unittest.TestCase):
+
+    """Test the filters of the listing"""
+
+    def test_listing_filter(self):
+        date = datetime(2017, 1, 15)
+        self.assertTrue(ListingFilter()('a', date))
+
+        f = ListingFilter(pattern='^70+o$')
+        self.assertTrue(f('7000o', date))
+        self.assertFalse(f('17000o', date))
+
+        f = ListingFilter(windows=[(datetime(2017, 1, 1), datetime(2017, 1, 10)),
+                                   (datetime(2017, 1, 15), None)])
+        self.assertTrue(f('a', datetime(2017, 1, 1)))
+        self.assertFalse(f('a', datetime(2017, 1, 11)))
+        self.assertTrue(f('a', datetime(2018, 1, 1)))
+
+        f = ListingFilter('^a', [(None, datetime(2017, 1, 10))])
+        self.assertTrue(f('ab', datetime(2017, 1, 1)))
+        self.assertFalse(f('ba', datetime(2017, 1, 1)))
+        self.assertFalse(f('ab', date))
+
+        # passed to the worker processes
+        f = pickle.loads(pickle.dumps(f))
+        self.assertTrue(f('ab', datetime(2017, 1, 1)))
+        self.assertFalse(f('ba', datetime(2017, 1, 1)))
+
+    def test_all_filters(self):
+        date = datetime(2017, 1, 15)
+        f = AllFilters(ListingFilter('^a'), None, HashShardFilter(0, 1))
+        self.assertTrue(f('a', date))
+        self.assertFalse(f('b', date))
+        self.assertTrue(AllFilters()('b', date))
+        shard_filter = HashShardFilter(0, 2)
+        f = pickle.loads(pickle.dumps(AllFilters(ListingFilter('^a'), shard_filter)))
+        for i in range(10):
+            self.assertEqual(shard_filter('a{}'.format(i)), f('a{}'.format(i), date))
+            self.assertFalse(f('b{}'.format(i), date))
@@ -0,0 +1,172 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from caom2repo import metrics
+from caom2repo.metrics import Metrics, NULL_METRICS
+
+
+class TestMetrics(unittest.TestCase):
+
+    """Test the Metrics class"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record(self):
+        stats = Metrics()
+        stats.record('get', 0.0001)
+        stats.record('get', 0.003)
+        stats.record('get', 100)
+        with stats.timer('post'):
+            pass
+        with self.assertRaises(ValueError):
+            with stats.timer('post'):
+                raise ValueError('boom')
+        stats.add_bytes('get', 10)
+        stats.add_bytes('get', 5)
+        stats.error('parse')
+
+        snapshot = stats.snapshot()
+        self.assertEquals(set(['get', 'post', 'parse']), set(snapshot.keys()))
+        self.assertEquals(3, snapshot['get']['count'])
+        self.assertAlmostEquals(100.0031, snapshot['get']['sum'])
+        self.assertEquals(15, snapshot['get']['bytes'])
+        self.assertEquals(0, snapshot['get']['errors'])
+        self.assertEquals(len(metrics.BUCKETS) + 1, len(snapshot['get']['buckets']))
+        self.assertEquals(1, snapshot['get']['buckets'][0])
+        self.assertEquals(1, snapshot['get']['buckets'][2])
+        self.assertEquals(1, snapshot['get']['buckets'][-1])
+        self.assertEquals(2, snapshot['post']['count'])
+        self.assertEquals(1, snapshot['post']['errors'])
+        self.assertEquals(1, snapshot['parse']['errors'])
+        self.assertEquals(0, snapshot['parse']['count'])
+
+        # snapshots are copies
+        snapshot['get']['count'] = 0
+        self.assertEquals(3, stats.snapshot()['get']['count'])
+
+        # merge
+        other = Metrics()
+        other.merge(snapshot)
+        other.merge(stats.snapshot())
+        self.assertEquals(3, other.snapshot()['get']['count'])
+        self.assertEquals(30, other.snapshot()['get']['bytes'])
+        self.assertEquals(2, other.snapshot()['get']['buckets'][-1])
+
+    def test_export(self):
+        prom_file = os.path.join(self.tmp_dir, 'metrics.prom')
+        stats = Metrics(export_file=prom_file)
+        stats.record('get', 0.002)
+        stats.add_bytes('get', 100)
+        self.assertFalse(os.path.exists(prom_file))
+        stats.export()
+        with open(prom_file) as f:
+            content = f.read()
+        self.assertTrue('# TYPE caom2repo_stage_seconds histogram\n' in content)
+        self.assertTrue('caom2repo_stage_seconds_bucket{stage="get",le="0.001"} 0\n' in content)
+        self.assertTrue('caom2repo_stage_seconds_bucket{stage="get",le="0.0025"} 1\n' in content)
+        self.assertTrue('caom2repo_stage_seconds_bucket{stage="get",le="+Inf"} 1\n' in content)
+        self.assertTrue('caom2repo_stage_seconds_count{stage="get"} 1\n' in content)
+        self.assertTrue('caom2repo_stage_bytes_total{stage="get"} 100\n' in content)
+        self.assertTrue('caom2repo_stage_errors_total{stage="get"} 0\n' in content)
+        self.assertEquals([os.path.basename(prom_file)], os.listdir(self.tmp_dir))
+
+        # periodic JSON lines export
+        jsonl_file = os.path.join(self.tmp_dir, 'metrics.jsonl')
+        stats = Metrics(export_file=jsonl_file, export_format=metrics.JSONL_FORMAT,
+                        export_interval=0)
+        stats.record('get', 0.002)
+        stats.record('post', 0.002)
+        with open(jsonl_file) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEquals(2, len(lines))
+        self.assertEquals(['get'], list(lines[0]['stages'].keys()))
+        self.assertEquals(set(['get', 'post']), set(lines[1]['stages'].keys()))
+
+        with self.assertRaises(ValueError):
+            Metrics(export_format='xml')
+
+    def test_null_metrics(self):
+        self.assertFalse(NULL_METRICS.enabled)
+        with NULL_METRICS.timer('get'):
+            NULL_METRICS.add_bytes('get', 10)
+        NULL_METRICS.merge({'get': {}})
+        NULL_METRICS.export()
+        self.assertEquals({}, NULL_METRICS.snapshot())
@@ -0,0 +1,207 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from caom2.obs_reader_writer import ObservationReader, ObservationWriter, CAOM21_NAMESPACE
+from caom2.observation import SimpleObservation
+
+from caom2repo.common import iter_source, imap_bounded, TASKS_PER_PROCESS
+from caom2repo.offline import visit_local
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+class TestVisitLocal(unittest.TestCase):
+
+    """Test the visit of local observation files"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, 'source')
+        os.makedirs(os.path.join(self.source, 'sub'))
+        for i in range(5):
+            name = 'obs{}.xml'.format(i) if i < 3 else os.path.join('sub', 'obs{}.xml'.format(i))
+            with open(os.path.join(self.source, name), 'wb') as f:
+                ObservationWriter(False, False, 'caom2', CAOM21_NAMESPACE).write(
+                    SimpleObservation('cfht', 'obs{}'.format(i)), f)
+        with open(os.path.join(self.source, 'notes.txt'), 'w') as f:
+            f.write('not an observation')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, path):
+        return ObservationReader().read(os.path.join(self.tmp_dir, path))
+
+    def test_iter_source(self):
+        names = [name for (name, _, _) in iter_source(self.source)]
+        self.assertEquals(['obs0.xml', 'obs1.xml', 'obs2.xml', os.path.join('sub', 'obs3.xml'),
+                           os.path.join('sub', 'obs4.xml')], names)
+        names = [name for (name, _, _) in iter_source(os.path.join(self.source, 'obs[12].xml'))]
+        self.assertEquals(['obs1.xml', 'obs2.xml'], sorted(names))
+        self.assertEquals([], list(iter_source(os.path.join(self.source, 'blah*.xml'))))
+
+    def test_visit_directory(self):
+        plugin = os.path.join(THIS_DIR, 'addplaneplugin.py')
+        output = os.path.join(self.tmp_dir, 'out')
+        self.assertEquals(5, visit_local(plugin, self.source, output, batch_size=2))
+        obs = self._read(os.path.join('out', 'sub', 'obs3.xml'))
+        self.assertEquals('obs3', obs.observation_id)
+        self.assertEquals(1, len(obs.planes))
+        # written in the namespace of the source
+        with open(os.path.join(output, 'obs0.xml')) as f:
+            self.assertTrue(CAOM21_NAMESPACE in f.read())
+        self.assertFalse(os.path.exists(os.path.join(output, 'notes.txt')))
+
+        # worker processes
+        output = os.path.join(self.tmp_dir, 'out2')
+        self.assertEquals(5, visit_local(plugin, self.source, output, processes=2, batch_size=1))
+        self.assertEquals(1, len(self._read(os.path.join('out2', 'sub', 'obs4.xml')).planes))
+
+        # update_batch plugin
+        output = os.path.join(self.tmp_dir, 'out3')
+        self.assertEquals(5, visit_local(os.path.join(THIS_DIR, 'batchplugin.py'), self.source,
+                                         output, batch_size=3))
+
+    def test_visit_tar(self):
+        archive = os.path.join(self.tmp_dir, 'source.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            tar.add(self.source, arcname='snapshot')
+        output = os.path.join(self.tmp_dir, 'out')
+        plugin = os.path.join(THIS_DIR, 'addplaneplugin.py')
+        self.assertEquals(5, visit_local(plugin, archive, output))
+        self.assertEquals(1, len(self._read(os.path.join('out', 'snapshot', 'sub',
+                                                         'obs4.xml')).planes))
+
+    def test_unsafe_tar_members(self):
+        with open(os.path.join(self.source, 'obs0.xml'), 'rb') as f:
+            content = f.read()
+        output = os.path.join(self.tmp_dir, 'out', 'sub')
+        plugin = os.path.join(THIS_DIR, 'addplaneplugin.py')
+        for name in ('../escaped.xml', '/tmp/absolute.xml', 'a/../../escaped.xml'):
+            archive = os.path.join(self.tmp_dir, 'unsafe.tar')
+            with tarfile.open(archive, 'w') as tar:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+            with self.assertRaises(ValueError):
+                list(iter_source(archive))
+            with self.assertRaises(ValueError):
+                visit_local(plugin, archive, output)
+            self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'out', 'escaped.xml')))
+
+        # names are normalized
+        with tarfile.open(archive, 'w') as tar:
+            info = tarfile.TarInfo('./snapshot/a/../obs0.xml')
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        self.assertEquals(['snapshot/obs0.xml'], [name for (name, _, _) in iter_source(archive)])
+
+    def test_imap_bounded(self):
+        read = []
+
+        def tasks():
+            for i in range(20):
+                read.append(i)
+                yield i
+
+        pool = ThreadPool(2)
+        try:
+            results = []
+            for result in imap_bounded(pool, abs, tasks(), 2):
+                results.append(result)
+                # the source is read ahead by at most TASKS_PER_PROCESS tasks per process
+                self.assertTrue(len(read) <= len(results) - 1 + 2 * TASKS_PER_PROCESS)
+            self.assertEquals(list(range(20)), results)
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_failures(self):
+        with open(os.path.join(self.source, 'bad.xml'), 'w') as f:
+            f.write('<bad/>')
+        output = os.path.join(self.tmp_dir, 'out')
+        with self.assertRaises(Exception) as context:
+            visit_local(os.path.join(THIS_DIR, 'passplugin.py'), self.source, output)
+        self.assertTrue('Failed to visit 1 of 6 observations' in str(context.exception))
+        self.assertTrue('bad.xml: read:' in str(context.exception))
+        # the other observations have been visited
+        self.assertEquals(['obs0.xml', 'obs1.xml', 'obs2.xml', 'sub'], sorted(os.listdir(output)))
+
+        with self.assertRaises(Exception):
+            visit_local(os.path.join(THIS_DIR, 'blah.py'), self.source, output)
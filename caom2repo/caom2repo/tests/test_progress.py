@@ -0,0 +1,185 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+# TODO to be changed to io.StringIO when caom2 is prepared for python3
+from StringIO import StringIO
+from datetime import datetime
+
+from mock import patch
+
+from caom2repo import progress
+from caom2repo.progress import ProgressReporter
+
+
+class TestProgressReporter(unittest.TestCase):
+
+    """Test the ProgressReporter class"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_estimate(self):
+        reporter = ProgressReporter()
+        reporter.begin(datetime(2000, 1, 1), datetime(2000, 1, 11))
+        self.assertIsNone(reporter.estimated_total())
+        # a tenth of the interval listed
+        reporter.listed(100, datetime(2000, 1, 2), False)
+        self.assertEquals(1000, reporter.estimated_total())
+        reporter.listed(100, datetime(2000, 1, 6), False)
+        self.assertEquals(400, reporter.estimated_total())
+        reporter.listed(50, datetime(2000, 1, 10), True)
+        self.assertEquals(250, reporter.estimated_total())
+
+        # no start date: the first page is the origin of the extrapolation
+        reporter = ProgressReporter()
+        reporter.begin(None, datetime(2000, 1, 11))
+        reporter.listed(100, datetime(2000, 1, 1), False)
+        self.assertIsNone(reporter.estimated_total())
+        reporter.listed(100, datetime(2000, 1, 6), False)
+        self.assertEquals(300, reporter.estimated_total())
+
+        # visited observations of a previous interval are kept
+        reporter.observations_visited(10, 1.0)
+        reporter.begin(datetime(2000, 1, 1), datetime(2000, 1, 2))
+        reporter.listed(5, datetime(2000, 1, 2), True)
+        self.assertEquals(15, reporter.estimated_total())
+
+    @patch('caom2repo.progress.time.time')
+    def test_report(self, time_mock):
+        time_mock.return_value = 1000.0
+        stream = StringIO()
+        status_file = os.path.join(self.tmp_dir, 'status.json')
+        reporter = ProgressReporter(stream=stream, status_file=status_file, interval=10)
+        reporter.begin(datetime(2000, 1, 1), datetime(2000, 1, 3))
+        reporter.listed(100, datetime(2000, 1, 2), False)
+        reporter.observations_visited(10, 5.0)
+        self.assertEquals('', stream.getvalue())
+
+        time_mock.return_value = 1010.0
+        reporter.observations_visited(10, 1.0)
+        self.assertEquals(1, len(stream.getvalue().splitlines()))
+        self.assertTrue('Visited 20 of ~200 observations (10.0%), 2.00 obs/s, latency 300 ms, '
+                        'ETA 0:01:30' in stream.getvalue())
+        with open(status_file) as f:
+            status = json.load(f)
+        self.assertEquals(20, status['visited'])
+        self.assertEquals(200, status['total'])
+        self.assertEquals(2.0, status['rate'])
+        self.assertEquals(90.0, status['eta'])
+
+        # moving average over the last interval
+        time_mock.return_value = 1020.0
+        reporter.observations_visited(5, 0.5)
+        self.assertTrue('0.50 obs/s, latency 100 ms' in stream.getvalue().splitlines()[-1])
+
+        reporter.finish()
+        self.assertTrue('Visited 25 of ~25 observations (100.0%)' in stream.getvalue().splitlines()[-1])
+        self.assertEquals(['status.json'], os.listdir(self.tmp_dir))
+
+    def test_shared(self):
+        parent = ProgressReporter(interval=1000)
+        shared = parent.share(2)
+        workers = [ProgressReporter(), ProgressReporter()]
+        for slot, worker in enumerate(workers):
+            worker.attach(shared, slot)
+        workers[0].begin(datetime(2000, 1, 1), datetime(2000, 1, 2))
+        workers[0].listed(10, datetime(2000, 1, 2), True)
+        workers[0].observations_visited(4, 2.0)
+        parent._aggregate(shared)
+        self.assertEquals(4, parent.visited)
+        self.assertEquals(2.0, parent.latency_sum)
+        # total unknown until all the workers have an estimate
+        self.assertIsNone(parent.estimated_total())
+        workers[1].begin(datetime(2000, 1, 1), datetime(2000, 1, 2))
+        workers[1].listed(5, datetime(2000, 1, 2), True)
+
+        stream = StringIO()
+        parent.stream = stream
+        parent.watch(shared)
+        parent.finish()
+        self.assertEquals(4, parent.visited)
+        self.assertTrue('Visited 4 of ~4 observations' in stream.getvalue())
+
+    def test_format_status(self):
+        self.assertTrue(progress.format_status(
+            {'visited': 0, 'total': None, 'rate': None, 'latency': None, 'eta': None}).
+            endswith('Visited 0 observations'))
+        self.assertTrue(progress.format_status(
+            {'visited': 0, 'total': 0, 'rate': 0.0, 'latency': None, 'eta': None}).
+            endswith('Visited 0 of ~0 observations (100.0%), 0.00 obs/s'))
@@ -0,0 +1,387 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import requests
+from mock import patch
+from caom2.obs_reader_writer import ObservationReader
+from caom2.observation import SimpleObservation
+from caom2.plane import Plane
+
+from caom2repo.core import CAOM2RepoClient, main
+from caom2repo.filters import ListingFilter
+from caom2repo.journal import read_journal
+from caom2repo.shard import ShardedVisit
+from caom2repo.tests.repo_server import RepoServer, DirectoryStore
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+class TestRepoServer(unittest.TestCase):
+
+    """Test the client against the RepoServer stand-in"""
+
+    def test_crud(self):
+        with RepoServer() as server:
+            client = CAOM2RepoClient(host=server.host)
+            obs = SimpleObservation('cfht', '7000000o')
+            client.put_observation(obs)
+            self.assertEquals(obs, client.get_observation('cfht', '7000000o'))
+
+            # already exists
+            with self.assertRaises(requests.HTTPError):
+                client.put_observation(obs)
+
+            obs.planes.add(Plane('PREVIEW'))
+            client.post_observation(obs)
+            self.assertEquals(obs, client.get_observation('cfht', '7000000o'))
+
+            client.delete_observation('cfht', '7000000o')
+            with self.assertRaises(requests.HTTPError):
+                client.get_observation('cfht', '7000000o')
+            with self.assertRaises(requests.HTTPError):
+                client.post_observation(obs)
+            self.assertEquals({'PUT': 2, 'GET': 3, 'POST': 2, 'DELETE': 1}, server.requests)
+
+    def test_stream(self):
+        with RepoServer() as server:
+            document = b'<?xml version="1.0"?>\n' + b'x' * 200000
+            server.store.add('cfht', 'big', document)
+            client = CAOM2RepoClient(host=server.host)
+            out = io.BytesIO()
+            self.assertEquals(len(document), client.stream_observation_xml('cfht', 'big', out))
+            self.assertEquals(document, out.getvalue())
+            with self.assertRaises(requests.HTTPError):
+                client.stream_observation_xml('cfht', 'missing', io.BytesIO())
+
+    def test_listing(self):
+        with RepoServer() as server:
+            for i in range(5):
+                server.store.add('cfht', 'obs{}'.format(i), b'<xml/>',
+                                 last_modified=datetime(2000, 1, i + 1, 0, 0, 0, 123000))
+            client = CAOM2RepoClient(host=server.host)
+            self.assertEquals(['obs0', 'obs1', 'obs2', 'obs3', 'obs4'],
+                              [row[0] for row in client._get_observations('cfht')])
+            self.assertEquals(datetime(2000, 1, 5, 0, 0, 0, 123000), client._start)
+            self.assertEquals([('obs1', datetime(2000, 1, 2, 0, 0, 0, 123000)),
+                               ('obs2', datetime(2000, 1, 3, 0, 0, 0, 123000))],
+                              client._get_listing('cfht', start=datetime(2000, 1, 2),
+                                                  end=datetime(2000, 1, 4)))
+            self.assertEquals(['obs0', 'obs1'], [row[0] for row in client._get_listing('cfht', maxrec=2)])
+            self.assertEquals([], client._get_observations('other'))
+
+    @patch('caom2repo.core.BATCH_SIZE', 3)
+    def test_visit(self):
+        plugin = os.path.join(THIS_DIR, 'addplaneplugin.py')
+        with RepoServer() as server:
+            _add_observations(server.store, 10)
+            client = CAOM2RepoClient(host=server.host)
+            # the posted observations move to the end of the listing and are not visited again
+            self.assertEquals(10, client.visit(plugin, 'cfht'))
+            self.assertEquals(10, server.requests['POST'])
+            self.assertEquals(1, len(client.get_observation('cfht', 'obs3').planes))
+
+        # worker processes
+        with RepoServer() as server:
+            _add_observations(server.store, 10)
+            client = CAOM2RepoClient(host=server.host)
+            self.assertEquals(10, client.visit(plugin, 'cfht', processes=3, partition='adaptive'))
+            self.assertEquals(10, server.requests['POST'])
+
+    def test_sharded_visit(self):
+        plugin = os.path.join(THIS_DIR, 'addplaneplugin.py')
+        shard_dir = tempfile.mkdtemp()
+        try:
+            with RepoServer() as server:
+                start = datetime.utcnow() - timedelta(hours=4)
+                for i in range(20):
+                    server.store.add('cfht', 'obs{}'.format(i),
+                                     _to_xml(SimpleObservation('cfht', 'obs{}'.format(i))),
+                                     last_modified=start + timedelta(minutes=10 * i + 1))
+                client = CAOM2RepoClient(host=server.host)
+                # the observations posted by the first shards move past the end of the plan
+                # and are not visited again by the last shard
+                self.assertEquals(20, ShardedVisit(client, shard_dir).run(
+                    plugin, 'cfht', start=start, shards=4))
+                self.assertEquals(20, server.requests['POST'])
+        finally:
+            shutil.rmtree(shard_dir)
+
+    def test_visit_listing(self):
+        tmp_dir = tempfile.mkdtemp()
+        listing_file = os.path.join(tmp_dir, 'listing.csv')
+        try:
+            with RepoServer() as server:
+                for observation_id in ['a', 'e', 'f', 'g']:
+                    server.store.add('cfht', observation_id,
+                                     _to_xml(SimpleObservation('cfht', observation_id)),
+                                     last_modified=datetime(2000, 1, 1))
+                with open(listing_file, 'w') as f:
+                    f.write('a,2000-01-01T00:00:00.000\ne,2000-01-01T00:00:00.000\n'
+                            'f,2000-01-01T00:00:00.000\ng,2000-01-01T00:00:00.000\n')
+                # the accept method of the plugin applies to the observations of the listing
+                sys.argv = ['caom2-repo', 'visit', '--anonymous', '--host', server.host,
+                            '--plugin', os.path.join(THIS_DIR, 'acceptplugin.py'),
+                            '--listing', listing_file, '--id-pattern', '[aef]', 'cfht']
+                main()
+                self.assertEquals(2, server.requests['POST'])
+                self.assertEquals(2, server.requests['GET'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_analyze(self):
+        plugin = os.path.join(THIS_DIR, 'mapreduceplugin.py')
+        with RepoServer() as server:
+            _add_observations(server.store, 10)
+            client = CAOM2RepoClient(host=server.host)
+            self.assertEquals({'observations': 10, 'planes': 0}, client.analyze(plugin, 'cfht'))
+            # partial results of the worker processes are combined
+            self.assertEquals({'observations': 10, 'planes': 0},
+                              client.analyze(plugin, 'cfht', processes=3,
+                                             partition='adaptive'))
+            self.assertEquals({'observations': 4, 'planes': 0},
+                              client.analyze(plugin, 'cfht', processes=2,
+                                             accept=ListingFilter(pattern='obs[0-3]')))
+            self.assertFalse('POST' in server.requests)
+
+    @patch('caom2repo.core.BATCH_SIZE', 2)
+    def test_analyze_pages(self):
+        plugin = os.path.join(THIS_DIR, 'mapreduceplugin.py')
+        with RepoServer() as server:
+            _add_observations(server.store, 5)
+            client = CAOM2RepoClient(host=server.host)
+            # the pages of the listing overlap on their last observation, which is mapped once
+            self.assertEquals({'observations': 5, 'planes': 0}, client.analyze(plugin, 'cfht'))
+
+            # a page of observations modified at the same time cannot be paged through
+            date = datetime.utcnow() - timedelta(minutes=1)
+            for i in range(3):
+                server.store.add('cfht', 'same{}'.format(i), b'<xml/>', last_modified=date)
+            with self.assertRaises(Exception):
+                client.analyze(plugin, 'cfht', start=date)
+
+    def test_dry_run(self):
+        plugin = os.path.join(THIS_DIR, 'addplaneplugin.py')
+        output_dir = tempfile.mkdtemp()
+        try:
+            with RepoServer() as server:
+                _add_observations(server.store, 4)
+                client = CAOM2RepoClient(host=server.host)
+                self.assertEquals(4, client.visit(plugin, 'cfht', output_dir=output_dir,
+                                                  diff=True))
+                self.assertEquals(4, client.visit(plugin, 'cfht', output_dir=output_dir,
+                                                  processes=2, partition='adaptive'))
+                # nothing is updated in the repo
+                self.assertFalse('POST' in server.requests)
+                self.assertEquals(0, len(client.get_observation('cfht', 'obs1').planes))
+            self.assertEquals(['obs{}.{}'.format(i, ext) for i in range(4)
+                               for ext in ('diff', 'xml')],
+                              sorted(os.listdir(os.path.join(output_dir, 'cfht'))))
+            obs = ObservationReader().read(os.path.join(output_dir, 'cfht', 'obs1.xml'))
+            self.assertEquals(1, len(obs.planes))
+            with open(os.path.join(output_dir, 'cfht', 'obs1.diff')) as f:
+                changes = f.read()
+            self.assertTrue(changes.startswith('--- a/obs1.xml\n+++ b/obs1.xml\n'))
+            self.assertTrue('+    <caom2:plane ' in changes)
+        finally:
+            shutil.rmtree(output_dir)
+
+    @patch('caom2repo.core.BATCH_SIZE', 2)
+    def test_dry_run_pages(self):
+        output_dir = tempfile.mkdtemp()
+        journal = os.path.join(output_dir, 'failures.jsonl')
+        try:
+            with RepoServer() as server:
+                _add_observations(server.store, 5)
+                client = CAOM2RepoClient(host=server.host)
+                # nothing is posted, so the observations at the boundaries of the pages of
+                # the listing stay in the listing and must be skipped
+                self.assertEquals(5, client.visit(os.path.join(THIS_DIR, 'addplaneplugin.py'),
+                                                  'cfht', output_dir=output_dir))
+                # 5 pages of the listing, then each observation is read once
+                self.assertEquals(5 + 5, server.requests['GET'])
+                self.assertEquals(5, len(os.listdir(os.path.join(output_dir, 'cfht'))))
+
+                # the failures are journaled once
+                self.assertEquals(3, client.visit(os.path.join(THIS_DIR, 'failplugin.py'),
+                                                  'cfht', output_dir=output_dir,
+                                                  journal=journal))
+                self.assertEquals([('cfht', ['obs1', 'obs3'])], read_journal(journal))
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_journal(self):
+        tmp_dir = tempfile.mkdtemp()
+        journal = os.path.join(tmp_dir, 'failures.jsonl')
+        try:
+            with RepoServer() as server:
+                _add_observations(server.store, 6)
+                client = CAOM2RepoClient(host=server.host)
+                # failures abort the visit without a journal
+                with self.assertRaises(ValueError):
+                    client.visit(os.path.join(THIS_DIR, 'failplugin.py'), 'cfht')
+                self.assertEquals(3, client.visit(os.path.join(THIS_DIR, 'failplugin.py'), 'cfht',
+                                                  journal=journal))
+                self.assertEquals([('cfht', ['obs1', 'obs3', 'obs5'])], read_journal(journal))
+                self.assertEquals(0, len(client.get_observation('cfht', 'obs1').planes))
+
+                # only the failed observations are replayed
+                server.requests.clear()
+                server.store.remove('cfht', 'obs3')
+                replay_journal = os.path.join(tmp_dir, 'replay.jsonl')
+                self.assertEquals(1, client.visit_observations(
+                    os.path.join(THIS_DIR, 'addplaneplugin.py'), 'cfht', ['obs1', 'obs3'],
+                    journal=replay_journal))
+                self.assertEquals(1, server.requests['POST'])
+                self.assertEquals(1, len(client.get_observation('cfht', 'obs1').planes))
+                self.assertEquals([('cfht', ['obs3'])], read_journal(replay_journal))
+                with open(replay_journal) as f:
+                    self.assertEquals('get', json.loads(f.readline())['stage'])
+
+                self.assertEquals(1, client.visit_observations(
+                    os.path.join(THIS_DIR, 'addplaneplugin.py'), 'cfht', ['obs5', 'obs3'],
+                    processes=2, journal=replay_journal))
+                self.assertEquals(1, len(client.get_observation('cfht', 'obs5').planes))
+                self.assertEquals([('cfht', ['obs3'])], read_journal(replay_journal))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_store(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            store = DirectoryStore(tmp_dir)
+            store.add('cfht', 'a', b'<a/>')
+            store.add('cfht', 'b', b'<b/>')
+            self.assertTrue(os.path.isfile(os.path.join(tmp_dir, 'cfht', 'a.xml')))
+            self.assertTrue(store.remove('cfht', 'b'))
+            self.assertFalse(store.remove('cfht', 'b'))
+            # index rebuilt from the files
+            store = DirectoryStore(tmp_dir)
+            self.assertEquals(b'<a/>', store.get('cfht', 'a'))
+            self.assertIsNone(store.get('cfht', 'b'))
+            self.assertEquals(['a'], [row[0] for row in store.listing('cfht')])
+            self.assertEquals(1, store.count('cfht'))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_faults(self):
+        with RepoServer(seed=1) as server:
+            server.store.add('cfht', 'a', _to_xml(SimpleObservation('cfht', 'a')))
+            client = CAOM2RepoClient(host=server.host)
+
+            # transient errors are retried by the client
+            server.error_rate = 0.3
+            for i in range(10):
+                client.get_observation('cfht', 'a')
+            self.assertTrue(server.requests['ERROR'] > 0)
+
+            server.error_rate = 1
+            server.error_status = 500
+            with self.assertRaises(requests.HTTPError):
+                client.get_observation('cfht', 'a')
+            server.error_rate = 0
+
+            server.latency = 0.05
+            start = time.time()
+            client.get_observation('cfht', 'a')
+            self.assertTrue(time.time() - start >= 0.05)
+            server.latency = 0
+
+            server.store.add('cfht', 'big', b'x' * 20000)
+            server.bandwidth = 100000
+            start = time.time()
+            client._repo_client.get('/cfht/big')
+            self.assertTrue(time.time() - start >= 0.15)
+
+
+def _add_observations(store, count):
+    # dated in the past, like the observations of a collection visited later
+    date = datetime.utcnow() - timedelta(hours=1)
+    for i in range(count):
+        store.add('cfht', 'obs{}'.format(i), _to_xml(SimpleObservation('cfht', 'obs{}'.format(i))),
+                  last_modified=date + timedelta(seconds=i))
+
+
+def _to_xml(observation):
+    from StringIO import StringIO
+    from caom2.obs_reader_writer import ObservationWriter
+    buffer = StringIO()
+    ObservationWriter().write(observation, buffer)
+    return buffer.getvalue()
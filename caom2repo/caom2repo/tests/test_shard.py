@@ -0,0 +1,249 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from mock import MagicMock
+
+from caom2repo import shard
+from caom2repo.core import EQUAL_PARTITION
+from caom2repo.shard import ShardedVisit, HashShardFilter, LeaseLostError
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+PLUGIN = os.path.join(THIS_DIR, 'passplugin.py')
+
+
+class TestShardedVisit(unittest.TestCase):
+
+    """Test the ShardedVisit class"""
+
+    def setUp(self):
+        self.shard_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.shard_dir)
+
+    def test_hash_filter(self):
+        ids = ['obs{}'.format(i) for i in range(100)]
+        filters = [HashShardFilter(i, 3) for i in range(3)]
+        for observation_id in ids:
+            self.assertEquals(1, len([f for f in filters if f(observation_id)]))
+        self.assertTrue(len([i for i in ids if filters[0](i)]) > 0)
+
+    def test_hash_shards(self):
+        client = MagicMock()
+        client.visit.return_value = 3
+        visitor = ShardedVisit(client, self.shard_dir, worker_id='w1')
+        self.assertEquals(6, visitor.run(PLUGIN, 'cfht', shards=2, shard_by=shard.HASH_SHARDS))
+        self.assertEquals(2, client.visit.call_count)
+        indexes = set()
+        ends = set()
+        for call in client.visit.call_args_list:
+            self.assertEquals((PLUGIN, 'cfht'), call[0])
+            self.assertEquals(EQUAL_PARTITION, call[1]['partition'])
+            hash_filter = [f for f in call[1]['accept'].filters
+                           if isinstance(f, HashShardFilter)][0]
+            self.assertEquals(2, hash_filter.count)
+            indexes.add(hash_filter.index)
+            ends.add(call[1]['end'])
+        self.assertEquals(set([0, 1]), indexes)
+        # the end of the visit is fixed when the plan is created
+        self.assertEquals(1, len(ends))
+        self.assertIsNotNone(ends.pop())
+        self.assertEquals(['plan.json', 'shard-0000.done', 'shard-0001.done'],
+                          sorted(os.listdir(self.shard_dir)))
+
+        # restarting a completed visit does not visit anything
+        client.visit.reset_mock()
+        visitor = ShardedVisit(client, self.shard_dir, worker_id='w2')
+        self.assertEquals(0, visitor.run(PLUGIN, 'cfht', shard_by=shard.HASH_SHARDS))
+        client.visit.assert_not_called()
+
+        # the directory belongs to a different visit
+        with self.assertRaises(ValueError):
+            visitor.run(PLUGIN, 'other', shard_by=shard.HASH_SHARDS)
+
+    def test_time_shards(self):
+        start = datetime(2000, 1, 1)
+        middle = datetime(2000, 1, 2)
+        end = datetime(2000, 1, 3)
+        client = MagicMock()
+        client.visit.return_value = 1
+        client._partition.return_value = [(start, middle), (middle, end)]
+
+        visitor = ShardedVisit(client, self.shard_dir, worker_id='w1')
+        # number of shards required to create the plan
+        with self.assertRaises(ValueError):
+            visitor.run(PLUGIN, 'cfht', start, end)
+
+        # a shard completed by a previous run is not visited again
+        open(os.path.join(self.shard_dir, 'shard-0000.done'), 'w').close()
+        self.assertEquals(1, visitor.run(PLUGIN, 'cfht', start, end, shards=2, processes=2,
+                                         partition='adaptive'))
+        client._partition.assert_called_once_with('cfht', start, end, 2, 'adaptive')
+        self.assertEquals(1, client.visit.call_count)
+        args, kwargs = client.visit.call_args
+        self.assertEquals((PLUGIN, 'cfht'), args)
+        self.assertEquals((middle, end, 2, 'adaptive'), (kwargs['start'], kwargs['end'],
+                                                         kwargs['processes'],
+                                                         kwargs['partition']))
+
+    def test_default_partition(self):
+        end = datetime(2000, 1, 3)
+        client = MagicMock()
+        client.visit.return_value = 1
+        client._partition.return_value = [(None, end)]
+        visitor = ShardedVisit(client, self.shard_dir, worker_id='w1')
+        self.assertEquals(1, visitor.run(PLUGIN, 'cfht', shards=1))
+        # the end of the visit is fixed in the plan
+        (collection, start, plan_end, n, partition), _ = client._partition.call_args
+        self.assertIsNone(start)
+        self.assertIsNotNone(plan_end)
+        self.assertEquals(EQUAL_PARTITION, partition)
+        self.assertEquals(EQUAL_PARTITION, client.visit.call_args[1]['partition'])
+
+    def test_leases(self):
+        visitor1 = ShardedVisit(MagicMock(), self.shard_dir, lease_ttl=10, worker_id='w1')
+        visitor2 = ShardedVisit(MagicMock(), self.shard_dir, lease_ttl=10, worker_id='w2')
+        self.assertEquals(0, visitor1._claim('shard-0000'))
+        self.assertIsNone(visitor2._claim('shard-0000'))
+        self.assertEquals(0, visitor2._claim('shard-0001'))
+
+        # lease of a dead worker expires
+        generation, path, age = visitor1._get_lease('shard-0000')
+        old = time.time() - 20
+        os.utime(path, (old, old))
+        self.assertEquals(1, visitor2._claim('shard-0000'))
+        self.assertIsNone(visitor1._claim('shard-0000'))
+
+        # the keeper of the previous lease notices it has been lost
+        keeper = shard._LeaseKeeper(visitor1, 'shard-0000', 0, 0.01)
+        keeper.start()
+        self.assertTrue(keeper.lost.wait(5))
+        keeper.stop()
+
+        # releasing an expired lease keeps the lease of the worker that took over
+        visitor1._release('shard-0000', 0)
+        self.assertEquals(1, visitor2._get_lease('shard-0000')[0])
+        self.assertIsNone(visitor1._claim('shard-0000'))
+        visitor2._release('shard-0000', 1)
+        self.assertIsNone(visitor2._get_lease('shard-0000'))
+        self.assertEquals(0, visitor1._claim('shard-0000'))
+
+    def test_lost_lease(self):
+        visitor1 = ShardedVisit(MagicMock(), self.shard_dir, lease_ttl=3, worker_id='w1')
+        visitor2 = ShardedVisit(MagicMock(), self.shard_dir, lease_ttl=3, worker_id='w2')
+        self.assertEquals(0, visitor1._claim('shard-0000'))
+        lease_filter = shard._LeaseFilter(self.shard_dir, 'shard-0000', 0, 0)
+        self.assertTrue(lease_filter('obs1'))
+
+        generation, path, age = visitor1._get_lease('shard-0000')
+        old = time.time() - 20
+        os.utime(path, (old, old))
+        self.assertEquals(1, visitor2._claim('shard-0000'))
+        with self.assertRaises(LeaseLostError):
+            lease_filter('obs1')
+
+        # the visit of a shard taken over by another worker stops without completing it
+        def visit(plugin, collection, accept=None, **kwargs):
+            accept('obs1', None)
+            return 1
+        visitor1.client.visit.side_effect = visit
+        plan = {'collection': 'cfht', 'start': None, 'end': None,
+                'shard_by': shard.HASH_SHARDS, 'shards': [{'index': 0, 'name': 'shard-0000'}]}
+        self.assertEquals(0, visitor1._visit_shard(PLUGIN, plan, plan['shards'][0], 0,
+                                                   {'partition': EQUAL_PARTITION}))
+        self.assertFalse(visitor1._is_done('shard-0000'))
+        self.assertEquals(1, visitor1._get_lease('shard-0000')[0])
+
+    def test_failure(self):
+        client = MagicMock()
+        client.visit.side_effect = RuntimeError('boom')
+        visitor = ShardedVisit(client, self.shard_dir, worker_id='w1')
+        with self.assertRaises(RuntimeError):
+            visitor.run(PLUGIN, 'cfht', shards=1, shard_by=shard.HASH_SHARDS)
+        # the lease is released so the shard can be retried right away
+        self.assertIsNone(visitor._get_lease('shard-0000'))
+        self.assertFalse(visitor._is_done('shard-0000'))
+
+    def test_analysis_plugin(self):
+        client = MagicMock()
+        visitor = ShardedVisit(client, self.shard_dir)
+        # the results of the shards cannot be combined
+        with self.assertRaises(Exception) as context:
+            visitor.run(os.path.join(THIS_DIR, 'mapreduceplugin.py'), 'cfht', shards=2)
+        self.assertTrue('Map and reduce plugins' in str(context.exception))
+        self.assertFalse(client.visit.called)
@@ -0,0 +1,190 @@
+# # -*- coding: utf-8 -*-
+# ***********************************************************************
+# ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
+# *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
+#                                                                                                                                                          
+#  (c) 2016.                            (c) 2016.                                                                                                          
+#  Government of Canada                 Gouvernement du Canada                                                                                             
+#  National Research Council            Conseil national de recherches                                                                                     
+#  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6                                                                                            
+#  All rights reserved                  Tous droits réservés                                                                                               
+#                                                                                                                                                          
+#  NRC disclaims any warranties,        Le CNRC dénie toute garantie                                                                                       
+#  expressed, implied, or               énoncée, implicite ou légale,                                                                                      
+#  statutory, of any kind with          de quelque nature que ce                                                                                           
+#  respect to the software,             soit, concernant le logiciel,                                                                                      
+#  including without limitation         y compris sans restriction                                                                                         
+#  any warranty of merchantability      toute garantie de valeur                                                                                           
+#  or fitness for a particular          marchande ou de pertinence                                                                                         
+#  purpose. NRC shall not be            pour un usage particulier.                                                                                         
+#  liable in any event for any          Le CNRC ne pourra en aucun cas                                                                                     
+#  damages, whether direct or           être tenu responsable de tout                                                                                      
+#  indirect, special or general,        dommage, direct ou indirect,                                                                                       
+#  consequential or incidental,         particulier ou général,                                                                                            
+#  arising from the use of the          accessoire ou fortuit, résultant                                                                                   
+#  software.  Neither the name          de l'utilisation du logiciel. Ni                                                                                   
+#  of the National Research             le nom du Conseil National de                                                                                      
+#  Council of Canada nor the            Recherches du Canada ni les noms                                                                                   
+#  names of its contributors may        de ses  participants ne peuvent                                                                                    
+#  be used to endorse or promote        être utilisés pour approuver ou                                                                                    
+#  products derived from this           promouvoir les produits dérivés                                                                                    
+#  software without specific prior      de ce logiciel sans autorisation                                                                                   
+#  written permission.                  préalable et particulière                                                                                          
+#                                       par écrit.                                                                                                         
+#                                                                                                                                                          
+#  This file is part of the             Ce fichier fait partie du projet                                                                                   
+#  OpenCADC project.                    OpenCADC.                                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is free software:           OpenCADC est un logiciel libre ;                                                                                   
+#  you can redistribute it and/or       vous pouvez le redistribuer ou le                                                                                  
+#  modify it under the terms of         modifier suivant les termes de                                                                                     
+#  the GNU Affero General Public        la “GNU Affero General Public                                                                                      
+#  License as published by the          License” telle que publiée                                                                                         
+#  Free Software Foundation,            par la Free Software Foundation                                                                                    
+#  either version 3 of the              : soit la version 3 de cette                                                                                       
+#  License, or (at your option)         licence, soit (à votre gré)                                                                                        
+#  any later version.                   toute version ultérieure.                                                                                          
+#                                                                                                                                                          
+#  OpenCADC is distributed in the       OpenCADC est distribué                                                                                             
+#  hope that it will be useful,         dans l’espoir qu’il vous                                                                                           
+#  but WITHOUT ANY WARRANTY;            sera utile, mais SANS AUCUNE                                                                                       
+#  without even the implied             GARANTIE : sans même la garantie                                                                                   
+#  warranty of MERCHANTABILITY          implicite de COMMERCIALISABILITÉ                                                                                   
+#  or FITNESS FOR A PARTICULAR          ni d’ADÉQUATION À UN OBJECTIF                                                                                      
+#  PURPOSE.  See the GNU Affero         PARTICULIER. Consultez la Licence                                                                                  
+#  General Public License for           Générale Publique GNU Affero
+#  more details.                        pour plus de détails.
+#                                       
+#  You should have received             Vous devriez avoir reçu une
+#  a copy of the GNU Affero             copie de la Licence Générale
+#  General Public License along         Publique GNU Affero avec
+#  with OpenCADC.  If not, see          OpenCADC ; si ce n’est
+#  <http://www.gnu.org/licenses/>.      pas le cas, consultez :
+#                                       <http://www.gnu.org/licenses/>.
+#
+#  $Revision: 4 $
+#
+# ***********************************************************************
+#
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from mock import patch
+
+from caom2repo.core import CAOM2RepoClient
+from caom2repo.sync import CollectionMirror
+from caom2repo.tests.repo_server import RepoServer
+
+
+class TestCollectionMirror(unittest.TestCase):
+
+    """Test the CollectionMirror class"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # dated in the past, like the observations of a collection synced later
+        self.date = (datetime.utcnow() - timedelta(hours=1)).replace(microsecond=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _add(self, store, observation_id, seconds):
+        store.add('cfht', observation_id, '<{}/>'.format(observation_id).encode('utf-8'),
+                  last_modified=self.date + timedelta(seconds=seconds))
+
+    def _files(self):
+        return sorted(os.listdir(os.path.join(self.tmp_dir, 'cfht')))
+
+    def test_sync(self):
+        with RepoServer() as server:
+            for i in range(25):
+                # observations modified at the same time across pages
+                self._add(server.store, 'obs{:02d}'.format(i), i // 3)
+            client = CAOM2RepoClient(host=server.host)
+            mirror = CollectionMirror(client, self.tmp_dir, threads=4, page_size=10)
+            self.assertEquals((25, 0), mirror.sync('cfht'))
+            self.assertEquals(['.watermark'] + ['obs{:02d}.xml'.format(i) for i in range(25)],
+                              self._files())
+            with open(os.path.join(self.tmp_dir, 'cfht', 'obs07.xml'), 'rb') as f:
+                self.assertEquals(b'<obs07/>', f.read())
+            self.assertEquals((self.date + timedelta(seconds=8), set(['obs24'])),
+                              mirror.get_watermark('cfht'))
+
+            # nothing changed
+            server.requests.clear()
+            self.assertEquals((0, 0), mirror.sync('cfht'))
+            self.assertEquals(1, server.requests['GET'])
+
+            # only the changes are copied
+            self._add(server.store, 'obs25', 8)
+            self._add(server.store, 'obs03', 20)
+            self._add(server.store, 'new', 21)
+            server.store.remove('cfht', 'obs05')
+            self.assertEquals((3, 0), mirror.sync('cfht'))
+            # deletions are only found by pruning
+            self.assertTrue('obs05.xml' in self._files())
+            self.assertEquals((self.date + timedelta(seconds=21), set(['new'])),
+                              mirror.get_watermark('cfht'))
+
+            self.assertEquals((26, 0), mirror.sync('cfht', full=True))
+
+    def test_prune(self):
+        with RepoServer() as server:
+            for i in range(5):
+                self._add(server.store, 'obs{}'.format(i), i)
+            client = CAOM2RepoClient(host=server.host)
+            mirror = CollectionMirror(client, self.tmp_dir)
+            self.assertEquals((5, 0), mirror.sync('cfht'))
+            server.store.remove('cfht', 'obs1')
+            server.store.remove('cfht', 'obs3')
+            self.assertEquals((0, 2), mirror.sync('cfht', prune=True))
+            self.assertEquals(['.watermark', 'obs0.xml', 'obs2.xml', 'obs4.xml'], self._files())
+
+    def test_listing(self):
+        with RepoServer() as server:
+            for i in range(6):
+                self._add(server.store, 'obs{}'.format(i), i)
+            client = CAOM2RepoClient(host=server.host)
+            listing = list(client.list_observations('cfht'))
+            server.store.remove('cfht', 'obs0')
+            mirror = CollectionMirror(client, self.tmp_dir, page_size=2)
+            with patch.object(client, '_get_listing') as listing_mock:
+                # obs0 is listed but was deleted in the meantime
+                with self.assertRaises(Exception):
+                    mirror.sync('cfht', listing=listing)
+                self.assertEquals((5, 0), mirror.sync('cfht', listing=listing[1:]))
+                self.assertEquals(5, len(self._files()) - 1)
+                self.assertEquals((self.date + timedelta(seconds=5), set(['obs5'])),
+                                  mirror.get_watermark('cfht'))
+                self.assertEquals((0, 2), mirror.sync('cfht', prune=True, listing=listing[2:5]))
+                self.assertFalse(listing_mock.called)
+            self.assertEquals(['.watermark', 'obs2.xml', 'obs3.xml', 'obs4.xml'], self._files())
+
+    def test_failures(self):
+        with RepoServer() as server:
+            for i in range(6):
+                self._add(server.store, 'obs{}'.format(i), i)
+            client = CAOM2RepoClient(host=server.host)
+            mirror = CollectionMirror(client, self.tmp_dir, threads=2)
+            get_observation_xml = client.get_observation_xml
+
+            def failing_get(collection, observation_id):
+                if observation_id == 'obs3':
+                    raise IOError('unavailable')
+                return get_observation_xml(collection, observation_id)
+
+            with patch.object(client, 'get_observation_xml', side_effect=failing_get):
+                with self.assertRaises(Exception):
+                    mirror.sync('cfht')
+            # the watermark stops before the failed observation
+            self.assertEquals((self.date + timedelta(seconds=2), set(['obs2'])),
+                              mirror.get_watermark('cfht'))
+            self.assertEquals((3, 0), mirror.sync('cfht'))
+            self.assertEquals((self.date + timedelta(seconds=5), set(['obs5'])),
+                              mirror.get_watermark('cfht'))